@@ -1,5 +1,56 @@
-from django.contrib import admin
-from .models import Ingredient, Recipe, RecipeIngredient
+from decimal import Decimal
+
+from django import forms
+from django.contrib import admin, messages
+from django.contrib.admin.views.main import ChangeList
+from django.contrib.admin.widgets import AutocompleteSelect
+from .models import Ingredient, IngredientPrice, Recipe, RecipeComponent, RecipeIngredient, StockMovement
+from .stock import apply_stock_changes
+
+
+class AutocompleteFilter(admin.RelatedFieldListFilter):
+    """
+    Filter on a foreign key that picks its value with the admin autocomplete.
+    
+    The related rows are searched on demand instead of being listed, so the
+    filter costs no query (one when a value is selected) however many rows
+    the related model has. The related model's admin needs ``search_fields``
+    and the model admin using it must include ``AutocompleteFilterMixin``.
+    """
+    
+    template = 'admin/kitchen/autocomplete_filter.html'
+    
+    def __init__(self, field, request, params, model, model_admin, field_path):
+        self.admin_site = model_admin.admin_site
+        super().__init__(field, request, params, model, model_admin, field_path)
+    
+    def field_choices(self, field, request, model_admin):
+        return []
+    
+    def has_output(self):
+        return True
+    
+    def widget(self):
+        """The autocomplete select, showing the selected row if any."""
+        choice_field = forms.ModelChoiceField(
+            queryset=self.field.remote_field.model._default_manager.all(),
+            widget=AutocompleteSelect(self.field, self.admin_site, attrs={'style': 'width: 100%'}),
+            required=False,
+        )
+        return choice_field.widget.render(self.lookup_kwarg, self.lookup_val)
+
+
+class AutocompleteFilterMixin:
+    """Load the scripts of the ``AutocompleteFilter`` list filters on the changelist."""
+    
+    @property
+    def media(self):
+        # The widget's scripts don't depend on the field it is built for
+        return (
+            super().media
+            + AutocompleteSelect(None, self.admin_site).media
+            + forms.Media(js=['kitchen/js/autocomplete-filter.js'])
+        )
 
 
 @admin.register(Ingredient)
@@ -13,7 +64,7 @@ class IngredientAdmin(admin.ModelAdmin):
     
     fieldsets = (
         ('Información Básica', {
-            'fields': ('name', 'unit')
+            'fields': ('name', 'unit', 'density')
         }),
         ('Costos e Inventario', {
             'fields': ('cost_per_unit', 'current_stock')
@@ -21,6 +72,24 @@ class IngredientAdmin(admin.ModelAdmin):
     )
     
     readonly_fields = ['created_at', 'updated_at']
+    
+    def save_model(self, request, obj, form, change):
+        """Save the ingredient, recording stock edits in the stock ledger."""
+        current_stock = obj.current_stock
+        if change:
+            # Never write the balance directly: a concurrent movement could be lost
+            obj.save(update_fields=[*(field for field in form.changed_data if field != 'current_stock'), 'updated_at'])
+        else:
+            obj.current_stock = Decimal('0')
+            obj.save()
+        stock_changed = 'current_stock' in form.changed_data if change else bool(current_stock)
+        if stock_changed:
+            errors = apply_stock_changes([
+                {'id': obj.pk, 'current_stock': current_stock, 'note': "Ajuste desde el admin"}
+            ])
+            if errors:
+                self.message_user(request, f"Stock no actualizado: {errors[0]['error']}", messages.ERROR)
+            obj.refresh_from_db(fields=['current_stock'])
 
 
 class RecipeIngredientInline(admin.TabularInline):
@@ -30,9 +99,12 @@ class RecipeIngredientInline(admin.TabularInline):
     extra = 1
     autocomplete_fields = ['ingredient']
     
-    fields = ['ingredient', 'quantity', 'total_cost', 'is_sufficient']
+    fields = ['ingredient', 'quantity', 'unit', 'total_cost', 'is_sufficient']
     readonly_fields = ['total_cost', 'is_sufficient']
     
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('ingredient')
+    
     def total_cost(self, obj):
         """Display the total cost of the ingredient in the recipe."""
         if obj.id:
@@ -49,6 +121,43 @@ class RecipeIngredientInline(admin.TabularInline):
     is_sufficient.boolean = True
 
 
+class RecipeComponentInline(admin.TabularInline):
+    """Inline admin for the preparations used within a recipe."""
+    
+    model = RecipeComponent
+    fk_name = 'parent'
+    extra = 0
+    autocomplete_fields = ['component']
+    
+    fields = ['component', 'portions', 'total_cost']
+    readonly_fields = ['total_cost']
+    
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('component')
+    
+    def total_cost(self, obj):
+        """Display the cost of the portions of the preparation."""
+        if obj.id:
+            return f"${obj.total_cost:.2f}"
+        return "-"
+    total_cost.short_description = "Costo Total"
+
+
+class RecipeChangeList(ChangeList):
+    """Recipe changelist computing the producible portions of the rows on the page only."""
+    
+    def get_results(self, request):
+        super().get_results(request)
+        # Evaluate the page once, then one stock aggregate for all of its recipes
+        recipes = list(self.result_list)
+        portions = dict(
+            Recipe.objects.filter(pk__in=[recipe.pk for recipe in recipes]).with_producible()
+            .values_list('pk', 'computed_producible_portions')
+        )
+        for recipe in recipes:
+            recipe.computed_producible_portions = portions[recipe.pk]
+
+
 @admin.register(Recipe)
 class RecipeAdmin(admin.ModelAdmin):
     """Admin interface for Recipe model with inline RecipeIngredients."""
@@ -58,7 +167,7 @@ class RecipeAdmin(admin.ModelAdmin):
     search_fields = ['name', 'description']
     ordering = ['name']
     
-    inlines = [RecipeIngredientInline]
+    inlines = [RecipeIngredientInline, RecipeComponentInline]
     
     fieldsets = (
         ('Información de la Receta', {
@@ -75,6 +184,9 @@ class RecipeAdmin(admin.ModelAdmin):
     
     readonly_fields = ['batch_cost', 'cost_per_portion', 'producible_portions', 'created_at', 'updated_at']
     
+    def get_changelist(self, request, **kwargs):
+        return RecipeChangeList
+    
     def batch_cost(self, obj):
         """Display the batch cost."""
         return f"${obj.batch_cost:.2f}"
@@ -93,20 +205,23 @@ class RecipeAdmin(admin.ModelAdmin):
 
 
 @admin.register(RecipeIngredient)
-class RecipeIngredientAdmin(admin.ModelAdmin):
+class RecipeIngredientAdmin(AutocompleteFilterMixin, admin.ModelAdmin):
     """Admin interface for RecipeIngredient model."""
     
-    list_display = ['recipe', 'ingredient', 'quantity', 'ingredient_unit', 'total_cost', 'is_sufficient']
-    list_filter = ['recipe', 'ingredient__unit']
+    list_display = ['recipe', 'ingredient', 'quantity', 'unit', 'ingredient_unit', 'total_cost', 'is_sufficient']
+    list_filter = [('recipe', AutocompleteFilter), ('ingredient', AutocompleteFilter), 'ingredient__unit']
+    list_select_related = ['recipe', 'ingredient']
+    show_full_result_count = False
     search_fields = ['recipe__name', 'ingredient__name']
-    ordering = ['recipe__name', 'ingredient__name']
+    # Grouped by recipe along the (recipe, ingredient) index; sorting 500k lines by names takes seconds
+    ordering = ['recipe_id', 'ingredient__name']
     
     autocomplete_fields = ['recipe', 'ingredient']
     
     def ingredient_unit(self, obj):
         """Display the ingredient unit."""
         return obj.ingredient.get_unit_display()
-    ingredient_unit.short_description = "Unidad"
+    ingredient_unit.short_description = "Unidad del ingrediente"
     
     def total_cost(self, obj):
         """Display the total cost."""
@@ -123,4 +238,44 @@ class RecipeIngredientAdmin(admin.ModelAdmin):
 # Customize admin site headers
 admin.site.site_header = "Gestión de Cocina"
 admin.site.site_title = "Kitchen Management"
-admin.site.index_title = "Panel de Administración"
\ No newline at end of file
+admin.site.index_title = "Panel de Administración"
+
+@admin.register(StockMovement)
+class StockMovementAdmin(AutocompleteFilterMixin, admin.ModelAdmin):
+    """Read-only admin for the stock ledger; movements are recorded through the stock operations."""
+    
+    list_display = ['created_at', 'ingredient', 'kind', 'quantity', 'recipe', 'note']
+    # No date_hierarchy: its year links need a DISTINCT over the whole ledger
+    list_filter = [('ingredient', AutocompleteFilter), 'kind', 'created_at']
+    search_fields = ['ingredient__name', 'note']
+    list_select_related = ['ingredient', 'recipe']
+    show_full_result_count = False
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+    
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(IngredientPrice)
+class IngredientPriceAdmin(AutocompleteFilterMixin, admin.ModelAdmin):
+    """Read-only admin for the price history; prices are recorded when an ingredient's cost changes."""
+    
+    list_display = ['effective_at', 'ingredient', 'cost_per_unit']
+    list_filter = [('ingredient', AutocompleteFilter), 'effective_at']
+    search_fields = ['ingredient__name']
+    list_select_related = ['ingredient']
+    show_full_result_count = False
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+    
+    def has_delete_permission(self, request, obj=None):
+        return False
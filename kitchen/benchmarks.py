@@ -0,0 +1,257 @@
+"""Repeatable endpoint benchmarks with latency percentiles and SQL query budgets."""
+
+import time
+import uuid
+from collections import namedtuple
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils import timezone
+
+from .models import Ingredient, Recipe, RecipeIngredient, RecipeRequirement
+
+
+# ``path`` is formatted with the targets picked by ``pick_targets``; ``data``
+# builds the request body from them. ``query_budget`` is the most SQL queries
+# the endpoint may run, whatever the size of the catalog.
+Endpoint = namedtuple('Endpoint', 'name method path data query_budget statuses')
+Endpoint.__new__.__defaults__ = (None, 0, (200,))
+
+ENDPOINTS = [
+    # Recipes
+    Endpoint('recipe-list', 'get', '/api/recipes/', query_budget=6),
+    Endpoint('recipe-list-expanded', 'get', '/api/recipes/?expand=ingredients,components', query_budget=9),
+    Endpoint('recipe-list-delta', 'get', '/api/recipes/?updated_since=2000-01-01T00:00:00Z', query_budget=6),
+    Endpoint('recipe-batch', 'get', '/api/recipes/?ids={recipe_ids}&include=cost_breakdown', query_budget=7),
+    Endpoint('recipe-detail', 'get', '/api/recipes/{recipe}/', query_budget=6),
+    Endpoint('recipe-detail-breakdown', 'get', '/api/recipes/{recipe}/?include=cost_breakdown', query_budget=6),
+    Endpoint(
+        'recipe-create', 'post', '/api/recipes/',
+        lambda targets: {
+            'name': f"Benchmark {uuid.uuid4().hex[:12]}", 'yield_portions': 4,
+            'ingredients': [{'ingredient_id': targets['ingredient'], 'quantity': '0.5'}],
+        },
+        query_budget=16, statuses=(201,),
+    ),
+    Endpoint(
+        'recipe-update', 'patch', '/api/recipes/{recipe}/', lambda targets: {'yield_portions': 6}, query_budget=13,
+    ),
+    Endpoint('recipe-delete', 'delete', '/api/recipes/{recipe}/', query_budget=12, statuses=(204,)),
+    Endpoint('recipe-cost-breakdown', 'get', '/api/recipes/{recipe}/cost_breakdown/', query_budget=6),
+    Endpoint('recipe-cost-as-of', 'get', '/api/recipes/{recipe}/cost_as_of/?at={today}', query_budget=2),
+    Endpoint(
+        'recipe-scale', 'post', '/api/recipes/{recipe}/scale_recipe/', lambda targets: {'scale_factor': '2'},
+        query_budget=5,
+    ),
+    Endpoint(
+        'recipe-produce', 'post', '/api/recipes/{recipe}/produce/', lambda targets: {'batches': 1},
+        query_budget=7, statuses=(200, 409),
+    ),
+    Endpoint('recipe-producible', 'get', '/api/recipes/producible/', query_budget=9),
+    Endpoint(
+        'recipe-price-simulation', 'post', '/api/recipes/price_simulation/',
+        lambda targets: {'changes': [{'id': targets['ingredient'], 'percent': '10'}]},
+        query_budget=6,
+    ),
+    Endpoint(
+        'recipe-plan-production', 'post', '/api/recipes/plan_production/',
+        lambda targets: {'recipes': [{'id': targets['recipe']}], 'method': 'greedy'},
+        query_budget=4,
+    ),
+    Endpoint(
+        'recipe-shopping-list', 'post', '/api/recipes/shopping_list/',
+        lambda targets: {'items': [{'recipe_id': targets['recipe'], 'scale_factor': '2'}]},
+        query_budget=3,
+    ),
+    # Ingredients
+    Endpoint('ingredient-list', 'get', '/api/ingredients/', query_budget=4),
+    Endpoint('ingredient-detail', 'get', '/api/ingredients/{ingredient}/', query_budget=2),
+    Endpoint(
+        'ingredient-create', 'post', '/api/ingredients/',
+        lambda targets: {
+            'name': f"Benchmark {uuid.uuid4().hex[:12]}", 'unit': 'kg', 'cost_per_unit': '2.50', 'current_stock': '10',
+        },
+        query_budget=18, statuses=(201,),
+    ),
+    Endpoint(
+        'ingredient-update', 'patch', '/api/ingredients/{rare_ingredient}/',
+        lambda targets: {'cost_per_unit': '9.99'}, query_budget=14,
+    ),
+    Endpoint('ingredient-delete', 'delete', '/api/ingredients/{rare_ingredient}/', query_budget=13, statuses=(204,)),
+    Endpoint('ingredient-low-stock', 'get', '/api/ingredients/low_stock/', query_budget=3),
+    Endpoint(
+        'ingredient-update-stock', 'patch', '/api/ingredients/{ingredient}/update_stock/',
+        lambda targets: {'delta': '1', 'kind': 'receipt'}, query_budget=7,
+    ),
+    Endpoint(
+        'ingredient-bulk-update-stock', 'post', '/api/ingredients/bulk_update_stock/',
+        lambda targets: {'changes': [{'id': targets['ingredient'], 'delta': '1'}]}, query_budget=6,
+    ),
+    Endpoint('ingredient-movements', 'get', '/api/ingredients/{ingredient}/movements/', query_budget=2),
+    Endpoint('ingredient-where-used', 'get', '/api/ingredients/{ingredient}/where_used/', query_budget=2),
+    Endpoint('ingredient-price-history', 'get', '/api/ingredients/{ingredient}/price_history/', query_budget=3),
+    Endpoint('ingredient-stock-valuation', 'get', '/api/ingredients/stock_valuation/', query_budget=1),
+    Endpoint('ingredient-stock-valuation-at', 'get', '/api/ingredients/stock_valuation/?at={today}', query_budget=1),
+    # Recipe lines
+    Endpoint('recipeingredient-list', 'get', '/api/recipe-ingredients/', query_budget=2),
+    Endpoint('recipeingredient-list-recipe', 'get', '/api/recipe-ingredients/?recipe={recipe}', query_budget=3),
+    Endpoint('recipeingredient-detail', 'get', '/api/recipe-ingredients/{line}/', query_budget=1),
+    Endpoint(
+        'recipeingredient-create', 'post', '/api/recipe-ingredients/',
+        lambda targets: {'recipe': targets['recipe'], 'ingredient': targets['free_ingredient'], 'quantity': '1'},
+        query_budget=14, statuses=(201,),
+    ),
+    Endpoint(
+        'recipeingredient-update', 'patch', '/api/recipe-ingredients/{line}/',
+        lambda targets: {'quantity': '2'}, query_budget=12,
+    ),
+    Endpoint('recipeingredient-delete', 'delete', '/api/recipe-ingredients/{line}/', query_budget=12, statuses=(204,)),
+    # Pages
+    Endpoint('home', 'get', '/', query_budget=3),
+    Endpoint('admin-ingredient-changelist', 'get', '/admin/kitchen/ingredient/', query_budget=5),
+    Endpoint('admin-recipe-changelist', 'get', '/admin/kitchen/recipe/', query_budget=7),
+    Endpoint('admin-recipeingredient-changelist', 'get', '/admin/kitchen/recipeingredient/', query_budget=4),
+    Endpoint(
+        'admin-recipeingredient-changelist-recipe', 'get',
+        '/admin/kitchen/recipeingredient/?recipe__id__exact={recipe}',
+        query_budget=5,
+    ),
+    Endpoint('admin-stockmovement-changelist', 'get', '/admin/kitchen/stockmovement/', query_budget=4),
+    Endpoint(
+        'admin-stockmovement-changelist-ingredient', 'get',
+        '/admin/kitchen/stockmovement/?ingredient__id__exact={ingredient}',
+        query_budget=5,
+    ),
+    Endpoint('admin-ingredientprice-changelist', 'get', '/admin/kitchen/ingredientprice/', query_budget=4),
+]
+
+
+class BenchmarkError(ValueError):
+    """Raised when the database has no catalog to benchmark or a benchmark is unknown."""
+
+
+def pick_targets():
+    """
+    Representative rows for the parameterized endpoints.
+
+    The recipe is one using preparations when there are any, ``ingredient``
+    the most used ingredient and ``rare_ingredient`` the least used one.
+    """
+    recipe = (
+        Recipe.objects.filter(components__isnull=False).order_by('pk').values_list('pk', flat=True).first()
+        or Recipe.objects.filter(recipeingredient__isnull=False).order_by('pk').values_list('pk', flat=True).first()
+    )
+    if recipe is None:
+        raise BenchmarkError("No recipes with ingredients to benchmark; run generate_data first")
+    usage = RecipeRequirement.objects.values('ingredient').annotate(uses=Count('pk')).values_list('ingredient', flat=True)
+    in_recipe = RecipeIngredient.objects.filter(recipe=recipe).values('ingredient')
+    return {
+        'recipe': recipe,
+        'recipe_ids': ','.join(str(pk) for pk in Recipe.objects.order_by('pk').values_list('pk', flat=True)[:20]),
+        'ingredient': usage.order_by('-uses', 'ingredient').first(),
+        'rare_ingredient': usage.order_by('uses', 'ingredient').first(),
+        'free_ingredient': Ingredient.objects.exclude(pk__in=in_recipe).order_by('pk').values_list('pk', flat=True).first(),
+        'line': RecipeIngredient.objects.filter(recipe=recipe).order_by('pk').values_list('pk', flat=True).first(),
+        'today': timezone.localdate().isoformat(),
+    }
+
+
+def percentile(ordered, fraction):
+    # Nearest-rank percentile of an already sorted list
+    return ordered[min(len(ordered) - 1, max(0, int(round(fraction * len(ordered) + 0.5)) - 1))]
+
+
+def select_endpoints(names=()):
+    """Endpoints whose name contains any of ``names``; all of them when empty."""
+    selected = [endpoint for endpoint in ENDPOINTS if not names or any(name in endpoint.name for name in names)]
+    if not selected:
+        raise BenchmarkError(f"No benchmark matches: {', '.join(names)}")
+    return selected
+
+
+def run_benchmarks(endpoints=ENDPOINTS, iterations=20, warmup=2, log=None):
+    """
+    Request every endpoint ``warmup + iterations`` times and measure it.
+
+    Every request runs in a savepoint that is rolled back, and so does the
+    whole run, so write endpoints can be measured repeatedly against the same
+    data and nothing is left behind. Returns one result per endpoint with its
+    response status, most SQL queries per request and latency percentiles
+    in milliseconds.
+    """
+    log = log or (lambda name, result: None)
+    targets = pick_targets()
+    results = {}
+    with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']), transaction.atomic():
+        # The API and the pages are used anonymously; the admin needs a staff session
+        anonymous = Client()
+        staff = Client()
+        staff.force_login(
+            get_user_model().objects.create_superuser(f'benchmark-{uuid.uuid4().hex[:12]}', password=None)
+        )
+
+        for endpoint in endpoints:
+            path = endpoint.path.format(**targets)
+            client = staff if path.startswith('/admin/') else anonymous
+            timings = []
+            queries = 0
+            statuses = set()
+            for iteration in range(warmup + iterations):
+                body = {} if endpoint.data is None else {
+                    'data': endpoint.data(targets), 'content_type': 'application/json'
+                }
+                with transaction.atomic():
+                    with CaptureQueriesContext(connection) as captured:
+                        started = time.perf_counter()
+                        response = getattr(client, endpoint.method)(path, **body)
+                        elapsed = (time.perf_counter() - started) * 1000
+                    transaction.set_rollback(True)
+                statuses.add(response.status_code)
+                if iteration >= warmup:
+                    timings.append(elapsed)
+                    queries = max(queries, len(captured))
+
+            timings.sort()
+            results[endpoint.name] = {
+                'method': endpoint.method.upper(),
+                'path': path,
+                'statuses': sorted(statuses),
+                'queries': queries,
+                'query_budget': endpoint.query_budget,
+                'iterations': iterations,
+                'mean_ms': round(sum(timings) / len(timings), 2),
+                'p50_ms': round(percentile(timings, 0.50), 2),
+                'p95_ms': round(percentile(timings, 0.95), 2),
+                'p99_ms': round(percentile(timings, 0.99), 2),
+            }
+            log(endpoint.name, results[endpoint.name])
+        transaction.set_rollback(True)
+    return results
+
+
+def check_results(results, baseline=None, stat='p50_ms', threshold=0.25, min_delta_ms=5.0):
+    """
+    Failures of a benchmark run, as messages.
+
+    An endpoint fails when it answers an unexpected status, runs more queries
+    than its budget, or, against a ``baseline`` run, gets slower by more than
+    ``threshold`` (a fraction) and ``min_delta_ms`` on the ``stat`` latency.
+    """
+    expected = {endpoint.name: endpoint.statuses for endpoint in ENDPOINTS}
+    failures = []
+    for name, result in results.items():
+        unexpected = [status for status in result['statuses'] if status not in expected.get(name, (200,))]
+        if unexpected:
+            failures.append(f"{name}: unexpected status {', '.join(str(status) for status in unexpected)}")
+        if result['queries'] > result['query_budget']:
+            failures.append(f"{name}: {result['queries']} queries, budget {result['query_budget']}")
+        previous = (baseline or {}).get(name)
+        if previous and stat in previous:
+            slower = result[stat] - previous[stat]
+            if slower > min_delta_ms and result[stat] > previous[stat] * (1 + threshold):
+                failures.append(f"{name}: {stat} {result[stat]} ms, baseline {previous[stat]} ms")
+    return failures
@@ -0,0 +1,409 @@
+"""Streaming import and export of the ingredient and recipe catalog."""
+
+import csv
+import json
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+
+from django.db import connection, transaction
+
+from .costs import deferred_cost_refresh, refresh_recipe_costs, refresh_recipe_requirements
+from .models import Ingredient, Recipe, RecipeIngredient, RecipeRequirement
+from .prices import record_price_changes
+from .stock import apply_stock_changes
+from .units import UnitConversionError, can_convert
+
+
+FORMATS = ('csv', 'jsonl')
+
+# Columns of each catalog kind, in export order
+KINDS = {
+    'ingredients': ['name', 'unit', 'cost_per_unit', 'current_stock', 'density'],
+    'recipes': ['name', 'description', 'yield_portions', 'preparation_time'],
+    'recipe_ingredients': ['recipe', 'ingredient', 'quantity', 'unit'],
+}
+
+EXPORT_CHUNK_SIZE = 2000
+IMPORT_BATCH_SIZE = 1000
+
+# Cap on the number of row errors kept in an import result
+MAX_REPORTED_ERRORS = 100
+
+
+class CatalogError(ValueError):
+    """Raised for an unknown catalog kind or format."""
+
+
+class _RollBack(Exception):
+    """Raised inside the import transaction to discard the whole import."""
+
+
+def check_kind_and_format(kind, fmt):
+    if kind not in KINDS:
+        raise CatalogError(f"Unknown kind '{kind}'. Choose one of: {', '.join(KINDS)}")
+    if fmt not in FORMATS:
+        raise CatalogError(f"Unknown format '{fmt}'. Choose one of: {', '.join(FORMATS)}")
+
+
+def content_type_for(fmt):
+    return 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+
+
+# Export
+
+def _export_queryset(kind):
+    if kind == 'ingredients':
+        return Ingredient.objects.order_by('pk').values_list(*KINDS[kind])
+    if kind == 'recipes':
+        return Recipe.objects.order_by('pk').values_list(*KINDS[kind])
+    return RecipeIngredient.objects.order_by('pk').values_list('recipe__name', 'ingredient__name', 'quantity', 'unit')
+
+
+class _Echo:
+    """File-like object whose write() returns the value, for streaming csv.writer output."""
+
+    def write(self, value):
+        return value
+
+
+def export_lines(kind, fmt):
+    """
+    Yield the catalog rows of ``kind`` as lines of CSV or JSON Lines.
+
+    Rows are read with a server-side cursor in chunks of ``EXPORT_CHUNK_SIZE``,
+    so memory use stays flat regardless of the catalog size.
+    """
+    check_kind_and_format(kind, fmt)
+    columns = KINDS[kind]
+    rows = _export_queryset(kind).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+
+    if fmt == 'csv':
+        writer = csv.writer(_Echo())
+        yield writer.writerow(columns)
+        for row in rows:
+            yield writer.writerow(['' if value is None else value for value in row])
+    else:
+        for row in rows:
+            yield json.dumps(
+                {column: str(value) if isinstance(value, Decimal) else value for column, value in zip(columns, row)},
+                ensure_ascii=False
+            ) + '\n'
+
+
+# Import
+
+def read_rows(lines, fmt):
+    """Parse an iterable of text lines into ``(line_number, dict)`` pairs."""
+    if fmt == 'csv':
+        reader = csv.DictReader(lines)
+        for row in reader:
+            yield reader.line_num, row
+        return
+
+    for line_number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            row = None
+        if not isinstance(row, dict):
+            yield line_number, ValueError('Invalid JSON object')
+        else:
+            yield line_number, row
+
+
+def _text(row, column, required=True, max_length=None):
+    value = row.get(column)
+    value = '' if value is None else str(value).strip()
+    if required and not value:
+        raise ValueError(f"'{column}' is required")
+    if max_length is not None and len(value) > max_length:
+        raise ValueError(f"'{column}' is longer than {max_length} characters")
+    return value
+
+
+def _decimal(row, column, default=None, max_digits=10, decimal_places=2, required=True, positive=False):
+    value = _text(row, column, required=required and default is None)
+    if not value:
+        return default
+    try:
+        number = Decimal(value)
+    except InvalidOperation:
+        raise ValueError(f"'{column}' must be a number")
+    if not number.is_finite() or number < 0 or number >= Decimal(10) ** (max_digits - decimal_places):
+        raise ValueError(f"'{column}' is out of range")
+    if positive and number.quantize(Decimal(1).scaleb(-decimal_places)) <= 0:
+        raise ValueError(f"'{column}' must be positive")
+    return number.quantize(Decimal(1).scaleb(-decimal_places))
+
+
+def _integer(row, column, required=True):
+    value = _text(row, column, required=required)
+    if not value:
+        return None
+    try:
+        number = int(value)
+    except ValueError:
+        raise ValueError(f"'{column}' must be an integer")
+    if number < 0:
+        raise ValueError(f"'{column}' cannot be negative")
+    return number
+
+
+UNITS = {code for code, _label in Ingredient.UNIT_CHOICES}
+
+
+def _unit(row, column, required=True):
+    unit = _text(row, column, required=required)
+    if unit and unit not in UNITS:
+        raise ValueError(f"Unknown unit '{unit}'")
+    return unit
+
+
+def _parse_ingredient(row):
+    return {
+        'name': _text(row, 'name', max_length=100),
+        'unit': _unit(row, 'unit'),
+        'cost_per_unit': _decimal(row, 'cost_per_unit'),
+        'current_stock': _decimal(row, 'current_stock', default=Decimal('0')),
+        'density': _decimal(row, 'density', max_digits=8, decimal_places=4, required=False, positive=True),
+    }
+
+
+def _parse_recipe(row):
+    return {
+        'name': _text(row, 'name', max_length=200),
+        'description': _text(row, 'description', required=False),
+        'yield_portions': _integer(row, 'yield_portions'),
+        'preparation_time': _integer(row, 'preparation_time', required=False),
+    }
+
+
+def _parse_recipe_ingredient(row):
+    return {
+        'recipe': _text(row, 'recipe'),
+        'ingredient': _text(row, 'ingredient'),
+        'quantity': _decimal(row, 'quantity', decimal_places=3),
+        'unit': _unit(row, 'unit', required=False),
+    }
+
+
+PARSERS = {
+    'ingredients': _parse_ingredient,
+    'recipes': _parse_recipe,
+    'recipe_ingredients': _parse_recipe_ingredient,
+}
+
+
+def _upsert(model, objs, unique_fields, update_fields):
+    """Insert ``objs`` in one statement, updating the rows that already exist."""
+    options = {'update_conflicts': True, 'update_fields': update_fields}
+    # MySQL's ON DUPLICATE KEY UPDATE can't name the conflict target
+    if connection.features.supports_update_conflicts_with_target:
+        options['unique_fields'] = unique_fields
+    model.objects.bulk_create(objs, **options)
+
+
+def _import_ingredients(rows):
+    by_name = {row['name']: (line_number, row) for line_number, row in rows}
+    existing = {
+        name: (pk, unit, density, cost)
+        for pk, name, unit, density, cost in Ingredient.objects.filter(name__in=by_name).values_list(
+            'pk', 'name', 'unit', 'density', 'cost_per_unit'
+        )
+    }
+
+    # A new unit or density must still convert the unit of every recipe line
+    converted = {
+        name: pk for name, (pk, unit, density, _cost) in existing.items()
+        if (unit, density) != (by_name[name][1]['unit'], by_name[name][1]['density'])
+    }
+    line_units = {}
+    for ingredient_id, unit in RecipeIngredient.objects.filter(
+        ingredient_id__in=converted.values()
+    ).order_by().values_list('ingredient_id', 'unit').distinct():
+        line_units.setdefault(ingredient_id, set()).add(unit)
+    errors = []
+    for name, pk in list(converted.items()):
+        row = by_name[name][1]
+        invalid = sorted(unit for unit in line_units.get(pk, ()) if not can_convert(unit, row['unit'], row['density']))
+        if invalid:
+            line_number, _row = by_name.pop(name)
+            del converted[name]
+            errors.append((
+                line_number,
+                f"Recipes use '{name}' in {', '.join(invalid)}, which can't be converted to {row['unit']}"
+            ))
+
+    # Stock goes through the ledger: new rows start empty and are adjusted below
+    _upsert(
+        Ingredient,
+        [Ingredient(**{**row, 'current_stock': Decimal('0')}) for _line_number, row in by_name.values()],
+        unique_fields=['name'],
+        update_fields=['unit', 'cost_per_unit', 'density', 'updated_at'],
+    )
+    ids = dict(Ingredient.objects.filter(name__in=by_name).values_list('name', 'pk'))
+    names = list(by_name)
+    stock_errors = apply_stock_changes([
+        {'id': ids[name], 'current_stock': by_name[name][1]['current_stock'], 'note': "Importación de catálogo"}
+        for name in names
+    ])
+    if stock_errors:
+        # No stock change of the batch was applied, so the batch is incomplete
+        errors.extend((by_name[names[error['index']]][0], error['error']) for error in stock_errors)
+        return 0, 0, errors, True
+    record_price_changes([
+        (ids[name], existing[name][3] if name in existing else None, row['cost_per_unit'])
+        for name, (_line_number, row) in by_name.items()
+    ])
+    for ingredient in Ingredient.objects.filter(pk__in=converted.values()).only('unit', 'density'):
+        ingredient.refresh_base_quantities()
+    refresh_recipe_requirements(
+        RecipeIngredient.objects.filter(ingredient_id__in=converted.values()).values_list('recipe_id', flat=True)
+    )
+    # Prices may have changed: re-cost the recipes using these ingredients
+    refresh_recipe_costs(
+        RecipeRequirement.objects.filter(ingredient__name__in=by_name).values_list('recipe_id', flat=True)
+    )
+    updated = sum(1 for name in by_name if name in existing)
+    return len(by_name) - updated, updated, errors, False
+
+
+def _import_recipes(rows):
+    rows = [row for _line_number, row in rows]
+    names = [row['name'] for row in rows]
+    existing = set(Recipe.objects.filter(name__in=names).values_list('name', flat=True))
+    _upsert(
+        Recipe,
+        [Recipe(**row) for row in rows],
+        unique_fields=['name'],
+        update_fields=['description', 'yield_portions', 'preparation_time', 'updated_at'],
+    )
+    # The yield may have changed, which changes the cost per portion and the
+    # requirements of the recipes using them as preparations
+    refresh_recipe_requirements(Recipe.objects.filter(name__in=existing).values_list('pk', flat=True))
+    return len(rows) - len(existing), len(existing), [], False
+
+
+def _import_recipe_ingredients(rows):
+    recipes = dict(Recipe.objects.filter(name__in={row['recipe'] for _, row in rows}).values_list('name', 'pk'))
+    ingredients = {
+        ingredient.name: ingredient
+        for ingredient in Ingredient.objects.filter(
+            name__in={row['ingredient'] for _, row in rows}
+        ).only('name', 'unit', 'density')
+    }
+
+    errors = []
+    lines = {}
+    for line_number, row in rows:
+        recipe_id = recipes.get(row['recipe'])
+        ingredient = ingredients.get(row['ingredient'])
+        if recipe_id is None:
+            errors.append((line_number, f"Recipe '{row['recipe']}' not found"))
+            continue
+        if ingredient is None:
+            errors.append((line_number, f"Ingredient '{row['ingredient']}' not found"))
+            continue
+        line = RecipeIngredient(
+            recipe_id=recipe_id, ingredient_id=ingredient.pk, quantity=row['quantity'], unit=row['unit']
+        )
+        try:
+            line.set_base_quantity(ingredient)
+        except UnitConversionError as exc:
+            errors.append((line_number, str(exc)))
+            continue
+        lines[recipe_id, ingredient.pk] = line
+
+    existing = set(
+        RecipeIngredient.objects.filter(
+            recipe_id__in={recipe_id for recipe_id, _ in lines},
+            ingredient_id__in={ingredient_id for _, ingredient_id in lines},
+        ).values_list('recipe_id', 'ingredient_id')
+    ) & set(lines)
+    _upsert(
+        RecipeIngredient,
+        list(lines.values()),
+        unique_fields=['recipe', 'ingredient'],
+        update_fields=['quantity', 'unit', 'base_quantity'],
+    )
+    refresh_recipe_requirements(recipe_id for recipe_id, _ in lines)
+    return len(lines) - len(existing), len(existing), errors, False
+
+
+# Each importer receives a batch of (line_number, parsed_row) pairs and
+# returns the created and updated counts, (line_number, message) errors and
+# whether the batch could only be partly applied.
+IMPORTERS = {
+    'ingredients': _import_ingredients,
+    'recipes': _import_recipes,
+    'recipe_ingredients': _import_recipe_ingredients,
+}
+
+
+def import_catalog(kind, lines, fmt, dry_run=False, batch_size=IMPORT_BATCH_SIZE):
+    """
+    Import catalog rows of ``kind`` from an iterable of text lines.
+
+    Rows are upserted by their unique names in batches of ``batch_size`` using
+    one bulk insert per batch. Invalid rows are skipped and reported. With
+    ``dry_run`` everything runs inside a transaction that is rolled back, so
+    the counts are exact but nothing is saved. Errors that leave a batch
+    partly applied, such as stock changes refused by the ledger, roll back
+    the whole import; a dry run reports them and carries on.
+
+    Returns a dict with the ``created``, ``updated`` and ``skipped`` counts,
+    the first ``MAX_REPORTED_ERRORS`` row errors and ``rolled_back``.
+    """
+    check_kind_and_format(kind, fmt)
+    parse = PARSERS[kind]
+    importer = IMPORTERS[kind]
+    result = {'created': 0, 'updated': 0, 'skipped': 0, 'errors': [], 'dry_run': dry_run, 'rolled_back': False}
+
+    def record_error(line_number, message):
+        result['skipped'] += 1
+        if len(result['errors']) < MAX_REPORTED_ERRORS:
+            result['errors'].append({'line': line_number, 'error': message})
+
+    rows = read_rows(lines, fmt)
+    try:
+        with transaction.atomic():
+            with deferred_cost_refresh():
+                while True:
+                    chunk = list(islice(rows, batch_size))
+                    if not chunk:
+                        break
+
+                    batch = {}
+                    for line_number, row in chunk:
+                        try:
+                            if isinstance(row, Exception):
+                                raise row
+                            parsed = parse(row)
+                        except ValueError as exc:
+                            record_error(line_number, str(exc))
+                            continue
+                        # Upserts can't touch the same row twice in one statement
+                        key = parsed['name'] if 'name' in parsed else (parsed['recipe'], parsed['ingredient'])
+                        batch[key] = (line_number, parsed)
+                    if not batch:
+                        continue
+
+                    created, updated, errors, partial = importer(list(batch.values()))
+                    result['created'] += created
+                    result['updated'] += updated
+                    for line_number, message in errors:
+                        record_error(line_number, message)
+                    if partial:
+                        result['rolled_back'] = True
+                        if not dry_run:
+                            raise _RollBack
+
+            if dry_run:
+                transaction.set_rollback(True)
+    except _RollBack:
+        # Nothing was saved
+        result['created'] = result['updated'] = 0
+
+    return result
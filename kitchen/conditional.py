@@ -0,0 +1,110 @@
+"""Conditional GET (ETag / Last-Modified) support for API views."""
+
+import hashlib
+from functools import wraps
+
+from django.core.exceptions import ValidationError
+from django.db.models import Count, Max, OuterRef, Subquery
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+
+from .models import Tombstone
+
+
+def conditional_get(validators_method):
+    """
+    Answer GET requests with 304 when the client's copy is still current.
+
+    ``validators_method`` names a view method that receives the same
+    arguments as the decorated handler and returns a list of values the
+    response depends on (timestamps, counts...), or ``None`` to skip the
+    check. The values are computed with cheap aggregate queries, so a 304 is
+    answered without building or serializing the response body.
+    """
+    def decorator(handler):
+        @wraps(handler)
+        def wrapper(view, request, *args, **kwargs):
+            values = getattr(view, validators_method)(request, *args, **kwargs)
+            if values is None:
+                return handler(view, request, *args, **kwargs)
+
+            digest = hashlib.sha1(request.get_full_path().encode())
+            for value in values:
+                digest.update(b'|' + str(value).encode())
+            etag = f'"{digest.hexdigest()}"'
+            timestamps = [value for value in values if hasattr(value, 'timestamp')]
+            last_modified = int(max(timestamps).timestamp()) if timestamps else None
+
+            response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+            if response is None:
+                response = handler(view, request, *args, **kwargs)
+                if response.status_code != 200:
+                    return response
+
+            response['ETag'] = etag
+            if last_modified is not None:
+                response['Last-Modified'] = http_date(last_modified)
+            # Let clients keep the body but revalidate it on every use
+            patch_cache_control(response, private=True, no_cache=True)
+            return response
+        return wrapper
+    return decorator
+
+
+class ConditionalGetMixin:
+    """
+    ETag / Last-Modified validators for ``list`` and ``retrieve``.
+
+    ``conditional_object_dependencies`` lists extra ``updated_at`` lookups a
+    single object's representation depends on, and
+    ``conditional_list_dependencies`` lists models whose latest change can
+    affect any list response.
+    """
+
+    tombstone_model = None
+    conditional_object_dependencies = []
+    conditional_list_dependencies = []
+
+    def get_list_validators(self, request, *args, **kwargs):
+        model = self.get_queryset().model
+        stats = self.filter_queryset(model.objects.all()).order_by().aggregate(
+            count=Count('pk'), last_updated=Max('updated_at')
+        )
+        last_deleted = Tombstone.objects.filter(model=self.tombstone_model).aggregate(
+            last_deleted=Max('deleted_at')
+        )['last_deleted']
+        values = [stats['count'], stats['last_updated'], last_deleted]
+        for dependency in self.conditional_list_dependencies:
+            values.append(dependency.objects.aggregate(last_updated=Max('updated_at'))['last_updated'])
+        return values
+
+    def get_object_validators(self, request, *args, **kwargs):
+        model = self.get_queryset().model
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        # One subquery per dependency: a single aggregate over several
+        # multi-valued relations would join them into their cross product
+        dependencies = {
+            f'value_{index}': Subquery(
+                model.objects.filter(pk=OuterRef('pk')).order_by().values('pk')
+                .annotate(last_updated=Max(lookup)).values('last_updated')
+            )
+            for index, lookup in enumerate(self.conditional_object_dependencies, start=1)
+        }
+        try:
+            values = model.objects.filter(**{self.lookup_field: kwargs[lookup_url_kwarg]}).annotate(
+                **dependencies
+            ).values_list('updated_at', *dependencies).first()
+        except (ValueError, ValidationError):
+            return None
+        if values is None:
+            # Unknown object: let the handler answer 404
+            return None
+        return list(values)
+
+    @conditional_get('get_list_validators')
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @conditional_get('get_object_validators')
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
@@ -0,0 +1,76 @@
+"""Maintenance of the stored recipe requirements and cost columns."""
+
+import threading
+from contextlib import contextmanager
+
+from .models import Recipe
+from .requirements import rebuild_requirements
+
+
+_state = threading.local()
+
+# Recipes refreshed per UPDATE statement, keeping the IN list within database limits
+REFRESH_BATCH_SIZE = 1000
+
+
+def refresh_recipe_costs(recipe_ids):
+    """
+    Recompute the stored costs of the given recipes.
+
+    Inside ``deferred_cost_refresh()`` the ids are only collected and the
+    recipes are refreshed once when the block exits.
+    """
+    recipe_ids = set(recipe_ids)
+    if not recipe_ids:
+        return
+    pending = getattr(_state, 'pending', None)
+    if pending is not None:
+        pending.update(recipe_ids)
+        return
+    recipe_ids = sorted(recipe_ids)
+    for start in range(0, len(recipe_ids), REFRESH_BATCH_SIZE):
+        Recipe.objects.filter(pk__in=recipe_ids[start:start + REFRESH_BATCH_SIZE]).refresh_costs()
+
+
+def refresh_recipe_requirements(recipe_ids):
+    """
+    Rebuild the requirements of recipes whose lines, preparations or yield changed.
+
+    The recipes using them are rebuilt too, and all of them are re-costed.
+    Inside ``deferred_cost_refresh()`` the work is done once when the block
+    exits.
+    """
+    recipe_ids = set(recipe_ids)
+    if not recipe_ids:
+        return
+    pending = getattr(_state, 'pending_requirements', None)
+    if pending is not None:
+        pending.update(recipe_ids)
+        return
+    refresh_recipe_costs(rebuild_requirements(recipe_ids))
+
+
+@contextmanager
+def deferred_cost_refresh():
+    """
+    Batch the requirement and cost refreshes triggered inside the block.
+
+    Useful around bulk writes, where signal handlers would otherwise refresh
+    the same recipes once per affected row.
+    """
+    if getattr(_state, 'pending', None) is not None:
+        # Nested block: the outermost one does the refresh
+        yield
+        return
+    _state.pending = set()
+    _state.pending_requirements = set()
+    try:
+        yield
+        recipe_ids = _state.pending
+        requirement_ids = _state.pending_requirements
+    finally:
+        _state.pending = None
+        _state.pending_requirements = None
+    if requirement_ids:
+        recipe_ids |= rebuild_requirements(requirement_ids)
+    refresh_recipe_costs(recipe_ids)
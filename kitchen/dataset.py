@@ -0,0 +1,190 @@
+"""Synthetic kitchen catalogs at production scale, for benchmarks and load tests."""
+
+import random
+from decimal import Decimal
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Ingredient, Recipe, RecipeComponent, RecipeIngredient, StockMovement
+from .prices import record_price_changes
+from .requirements import rebuild_requirements
+
+
+# Rows per INSERT statement
+INSERT_BATCH_SIZE = 5000
+
+INGREDIENT_NAMES = [
+    'Harina', 'Azúcar', 'Sal', 'Aceite de oliva', 'Mantequilla', 'Huevo', 'Leche', 'Nata', 'Queso',
+    'Tomate', 'Cebolla', 'Ajo', 'Pimiento', 'Patata', 'Zanahoria', 'Puerro', 'Apio', 'Calabacín',
+    'Berenjena', 'Espinaca', 'Champiñón', 'Arroz', 'Pasta', 'Garbanzo', 'Lenteja', 'Pollo', 'Ternera',
+    'Cerdo', 'Cordero', 'Merluza', 'Salmón', 'Gamba', 'Mejillón', 'Limón', 'Naranja', 'Manzana',
+    'Fresa', 'Chocolate', 'Vainilla', 'Canela', 'Pimentón', 'Comino', 'Perejil', 'Albahaca', 'Vino blanco',
+    'Vinagre', 'Levadura', 'Almendra', 'Nuez', 'Miel',
+]
+INGREDIENT_VARIANTS = ['fresco', 'ecológico', 'de temporada', 'importado', 'local', 'extra', 'congelado', 'seco']
+DISH_NAMES = [
+    'Tortilla', 'Paella', 'Gazpacho', 'Croquetas', 'Guiso', 'Crema', 'Ensalada', 'Risotto', 'Lasaña',
+    'Tarta', 'Bizcocho', 'Flan', 'Salsa', 'Fondo', 'Masa', 'Caldo', 'Estofado', 'Asado', 'Pisto', 'Sopa',
+]
+DISH_STYLES = ['de la casa', 'tradicional', 'de temporada', 'del chef', 'ligera', 'clásica', 'al horno', 'casera']
+
+# Unit of new ingredients with its relative frequency and typical (cost, stock) ranges
+UNIT_PROFILES = {
+    'kg': (30, (1, 40), (5, 500)),
+    'g': (20, (0.001, 0.2), (500, 50000)),
+    'l': (15, (0.5, 20), (5, 300)),
+    'ml': (10, (0.001, 0.05), (500, 20000)),
+    'u': (25, (0.05, 5), (10, 2000)),
+}
+# Typical quantity of a recipe line per ingredient unit
+LINE_QUANTITIES = {'kg': (0.05, 3), 'g': (5, 500), 'l': (0.05, 2), 'ml': (5, 500), 'u': (1, 12)}
+
+
+class DatasetError(ValueError):
+    """Raised when a synthetic dataset can't be generated in the current database."""
+
+
+def _decimal(value, places):
+    return Decimal(f'{value:.{places}f}')
+
+
+def _chunks(items, size=INSERT_BATCH_SIZE):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def generate_dataset(ingredients=10000, recipes=50000, lines=500000, preparations=0.05, seed=0, log=None):
+    """
+    Fill an empty kitchen database with a synthetic catalog.
+
+    ``lines`` recipe lines are spread over the recipes (at least one each)
+    and ingredients are picked with a long-tailed popularity, so a few
+    staples appear in thousands of recipes like in a real catalog. A
+    ``preparations`` fraction of the recipes are preparations used as
+    components by about as many other recipes. Everything is written with
+    bulk inserts, then the requirements, costs, opening stock movements and
+    price history are built the same way the application maintains them.
+    The same ``seed`` always produces the same catalog.
+
+    Returns the number of rows created per model.
+    """
+    if Recipe.objects.exists() or Ingredient.objects.exists():
+        raise DatasetError("The database already has recipes or ingredients; generate data into an empty one")
+    if ingredients < 1 or recipes < 1:
+        raise DatasetError("Generate at least one ingredient and one recipe")
+    log = log or (lambda message: None)
+    rng = random.Random(seed)
+    now = timezone.now()
+
+    with transaction.atomic():
+        units = list(UNIT_PROFILES)
+        unit_weights = [UNIT_PROFILES[unit][0] for unit in units]
+        new_ingredients = []
+        for index in range(ingredients):
+            unit = rng.choices(units, unit_weights)[0]
+            _weight, (low_cost, high_cost), (low_stock, high_stock) = UNIT_PROFILES[unit]
+            new_ingredients.append(Ingredient(
+                name=f"{rng.choice(INGREDIENT_NAMES)} {rng.choice(INGREDIENT_VARIANTS)} {index + 1:06d}",
+                unit=unit,
+                cost_per_unit=max(_decimal(rng.uniform(low_cost, high_cost), 2), Decimal('0.01')),
+                current_stock=_decimal(rng.uniform(low_stock, high_stock), 2),
+                created_at=now,
+                updated_at=now,
+            ))
+        for batch in _chunks(new_ingredients):
+            Ingredient.objects.bulk_create(batch)
+        ingredient_rows = list(Ingredient.objects.order_by('pk').values_list('pk', 'unit', 'cost_per_unit', 'current_stock'))
+        log(f"{len(ingredient_rows)} ingredients")
+
+        for batch in _chunks([
+            Recipe(
+                name=f"{rng.choice(DISH_NAMES)} {rng.choice(DISH_STYLES)} {index + 1:06d}",
+                yield_portions=rng.randint(1, 20),
+                preparation_time=rng.choice([None, 10, 15, 20, 30, 45, 60, 90, 120]),
+                created_at=now,
+                updated_at=now,
+            )
+            for index in range(recipes)
+        ]):
+            Recipe.objects.bulk_create(batch)
+        recipe_ids = list(Recipe.objects.order_by('pk').values_list('pk', flat=True))
+        log(f"{len(recipe_ids)} recipes")
+
+        # Long-tailed popularity: the n-th most used ingredient is picked about 1/n**0.8 as often as the first
+        popularity = list(range(len(ingredient_rows)))
+        rng.shuffle(popularity)
+        cumulative = []
+        total = 0.0
+        for rank in range(1, len(ingredient_rows) + 1):
+            total += rank ** -0.8
+            cumulative.append(total)
+
+        lines_per_recipe = [1] * len(recipe_ids)
+        for position in rng.choices(range(len(recipe_ids)), k=max(lines - len(recipe_ids), 0)):
+            lines_per_recipe[position] += 1
+        created_lines = 0
+        pending = []
+        for recipe_id, count in zip(recipe_ids, lines_per_recipe):
+            count = min(count, len(ingredient_rows))
+            chosen = set()
+            while len(chosen) < count:
+                chosen.update(
+                    popularity[rank] for rank in rng.choices(range(len(popularity)), cum_weights=cumulative, k=count - len(chosen))
+                )
+            for position in chosen:
+                ingredient_id, unit, _cost, _stock = ingredient_rows[position]
+                low, high = LINE_QUANTITIES[unit]
+                quantity = _decimal(rng.uniform(low, high), 3)
+                pending.append(RecipeIngredient(
+                    recipe_id=recipe_id, ingredient_id=ingredient_id, quantity=quantity, unit=unit, base_quantity=quantity
+                ))
+            if len(pending) >= INSERT_BATCH_SIZE:
+                RecipeIngredient.objects.bulk_create(pending)
+                created_lines += len(pending)
+                pending = []
+        RecipeIngredient.objects.bulk_create(pending)
+        created_lines += len(pending)
+        log(f"{created_lines} recipe lines")
+
+        # Preparations never use components themselves, so the graph has no cycles
+        preparation_count = int(len(recipe_ids) * preparations) if len(recipe_ids) > 1 else 0
+        preparation_ids = recipe_ids[:preparation_count]
+        components = []
+        if preparation_ids:
+            for parent_id in rng.sample(recipe_ids[preparation_count:], min(preparation_count, len(recipe_ids) - preparation_count)):
+                for component_id in rng.sample(preparation_ids, min(rng.randint(1, 2), len(preparation_ids))):
+                    components.append(RecipeComponent(
+                        parent_id=parent_id, component_id=component_id, portions=_decimal(rng.uniform(0.5, 4), 2)
+                    ))
+        for batch in _chunks(components):
+            RecipeComponent.objects.bulk_create(batch)
+        log(f"{len(components)} preparations in recipes")
+
+        rebuild_requirements(recipe_ids)
+        Recipe.objects.all().refresh_costs()
+        log("Requirements and costs rebuilt")
+
+        movements = [
+            StockMovement(
+                ingredient_id=ingredient_id, kind=StockMovement.ADJUSTMENT, quantity=stock,
+                note="Saldo inicial", created_at=now,
+            )
+            for ingredient_id, _unit, _cost, stock in ingredient_rows
+            if stock
+        ]
+        for batch in _chunks(movements):
+            StockMovement.objects.bulk_create(batch)
+        prices = record_price_changes(
+            [(ingredient_id, None, cost) for ingredient_id, _unit, cost, _stock in ingredient_rows], at=now
+        )
+        log("Stock ledger and price history opened")
+
+    return {
+        'ingredients': len(ingredient_rows),
+        'recipes': len(recipe_ids),
+        'recipe_ingredients': created_lines,
+        'recipe_components': len(components),
+        'stock_movements': len(movements),
+        'ingredient_prices': prices,
+    }
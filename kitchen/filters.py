@@ -0,0 +1,58 @@
+from itertools import chain
+
+from django.db import connections
+from django.db.models import FloatField, Func, Q, Value
+from rest_framework.filters import SearchFilter
+
+
+# MySQL's default ngram_token_size: shorter terms are not in the FULLTEXT index
+NGRAM_TOKEN_SIZE = 2
+
+
+class FullTextMatch(Func):
+    """MySQL ``MATCH (columns) AGAINST (query IN BOOLEAN MODE)``, served by a FULLTEXT index on the columns."""
+
+    output_field = FloatField()
+
+    def __init__(self, *columns, query):
+        super().__init__(*columns, Value(query))
+
+    def as_sql(self, compiler, connection, **extra_context):
+        *columns, query = self.get_source_expressions()
+        compiled = [compiler.compile(column) for column in columns]
+        query_sql, query_params = compiler.compile(query)
+        sql = f"MATCH ({', '.join(sql for sql, _params in compiled)}) AGAINST ({query_sql} IN BOOLEAN MODE)"
+        return sql, (*chain.from_iterable(params for _sql, params in compiled), *query_params)
+
+
+class IndexedSearchFilter(SearchFilter):
+    """
+    SearchFilter whose substring matches are answered from an index where the database has one.
+
+    On PostgreSQL the views' ``search_fields`` (case-insensitive substring
+    matches) are served by the trigram GIN indexes created in migration 0003.
+    On MySQL, views may declare ``fulltext_search_fields``, the columns of an
+    ngram FULLTEXT index (migration 0011): each term is searched as a phrase
+    of ngrams, which matches it anywhere in the text like ``icontains``.
+    Terms shorter than an ngram, and every other database, use the plain
+    ``search_fields`` lookups.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        fulltext_fields = getattr(view, 'fulltext_search_fields', None)
+        if connections[queryset.db].vendor != 'mysql' or not fulltext_fields:
+            return super().filter_queryset(request, queryset, view)
+
+        terms = [term.replace('"', '') for term in self.get_search_terms(request)]
+        phrases = [term for term in terms if len(term) >= NGRAM_TOKEN_SIZE]
+        if phrases:
+            query = ' '.join(f'+"{phrase}"' for phrase in phrases)
+            queryset = queryset.alias(search_match=FullTextMatch(*fulltext_fields, query=query)).filter(
+                search_match__gt=0
+            )
+        for term in terms:
+            if term and len(term) < NGRAM_TOKEN_SIZE:
+                queryset = queryset.filter(
+                    Q(*(Q(**{f'{field}__icontains': term}) for field in fulltext_fields), _connector=Q.OR)
+                )
+        return queryset
@@ -0,0 +1,164 @@
+"""Opt-in per-request SQL and timing instrumentation with N+1 query detection."""
+
+import json
+import logging
+import os
+import random
+import re
+import time
+import traceback
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+
+logger = logging.getLogger(__name__)
+
+# Placeholder lists of any length, and multi-row VALUES, share one query shape
+_PLACEHOLDER_LIST = re.compile(r'\(\s*%s(?:\s*,\s*%s)*\s*\)')
+_REPEATED_LIST = re.compile(r'\(\.\.\.\)(?:\s*,\s*\(\.\.\.\))+')
+
+# Project frames reported as the origin of a repeated query, innermost first
+ORIGIN_FRAMES = 3
+
+# Longest SQL shape written to the log
+MAX_SHAPE_LENGTH = 300
+
+
+def query_shape(sql):
+    """SQL with its placeholder lists collapsed, so the same query with different ids has one shape."""
+    return _REPEATED_LIST.sub('(...)', _PLACEHOLDER_LIST.sub('(...)', sql))
+
+
+def _query_origin():
+    # Innermost frames of the project's own code (not the libraries, not this module)
+    project = str(settings.BASE_DIR) + os.sep
+    frames = [
+        frame for frame in traceback.extract_stack()
+        if frame.filename.startswith(project)
+        and 'site-packages' not in frame.filename
+        and frame.filename != __file__
+    ]
+    return ' <- '.join(
+        f"{os.path.relpath(frame.filename, project)}:{frame.lineno} in {frame.name}"
+        for frame in reversed(frames[-ORIGIN_FRAMES:])
+    )
+
+
+class QueryRecorder:
+    """
+    Database execute wrapper that times every query of a request and groups them by shape.
+
+    The stack is only inspected once per shape, when it reaches the
+    ``repeated_threshold``-th execution, so recording stays cheap.
+    """
+
+    def __init__(self, repeated_threshold):
+        self.repeated_threshold = repeated_threshold
+        self.count = 0
+        self.duration = 0.0
+        self.shapes = Counter()
+        self.origins = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - started
+            self.count += 1
+            shape = query_shape(sql)
+            self.shapes[shape] += 1
+            if self.shapes[shape] == self.repeated_threshold:
+                self.origins[shape] = _query_origin()
+
+    def repeated_queries(self):
+        """Shapes executed at least ``repeated_threshold`` times, most repeated first."""
+        return [
+            {'count': count, 'sql': shape[:MAX_SHAPE_LENGTH], 'origin': self.origins.get(shape, '')}
+            for shape, count in self.shapes.most_common()
+            if count >= self.repeated_threshold
+        ]
+
+
+class RequestInstrumentationMiddleware:
+    """
+    Measure a sample of requests: SQL count and time, view and rendering time.
+
+    Enabled by ``INSTRUMENTATION_SAMPLE_RATE`` (fraction of requests, 0
+    removes the middleware at startup). Sampled responses get a
+    ``Server-Timing`` header and one JSON log line on the
+    ``kitchen.instrumentation`` logger. ``view`` is the Python time spent
+    before the response is rendered without its SQL, which for API views is
+    mostly serializers; ``render`` is the rendering of the response body.
+    Query shapes repeated ``INSTRUMENTATION_REPEATED_QUERIES`` times or more
+    are logged as a warning with the project code that issued them. Queries
+    run while a streaming response is consumed are not counted.
+    """
+
+    def __init__(self, get_response):
+        self.sample_rate = float(settings.INSTRUMENTATION_SAMPLE_RATE)
+        if self.sample_rate <= 0:
+            raise MiddlewareNotUsed
+        self.repeated_threshold = int(settings.INSTRUMENTATION_REPEATED_QUERIES)
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if random.random() >= self.sample_rate:
+            return self.get_response(request)
+
+        recorder = QueryRecorder(self.repeated_threshold)
+        request._instrumentation = {'recorder': recorder, 'render_started': None}
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(recorder))
+            response = self.get_response(request)
+        finished = time.perf_counter()
+
+        render_started = request._instrumentation['render_started']
+        if render_started is None:
+            render_started, render_sql = finished, recorder.duration
+        else:
+            render_started, render_sql = render_started
+        view_ms = ((render_started - started) - render_sql) * 1000
+        render_ms = ((finished - render_started) - (recorder.duration - render_sql)) * 1000
+        sql_ms = recorder.duration * 1000
+        total_ms = (finished - started) * 1000
+        repeated = recorder.repeated_queries()
+
+        timings = [
+            f'sql;dur={sql_ms:.1f};desc="{recorder.count} queries"',
+            f'view;dur={view_ms:.1f}',
+            f'render;dur={render_ms:.1f}',
+            f'total;dur={total_ms:.1f}',
+        ]
+        if repeated:
+            timings.append(f'n-plus-one;desc="{len(repeated)} repeated query shapes"')
+        response['Server-Timing'] = ', '.join(timings)
+
+        match = request.resolver_match
+        record = {
+            'method': request.method,
+            'path': request.path,
+            'view': match.view_name if match else None,
+            'status': response.status_code,
+            'total_ms': round(total_ms, 2),
+            'sql_ms': round(sql_ms, 2),
+            'sql_queries': recorder.count,
+            'view_ms': round(view_ms, 2),
+            'render_ms': round(render_ms, 2),
+            'repeated_queries': repeated,
+        }
+        logger.log(logging.WARNING if repeated else logging.INFO, json.dumps(record))
+        return response
+
+    def process_template_response(self, request, response):
+        # Called right before DRF and template responses are rendered
+        instrumentation = getattr(request, '_instrumentation', None)
+        if instrumentation is not None:
+            instrumentation['render_started'] = (time.perf_counter(), instrumentation['recorder'].duration)
+        return response
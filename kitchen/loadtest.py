@@ -0,0 +1,102 @@
+"""Concurrent HTTP load test of a running server, to compare deployments and serving modes."""
+
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import defaultdict
+
+from .benchmarks import percentile, pick_targets
+
+
+# The dashboard reads, formatted with ``pick_targets``
+LOAD_PATHS = {
+    'recipe-list': '/api/recipes/',
+    'recipe-detail': '/api/recipes/{recipe}/',
+    'recipe-cost-breakdown': '/api/recipes/{recipe}/cost_breakdown/',
+    'ingredient-low-stock': '/api/ingredients/low_stock/',
+    'home': '/',
+}
+
+
+class LoadTestError(ValueError):
+    """Raised for an invalid load test configuration."""
+
+
+def select_paths(names=()):
+    """Paths of the load test endpoints whose name contains any of ``names``; all of them when empty."""
+    selected = {name: path for name, path in LOAD_PATHS.items() if not names or any(part in name for part in names)}
+    if not selected:
+        raise LoadTestError(f"No load test endpoint matches: {', '.join(names)}")
+    targets = pick_targets()
+    return {name: path.format(**targets) for name, path in selected.items()}
+
+
+def _summary(timings, errors, elapsed):
+    timings = sorted(timings)
+    requests = len(timings) + errors
+    return {
+        'requests': requests,
+        'errors': errors,
+        'requests_per_second': round(requests / elapsed, 1) if elapsed else 0.0,
+        'p50_ms': round(percentile(timings, 0.50), 2) if timings else None,
+        'p95_ms': round(percentile(timings, 0.95), 2) if timings else None,
+        'p99_ms': round(percentile(timings, 0.99), 2) if timings else None,
+    }
+
+
+def run_load_test(base_url, paths, concurrency=50, duration=10.0, timeout=30.0):
+    """
+    Request ``paths`` (name to path) from ``concurrency`` clients for ``duration`` seconds.
+
+    Every client requests the paths in turn, starting at a different one,
+    and waits for each response before sending the next request, so the
+    throughput measures how many requests the server handles at once.
+    Responses other than 200 and 304, and timeouts, count as errors.
+    Returns the overall results and the results per path.
+    """
+    if concurrency < 1 or duration <= 0:
+        raise LoadTestError("The concurrency must be at least 1 and the duration positive")
+    base_url = base_url.rstrip('/')
+    names = list(paths)
+    lock = threading.Lock()
+    timings = defaultdict(list)
+    errors = defaultdict(int)
+    deadline = time.monotonic() + duration
+
+    def client(offset):
+        turn = offset
+        while time.monotonic() < deadline:
+            name = names[turn % len(names)]
+            turn += 1
+            started = time.perf_counter()
+            try:
+                with urllib.request.urlopen(base_url + paths[name], timeout=timeout) as response:
+                    response.read()
+                    failed = response.status not in (200, 304)
+            except urllib.error.HTTPError as exc:
+                failed = exc.code != 304
+            except OSError:
+                failed = True
+            elapsed = (time.perf_counter() - started) * 1000
+            with lock:
+                if failed:
+                    errors[name] += 1
+                else:
+                    timings[name].append(elapsed)
+
+    started = time.monotonic()
+    clients = [threading.Thread(target=client, args=(index,), daemon=True) for index in range(concurrency)]
+    for thread in clients:
+        thread.start()
+    for thread in clients:
+        thread.join()
+    elapsed = time.monotonic() - started
+
+    return {
+        'url': base_url,
+        'concurrency': concurrency,
+        'duration_s': round(elapsed, 2),
+        'total': _summary([timing for name in names for timing in timings[name]], sum(errors.values()), elapsed),
+        'endpoints': {name: _summary(timings[name], errors[name], elapsed) for name in names},
+    }
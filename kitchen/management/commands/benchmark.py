@@ -0,0 +1,80 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from kitchen.benchmarks import BenchmarkError, check_results, run_benchmarks, select_endpoints
+from kitchen.models import Ingredient, Recipe, RecipeIngredient
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the API endpoints, HomeView and the admin changelists against the current database, "
+        "checking query budgets and, optionally, latency regressions against a saved baseline."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('endpoints', nargs='*', help="Only run the benchmarks whose name contains one of these.")
+        parser.add_argument('--iterations', type=int, default=20)
+        parser.add_argument('--warmup', type=int, default=2)
+        parser.add_argument('--baseline', help="JSON file of a previous run to compare latencies with.")
+        parser.add_argument('--save-baseline', help="Write this run's results to a JSON file.")
+        parser.add_argument('--stat', choices=['p50_ms', 'p95_ms', 'p99_ms', 'mean_ms'], default='p50_ms')
+        parser.add_argument(
+            '--threshold', type=float, default=0.25,
+            help="Fraction by which a latency may grow over the baseline before failing.",
+        )
+        parser.add_argument(
+            '--min-delta', type=float, default=5.0,
+            help="Milliseconds a latency may grow over the baseline regardless of the threshold.",
+        )
+
+    def handle(self, *args, **options):
+        if options['iterations'] < 1 or options['warmup'] < 0:
+            raise CommandError("--iterations must be at least 1 and --warmup can't be negative")
+        baseline = None
+        if options['baseline']:
+            try:
+                with open(options['baseline']) as baseline_file:
+                    baseline = json.load(baseline_file)['results']
+            except (OSError, ValueError, KeyError) as exc:
+                raise CommandError(f"Can't read baseline {options['baseline']}: {exc}")
+
+        def report(name, result):
+            self.stdout.write(
+                f"{name:<36} {result['method']:<6} {'/'.join(str(status) for status in result['statuses']):<8}"
+                f" {result['queries']:>4}/{result['query_budget']:<4} queries"
+                f"  p50 {result['p50_ms']:>8.1f}  p95 {result['p95_ms']:>8.1f}  p99 {result['p99_ms']:>8.1f} ms"
+            )
+
+        try:
+            results = run_benchmarks(
+                select_endpoints(options['endpoints']),
+                iterations=options['iterations'],
+                warmup=options['warmup'],
+                log=report,
+            )
+        except BenchmarkError as exc:
+            raise CommandError(str(exc))
+
+        if options['save_baseline']:
+            with open(options['save_baseline'], 'w') as baseline_file:
+                json.dump({
+                    'database': connection.vendor,
+                    'catalog': {
+                        'ingredients': Ingredient.objects.count(),
+                        'recipes': Recipe.objects.count(),
+                        'recipe_ingredients': RecipeIngredient.objects.count(),
+                    },
+                    'results': results,
+                }, baseline_file, indent=2)
+            self.stdout.write(f"Saved the results to {options['save_baseline']}.")
+
+        failures = check_results(
+            results, baseline, stat=options['stat'], threshold=options['threshold'], min_delta_ms=options['min_delta']
+        )
+        for failure in failures:
+            self.stderr.write(failure)
+        if failures:
+            raise CommandError(f"{len(failures)} benchmark checks failed.")
+        self.stdout.write(self.style.SUCCESS(f"{len(results)} endpoints within their budgets."))
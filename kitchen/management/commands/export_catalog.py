@@ -0,0 +1,31 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from kitchen.catalog import FORMATS, KINDS, export_lines
+
+
+class Command(BaseCommand):
+    help = "Export ingredients, recipes or recipe lines as CSV or JSON Lines."
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=list(KINDS))
+        parser.add_argument('--format', dest='fmt', choices=FORMATS, help="Defaults to the output file extension, or csv.")
+        parser.add_argument('--output', '-o', help="File to write to. Defaults to standard output.")
+
+    def handle(self, *args, **options):
+        fmt = options['fmt']
+        output = options['output']
+        if fmt is None:
+            fmt = 'jsonl' if output and output.endswith(('.jsonl', '.ndjson')) else 'csv'
+
+        if not output:
+            sys.stdout.writelines(export_lines(options['kind'], fmt))
+            return
+
+        try:
+            with open(output, 'w', encoding='utf-8', newline='') as stream:
+                stream.writelines(export_lines(options['kind'], fmt))
+        except OSError as exc:
+            raise CommandError(f"Cannot write {output}: {exc}")
+        self.stderr.write(self.style.SUCCESS(f"Exported {options['kind']} to {output}"))
@@ -0,0 +1,38 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from kitchen.dataset import DatasetError, generate_dataset
+
+
+class Command(BaseCommand):
+    help = "Fill an empty database with a synthetic kitchen catalog, e.g. for benchmarks."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ingredients', type=int, default=10000)
+        parser.add_argument('--recipes', type=int, default=50000)
+        parser.add_argument('--lines', type=int, default=500000, help="Recipe lines spread over the recipes.")
+        parser.add_argument(
+            '--preparations', type=float, default=0.05,
+            help="Fraction of the recipes that are preparations used inside other recipes.",
+        )
+        parser.add_argument('--seed', type=int, default=0, help="The same seed always generates the same catalog.")
+
+    def handle(self, *args, **options):
+        if not 0 <= options['preparations'] < 1:
+            raise CommandError("--preparations must be between 0 and 1")
+        started = time.perf_counter()
+        try:
+            counts = generate_dataset(
+                ingredients=options['ingredients'],
+                recipes=options['recipes'],
+                lines=options['lines'],
+                preparations=options['preparations'],
+                seed=options['seed'],
+                log=self.stdout.write,
+            )
+        except DatasetError as exc:
+            raise CommandError(str(exc))
+
+        summary = ', '.join(f"{count} {name}" for name, count in counts.items())
+        self.stdout.write(self.style.SUCCESS(f"Created {summary} in {time.perf_counter() - started:.1f} s."))
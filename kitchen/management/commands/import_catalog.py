@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from kitchen.catalog import FORMATS, IMPORT_BATCH_SIZE, KINDS, import_catalog
+
+
+class Command(BaseCommand):
+    help = (
+        "Import ingredients, recipes or recipe lines from CSV or JSON Lines, "
+        "upserting rows by name. Import ingredients and recipes before their lines."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=list(KINDS))
+        parser.add_argument('path')
+        parser.add_argument('--format', dest='fmt', choices=FORMATS, help="Defaults to the file extension.")
+        parser.add_argument('--dry-run', action='store_true', help="Validate and count without saving anything.")
+        parser.add_argument('--batch-size', type=int, default=IMPORT_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['fmt'] or ('jsonl' if path.endswith(('.jsonl', '.ndjson')) else 'csv')
+
+        try:
+            with open(path, encoding='utf-8', newline='') as stream:
+                result = import_catalog(
+                    options['kind'], stream, fmt,
+                    dry_run=options['dry_run'],
+                    batch_size=options['batch_size'],
+                )
+        except OSError as exc:
+            raise CommandError(f"Cannot read {path}: {exc}")
+
+        for error in result['errors']:
+            self.stderr.write(f"Line {error['line']}: {error['error']}")
+
+        if result['rolled_back']:
+            if result['dry_run']:
+                self.stderr.write("Some rows can't be applied: the import would be rolled back.")
+            else:
+                raise CommandError("Some rows couldn't be applied: the import was rolled back.")
+
+        prefix = "Dry run: " if result['dry_run'] else ""
+        self.stdout.write(self.style.SUCCESS(
+            f"{prefix}{result['created']} created, {result['updated']} updated, {result['skipped']} skipped."
+        ))
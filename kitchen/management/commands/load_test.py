@@ -0,0 +1,65 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from kitchen.benchmarks import BenchmarkError
+from kitchen.loadtest import LoadTestError, run_load_test, select_paths
+
+
+class Command(BaseCommand):
+    help = (
+        "Load test the dashboard reads of a running server with many concurrent clients, "
+        "to compare the throughput of deployments or serving modes. Paths use the recipes and ingredients of this database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('endpoints', nargs='*', help="Only request the endpoints whose name contains one of these.")
+        parser.add_argument('--url', default='http://127.0.0.1:8000', help="Base URL of the server under test.")
+        parser.add_argument('--concurrency', type=int, default=50)
+        parser.add_argument('--duration', type=float, default=10.0, help="Seconds of load.")
+        parser.add_argument('--timeout', type=float, default=30.0, help="Seconds before a request counts as an error.")
+        parser.add_argument('--save', help="Write this run's results to a JSON file.")
+        parser.add_argument('--compare', help="JSON file of a previous run to report the gain over.")
+
+    def handle(self, *args, **options):
+        previous = {}
+        if options['compare']:
+            try:
+                with open(options['compare']) as previous_file:
+                    run = json.load(previous_file)
+                previous = {**run['endpoints'], 'total': run['total']}
+            except (OSError, ValueError, KeyError) as exc:
+                raise CommandError(f"Can't read {options['compare']}: {exc}")
+
+        try:
+            paths = select_paths(options['endpoints'])
+            self.stdout.write(
+                f"{options['concurrency']} clients for {options['duration']:g} s against {options['url']}..."
+            )
+            results = run_load_test(
+                options['url'], paths,
+                concurrency=options['concurrency'], duration=options['duration'], timeout=options['timeout'],
+            )
+        except (BenchmarkError, LoadTestError) as exc:
+            raise CommandError(str(exc))
+
+        for name, result in [*results['endpoints'].items(), ('total', results['total'])]:
+            latencies = '  '.join(
+                f"{stat[:3]} {result[stat]:>8.1f}" if result[stat] is not None else f"{stat[:3]} {'-':>8}"
+                for stat in ('p50_ms', 'p95_ms', 'p99_ms')
+            )
+            self.stdout.write(
+                f"{name:<24} {result['requests']:>7} requests {result['errors']:>5} errors"
+                f" {result['requests_per_second']:>8.1f} req/s  {latencies} ms"
+            )
+            baseline = previous.get(name)
+            if baseline and baseline['requests_per_second']:
+                gain = result['requests_per_second'] / baseline['requests_per_second']
+                self.stdout.write(f"{'':<24} x{gain:.2f} the throughput of {options['compare']}")
+
+        if options['save']:
+            with open(options['save'], 'w') as results_file:
+                json.dump(results, results_file, indent=2)
+            self.stdout.write(f"Saved the results to {options['save']}.")
+        if results['total']['errors']:
+            self.stderr.write(f"{results['total']['errors']} requests failed.")
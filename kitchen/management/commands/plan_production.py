@@ -0,0 +1,49 @@
+from decimal import Decimal, InvalidOperation
+
+from django.core.management.base import BaseCommand, CommandError
+
+from kitchen.planning import DEFAULT_TIME_LIMIT, METHODS, PlanningError, plan_production
+
+
+def _target(value):
+    # ID[:WEIGHT[:DEMAND_PORTIONS]]
+    parts = value.split(':')
+    try:
+        if len(parts) > 3:
+            raise ValueError
+        target = {'id': int(parts[0])}
+        if len(parts) > 1 and parts[1]:
+            target['weight'] = Decimal(parts[1])
+        if len(parts) > 2 and parts[2]:
+            target['demand_portions'] = int(parts[2])
+    except (ValueError, InvalidOperation):
+        raise CommandError(f"Expected ID[:WEIGHT[:DEMAND_PORTIONS]], got '{value}'")
+    return target
+
+
+class Command(BaseCommand):
+    help = "Plan how many batches of each recipe to produce from the current stock."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'recipes', nargs='*', metavar='ID[:WEIGHT[:DEMAND_PORTIONS]]',
+            help="Recipes to plan. Defaults to every recipe with weight 1.",
+        )
+        parser.add_argument('--method', choices=METHODS, default='auto')
+        parser.add_argument('--time-limit', type=float, default=DEFAULT_TIME_LIMIT, help="Solver time budget in seconds.")
+
+    def handle(self, *args, **options):
+        targets = [_target(value) for value in options['recipes']]
+        try:
+            result = plan_production(targets, method=options['method'], time_limit=options['time_limit'])
+        except PlanningError as exc:
+            raise CommandError(str(exc))
+
+        for recipe in result['plan']:
+            self.stdout.write(f"#{recipe['id']} {recipe['name']}: {recipe['batches']} batches, {recipe['portions']} portions")
+        for ingredient in result['binding_ingredients']:
+            self.stdout.write(f"Limited by {ingredient['name']}: {ingredient['remaining']} {ingredient['unit']} left")
+        self.stdout.write(self.style.SUCCESS(
+            f"{result['total_portions']} portions with {result['method']}"
+            f"{' (optimal)' if result['optimal'] else ''} in {result['solve_ms']} ms."
+        ))
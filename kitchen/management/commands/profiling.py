@@ -0,0 +1,92 @@
+import glob
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from kitchen.profiling import (
+    COLLAPSED_SUFFIX, DEFAULT_INTERVAL, ProfilingError, disable_profiling, enable_profiling, profile_path,
+    read_config, read_samples, summarize,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Switch request profiling on or off at runtime, and summarize the collected profiles "
+        "by the functions with the most cumulative time."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('action', choices=['enable', 'disable', 'status', 'summary', 'clear'])
+        parser.add_argument(
+            'endpoints', nargs='*',
+            help="URL names, e.g. recipe-list recipe-cost-breakdown: the ones to profile, or to summarize.",
+        )
+        parser.add_argument('--rate', type=float, default=1.0, help="Fraction of the selected requests to profile.")
+        parser.add_argument(
+            '--interval', type=float, default=DEFAULT_INTERVAL * 1000, help="Milliseconds between stack samples.",
+        )
+        parser.add_argument('--top', type=int, default=20, help="Functions listed per endpoint in the summary.")
+        parser.add_argument(
+            '--match', default='', help="Only list the functions whose module:name contains this, e.g. kitchen.",
+        )
+
+    def handle(self, *args, **options):
+        directory = str(settings.PROFILING_DIR)
+        if not directory:
+            raise CommandError("Set PROFILING_DIR to use request profiling.")
+        try:
+            getattr(self, options['action'])(directory, options)
+        except ProfilingError as exc:
+            raise CommandError(str(exc))
+
+    def enable(self, directory, options):
+        config = enable_profiling(
+            directory, rate=options['rate'], endpoints=options['endpoints'], interval=options['interval'] / 1000
+        )
+        self.stdout.write(self.style.SUCCESS(f"Profiling enabled: {self.describe(config)}."))
+
+    def disable(self, directory, options):
+        disable_profiling(directory)
+        self.stdout.write(self.style.SUCCESS("Profiling disabled."))
+
+    def status(self, directory, options):
+        config = read_config(directory)
+        self.stdout.write(f"Profiling {'enabled: ' + self.describe(config) if config else 'disabled'}.")
+        for path in sorted(glob.glob(os.path.join(directory, '*' + COLLAPSED_SUFFIX))):
+            samples = sum(read_samples(path).values())
+            self.stdout.write(f"  {os.path.basename(path)}: {samples} samples")
+
+    def summary(self, directory, options):
+        if options['endpoints']:
+            paths = [profile_path(directory, endpoint) for endpoint in options['endpoints']]
+        else:
+            paths = sorted(glob.glob(os.path.join(directory, '*' + COLLAPSED_SUFFIX)))
+        paths = [path for path in paths if os.path.exists(path)]
+        if not paths:
+            raise CommandError(f"No profiles in {directory}.")
+
+        config = read_config(directory) or {}
+        interval_ms = config.get('interval', DEFAULT_INTERVAL) * 1000
+        for path in paths:
+            total, functions = summarize(read_samples(path), limit=options['top'], match=options['match'])
+            self.stdout.write(self.style.MIGRATE_HEADING(
+                f"{os.path.basename(path)[:-len(COLLAPSED_SUFFIX)]}: {total} samples (~{total * interval_ms:.0f} ms)"
+            ))
+            self.stdout.write(f"{'cumulative':>16} {'own':>16}  function")
+            for function in functions:
+                self.stdout.write(
+                    f"{function['cumulative']:>7} {function['cumulative'] / total:>7.1%}"
+                    f" {function['own']:>7} {function['own'] / total:>7.1%}  {function['function']}"
+                )
+
+    def clear(self, directory, options):
+        removed = 0
+        for path in glob.glob(os.path.join(directory, '*' + COLLAPSED_SUFFIX)):
+            os.remove(path)
+            removed += 1
+        self.stdout.write(self.style.SUCCESS(f"Removed {removed} profiles."))
+
+    def describe(self, config):
+        endpoints = ', '.join(config['endpoints']) or 'all endpoints'
+        return f"{config['rate']:.0%} of requests to {endpoints}, sampled every {config['interval'] * 1000:g} ms"
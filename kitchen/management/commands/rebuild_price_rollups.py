@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from kitchen.prices import rebuild_price_rollups
+
+
+class Command(BaseCommand):
+    help = "Recompute the daily and weekly price roll-ups from the raw ingredient price history."
+
+    def handle(self, *args, **options):
+        written = rebuild_price_rollups()
+        self.stdout.write(self.style.SUCCESS(f"Wrote {written} price roll-ups."))
@@ -0,0 +1,56 @@
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+
+from kitchen.models import Recipe
+from kitchen.requirements import rebuild_requirements, requirement_differences
+
+
+class Command(BaseCommand):
+    help = "Rebuild or verify the stored requirements, batch_cost and cost_per_portion of every recipe."
+
+    # Stored columns keep 4 decimal places
+    TOLERANCE = Decimal('0.0001')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify',
+            action='store_true',
+            help="Only compare the stored requirements and costs with freshly computed ones and report differences.",
+        )
+
+    def handle(self, *args, **options):
+        if not options['verify']:
+            rebuild_requirements(Recipe.objects.values_list('pk', flat=True))
+            updated = Recipe.objects.all().refresh_costs()
+            self.stdout.write(self.style.SUCCESS(f"Rebuilt costs for {updated} recipes."))
+            return
+
+        # Costs are computed from the stored requirements, so check those first
+        differences = requirement_differences(Recipe.objects.values_list('pk', flat=True))
+        for recipe_id, ingredient_id, stored, expected in differences:
+            self.stdout.write(
+                f"#{recipe_id} ingredient #{ingredient_id}: stored requirement {stored}, expected {expected}"
+            )
+        stale_requirements = len({recipe_id for recipe_id, *_rest in differences})
+
+        stale = 0
+        recipes = Recipe.objects.with_costs().order_by().values_list(
+            'id', 'name', 'batch_cost', 'cost_per_portion',
+            'computed_batch_cost', 'computed_cost_per_portion'
+        )
+        for recipe_id, name, batch_cost, per_portion, computed_batch, computed_per_portion in recipes.iterator():
+            if (abs(batch_cost - computed_batch) > self.TOLERANCE
+                    or abs(per_portion - computed_per_portion) > self.TOLERANCE):
+                stale += 1
+                self.stdout.write(
+                    f"#{recipe_id} {name}: stored {batch_cost} / {per_portion}, "
+                    f"expected {computed_batch} / {computed_per_portion}"
+                )
+
+        if stale_requirements or stale:
+            raise CommandError(
+                f"{stale_requirements} recipes have stale requirements and {stale} stale costs. "
+                "Run 'manage.py rebuild_recipe_costs' to fix them."
+            )
+        self.stdout.write(self.style.SUCCESS("All stored recipe requirements and costs are up to date."))
@@ -0,0 +1,71 @@
+from decimal import Decimal, InvalidOperation
+
+from django.core.management.base import BaseCommand, CommandError
+
+from kitchen.pricing import DEFAULT_LIMIT, SimulationError, simulate_price_changes
+
+
+def _pair(value):
+    key, separator, number = value.partition('=')
+    try:
+        if not separator:
+            raise InvalidOperation
+        return key.strip(), Decimal(number)
+    except InvalidOperation:
+        raise CommandError(f"Expected KEY=NUMBER, got '{value}'")
+
+
+def _ingredient_id(key):
+    try:
+        return int(key)
+    except ValueError:
+        raise CommandError(f"Expected an ingredient id, got '{key}'")
+
+
+class Command(BaseCommand):
+    help = "Show how hypothetical ingredient prices would change recipe costs, without saving anything."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--set', dest='prices', action='append', default=[], metavar='ID=COST',
+            help="New cost_per_unit for an ingredient. Repeatable.",
+        )
+        parser.add_argument(
+            '--shift', dest='shifts', action='append', default=[], metavar='ID=PERCENT',
+            help="Percentage change of an ingredient's price. Repeatable.",
+        )
+        parser.add_argument(
+            '--unit-shift', dest='unit_shifts', action='append', default=[], metavar='UNIT=PERCENT',
+            help="Percentage change for every ingredient measured in a unit, e.g. kg=10. Repeatable.",
+        )
+        parser.add_argument('--limit', type=int, default=DEFAULT_LIMIT, help="Number of recipes to list.")
+
+    def handle(self, *args, **options):
+        changes = [
+            {'id': _ingredient_id(key), 'cost_per_unit': value}
+            for key, value in map(_pair, options['prices'])
+        ] + [
+            {'id': _ingredient_id(key), 'percent': value}
+            for key, value in map(_pair, options['shifts'])
+        ]
+        unit_shifts = dict(map(_pair, options['unit_shifts']))
+        if not changes and not unit_shifts:
+            raise CommandError("Give at least one --set, --shift or --unit-shift.")
+        if options['limit'] < 1:
+            raise CommandError("--limit must be positive.")
+
+        try:
+            result = simulate_price_changes(changes, unit_shifts, limit=options['limit'])
+        except SimulationError as exc:
+            raise CommandError(str(exc))
+
+        for recipe in result['recipes']:
+            percent = '' if recipe['percent_change'] is None else f" ({recipe['percent_change']:+}%)"
+            self.stdout.write(
+                f"#{recipe['id']} {recipe['name']}: batch {recipe['batch_cost']} -> {recipe['new_batch_cost']}"
+                f"{percent}, portion {recipe['cost_per_portion']} -> {recipe['new_cost_per_portion']}"
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f"{result['recipes_affected']} of {result['recipes_evaluated']} recipes affected, "
+            f"total batch cost change {result['total_batch_cost_delta']:+}."
+        ))
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import F
+from django.utils import timezone
+
+from kitchen.models import Ingredient
+from kitchen.stock import take_stock_snapshots
+
+
+class Command(BaseCommand):
+    help = "Record stock snapshots for the ingredients that moved since their last one. Run it periodically, e.g. daily."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify',
+            action='store_true',
+            help="Only check that every current_stock matches the balance of its stock ledger.",
+        )
+
+    def handle(self, *args, **options):
+        if not options['verify']:
+            written = take_stock_snapshots()
+            self.stdout.write(self.style.SUCCESS(f"Recorded {written} stock snapshots."))
+            return
+
+        mismatched = Ingredient.objects.with_stock_at(timezone.now()).exclude(
+            current_stock=F('stock_at')
+        ).order_by('pk').values_list('pk', 'name', 'current_stock', 'stock_at')
+        count = 0
+        for ingredient_id, name, current_stock, ledger_stock in mismatched.iterator():
+            count += 1
+            self.stdout.write(f"#{ingredient_id} {name}: current_stock {current_stock}, ledger {ledger_stock}")
+
+        if count:
+            raise CommandError(f"{count} ingredients don't match their stock ledger.")
+        self.stdout.write(self.style.SUCCESS("Every current_stock matches its stock ledger."))
@@ -0,0 +1,121 @@
+"""Sparse recipe × ingredient quantity matrix for catalog-wide calculations."""
+
+import threading
+
+import numpy as np
+from django.db.models import Count, Max
+from scipy import sparse
+
+from .models import Ingredient, Recipe, RecipeRequirement, Tombstone
+
+
+# Rows read per database round trip while building the matrix
+LOAD_CHUNK_SIZE = 5000
+
+_lock = threading.Lock()
+_cache = {}
+
+
+class RecipeMatrix:
+    """
+    Quantities of every recipe line, in the ingredient's unit, as a CSR matrix.
+
+    Row ``i`` is the recipe ``recipe_ids[i]`` and column ``j`` the ingredient
+    ``ingredient_ids[j]``; only ingredients used by some recipe get a column.
+    Both id arrays are sorted, so ids map to indexes with ``np.searchsorted``.
+    """
+
+    def __init__(self, recipe_ids, recipe_names, yields, ingredient_ids, quantities):
+        self.recipe_ids = recipe_ids
+        self.recipe_names = recipe_names
+        self.yields = yields
+        self.ingredient_ids = ingredient_ids
+        self.quantities = quantities
+
+    @property
+    def shape(self):
+        return self.quantities.shape
+
+    def ingredient_columns(self, ingredient_ids):
+        """Column index of each id, or -1 for ingredients no recipe uses."""
+        ingredient_ids = np.asarray(ingredient_ids, dtype=np.int64)
+        if not len(self.ingredient_ids):
+            return np.full(len(ingredient_ids), -1)
+        columns = np.minimum(np.searchsorted(self.ingredient_ids, ingredient_ids), len(self.ingredient_ids) - 1)
+        return np.where(self.ingredient_ids[columns] == ingredient_ids, columns, -1)
+
+    def per_portion(self, batch_values):
+        """Divide batch values by each recipe's yield, with 0 for recipes without yield."""
+        return np.divide(batch_values, self.yields, out=np.zeros_like(batch_values), where=self.yields > 0)
+
+
+def _signature():
+    # Every requirement change re-costs its recipe, which bumps the recipe's updated_at
+    stats = Recipe.objects.order_by().aggregate(count=Count('pk'), last_updated=Max('updated_at'))
+    last_deleted = Tombstone.objects.filter(model='recipe').aggregate(last=Max('deleted_at'))['last']
+    return stats['count'], stats['last_updated'], last_deleted
+
+
+def _build():
+    recipes = list(Recipe.objects.order_by('pk').values_list('pk', 'name', 'yield_portions'))
+    recipe_ids = np.fromiter((pk for pk, _name, _yield in recipes), dtype=np.int64, count=len(recipes))
+    recipe_names = [name for _pk, name, _yield in recipes]
+    yields = np.fromiter((portions for _pk, _name, portions in recipes), dtype=float, count=len(recipes))
+
+    rows, columns, quantities = [], [], []
+    # Zero quantities would only be explicit zeros, and divide by zero in stock caps
+    lines = RecipeRequirement.objects.filter(quantity__gt=0).order_by().values_list(
+        'recipe_id', 'ingredient_id', 'quantity'
+    )
+    for recipe_id, ingredient_id, quantity in lines.iterator(chunk_size=LOAD_CHUNK_SIZE):
+        rows.append(recipe_id)
+        columns.append(ingredient_id)
+        quantities.append(float(quantity))
+
+    rows = np.searchsorted(recipe_ids, np.array(rows, dtype=np.int64))
+    ingredient_ids, columns = np.unique(np.array(columns, dtype=np.int64), return_inverse=True)
+    matrix = sparse.csr_matrix(
+        (np.array(quantities, dtype=float), (rows, columns)),
+        shape=(len(recipe_ids), len(ingredient_ids)),
+    )
+    return RecipeMatrix(recipe_ids, recipe_names, yields, ingredient_ids, matrix)
+
+
+def load_recipe_matrix():
+    """
+    Return the current ``RecipeMatrix``.
+
+    The matrix is built from all ``RecipeRequirement`` rows in one pass and kept
+    per process until a recipe or one of its requirements changes, so repeated calls
+    cost a single aggregate query.
+    """
+    signature = _signature()
+    with _lock:
+        if _cache.get('signature') == signature:
+            return _cache['matrix']
+    matrix = _build()
+    with _lock:
+        _cache['signature'] = signature
+        _cache['matrix'] = matrix
+    return matrix
+
+
+def load_ingredient_columns(matrix, *fields):
+    """
+    Load ``fields`` of the ingredients that have a column in ``matrix``.
+
+    Returns one array per field aligned with ``matrix.ingredient_ids``; decimal
+    fields become floats. Prices and stock are read fresh on every call since
+    they change far more often than recipes.
+    """
+    rows = list(Ingredient.objects.order_by().values_list('pk', *fields))
+    columns = matrix.ingredient_columns([row[0] for row in rows])
+    used = columns >= 0
+    arrays = []
+    for position, field in enumerate(fields, start=1):
+        numeric = Ingredient._meta.get_field(field).get_internal_type() == 'DecimalField'
+        array = np.zeros(len(matrix.ingredient_ids), dtype=float if numeric else object)
+        values = np.array([row[position] for row in rows], dtype=float if numeric else object)
+        array[columns[used]] = values[used]
+        arrays.append(array)
+    return arrays
@@ -0,0 +1,48 @@
+# Generated by Django 4.2 on 2026-10-16 20:28
+
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import Case, F, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+
+
+def populate_recipe_costs(apps, schema_editor):
+    Recipe = apps.get_model('kitchen', 'Recipe')
+    RecipeIngredient = apps.get_model('kitchen', 'RecipeIngredient')
+    cost_field = models.DecimalField(max_digits=20, decimal_places=5)
+    line_costs = RecipeIngredient.objects.filter(
+        recipe=OuterRef('pk')
+    ).order_by().values('recipe').annotate(
+        total=Sum(F('quantity') * F('ingredient__cost_per_unit'), output_field=cost_field)
+    ).values('total')
+    batch_cost = Coalesce(Subquery(line_costs, output_field=cost_field), Value(Decimal('0')), output_field=cost_field)
+    Recipe.objects.update(
+        batch_cost=batch_cost,
+        cost_per_portion=Case(
+            When(yield_portions=0, then=Value(Decimal('0'))),
+            default=batch_cost / F('yield_portions'),
+            output_field=cost_field
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('kitchen', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='batch_cost',
+            field=models.DecimalField(decimal_places=4, default=0, editable=False, help_text='Calculado automáticamente a partir de los ingredientes', max_digits=14, verbose_name='Costo del lote'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='cost_per_portion',
+            field=models.DecimalField(decimal_places=4, default=0, editable=False, help_text='Calculado automáticamente a partir del costo del lote', max_digits=14, verbose_name='Costo por porción'),
+        ),
+        migrations.RunPython(populate_recipe_costs, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 4.2 on 2026-10-16 20:29
+
+from django.db import migrations, models
+
+
+# Trigram indexes matching the UPPER(column::text) LIKE expressions that
+# Django generates for icontains lookups on PostgreSQL.
+TRIGRAM_INDEXES = [
+    ('kitchen_ingredient_name_trgm', 'kitchen_ingredient', 'name'),
+    ('kitchen_recipe_name_trgm', 'kitchen_recipe', 'name'),
+    ('kitchen_recipe_description_trgm', 'kitchen_recipe', 'description'),
+]
+
+
+def create_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for index_name, table, column in TRIGRAM_INDEXES:
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS {index_name} ON {table} '
+            f'USING gin (UPPER({column}::text) gin_trgm_ops)'
+        )
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for index_name, _table, _column in TRIGRAM_INDEXES:
+        schema_editor.execute(f'DROP INDEX IF EXISTS {index_name}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('kitchen', '0002_recipe_cost_cache'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='ingredient',
+            index=models.Index(fields=['current_stock'], name='ingredient_stock_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ingredient',
+            index=models.Index(fields=['cost_per_unit'], name='ingredient_cost_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['cost_per_portion'], name='recipe_cost_per_portion_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['batch_cost'], name='recipe_batch_cost_idx'),
+        ),
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 4.2 on 2026-10-16 20:35
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('kitchen', '0003_search_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Tombstone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model', models.CharField(choices=[('ingredient', 'Ingrediente'), ('recipe', 'Receta')], max_length=20, verbose_name='Modelo')),
+                ('object_id', models.BigIntegerField(verbose_name='ID del objeto')),
+                ('deleted_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Eliminado el')),
+            ],
+            options={
+                'verbose_name': 'Registro de eliminación',
+                'verbose_name_plural': 'Registros de eliminación',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='ingredient',
+            index=models.Index(fields=['updated_at', 'id'], name='ingredient_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['updated_at', 'id'], name='recipe_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tombstone',
+            index=models.Index(fields=['model', 'deleted_at'], name='tombstone_model_deleted_idx'),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 4.2 on 2026-10-16 20:43
+
+from decimal import Decimal
+import django.core.validators
+from django.db import migrations, models
+from django.db.models import F
+
+
+def populate_line_units(apps, schema_editor):
+    # Existing quantities are expressed in the ingredient's own unit
+    Ingredient = apps.get_model('kitchen', 'Ingredient')
+    RecipeIngredient = apps.get_model('kitchen', 'RecipeIngredient')
+    for unit in Ingredient.objects.order_by().values_list('unit', flat=True).distinct():
+        RecipeIngredient.objects.filter(ingredient__unit=unit).update(unit=unit, base_quantity=F('quantity'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('kitchen', '0004_delta_sync'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ingredient',
+            name='density',
+            field=models.DecimalField(blank=True, decimal_places=4, help_text='Gramos por mililitro; permite usar unidades de peso y de volumen en las recetas', max_digits=8, null=True, validators=[django.core.validators.MinValueValidator(Decimal('0.0001'))], verbose_name='Densidad'),
+        ),
+        migrations.AddField(
+            model_name='recipeingredient',
+            name='base_quantity',
+            field=models.DecimalField(decimal_places=6, default=0, editable=False, help_text='Calculada a partir de la cantidad y la unidad; se usa para costos y stock', max_digits=18, verbose_name='Cantidad en la unidad del ingrediente'),
+        ),
+        migrations.AddField(
+            model_name='recipeingredient',
+            name='unit',
+            field=models.CharField(blank=True, choices=[('g', 'Gramos'), ('kg', 'Kilogramos'), ('ml', 'Mililitros'), ('l', 'Litros'), ('u', 'Unidades'), ('cup', 'Tazas'), ('tbsp', 'Cucharadas'), ('tsp', 'Cucharaditas')], help_text='Unidad de la cantidad; por defecto, la del ingrediente', max_length=10, verbose_name='Unidad'),
+        ),
+        migrations.RunPython(populate_line_units, migrations.RunPython.noop),
+    ]
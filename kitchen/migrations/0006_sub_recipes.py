@@ -0,0 +1,68 @@
+# Generated by Django 4.2 on 2026-10-16 20:49
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def populate_requirements(apps, schema_editor):
+    # Without preparations yet, a recipe's requirements are its own lines
+    RecipeIngredient = apps.get_model('kitchen', 'RecipeIngredient')
+    RecipeRequirement = apps.get_model('kitchen', 'RecipeRequirement')
+    RecipeRequirement.objects.bulk_create(
+        (
+            RecipeRequirement(recipe_id=recipe_id, ingredient_id=ingredient_id, quantity=quantity)
+            for recipe_id, ingredient_id, quantity in RecipeIngredient.objects.order_by().values_list(
+                'recipe_id', 'ingredient_id', 'base_quantity'
+            ).iterator()
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('kitchen', '0005_unit_conversion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecipeRequirement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.DecimalField(decimal_places=6, help_text='En la unidad del ingrediente', max_digits=18, verbose_name='Cantidad')),
+                ('ingredient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='requirements', to='kitchen.ingredient', verbose_name='Ingrediente')),
+                ('recipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='requirements', to='kitchen.recipe', verbose_name='Receta')),
+            ],
+            options={
+                'verbose_name': 'Requerimiento de Receta',
+                'verbose_name_plural': 'Requerimientos de Receta',
+            },
+        ),
+        migrations.CreateModel(
+            name='RecipeComponent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('portions', models.DecimalField(decimal_places=3, help_text='Porciones de la preparación que necesita un lote de la receta', max_digits=10, verbose_name='Porciones')),
+                ('component', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='used_in', to='kitchen.recipe', verbose_name='Preparación')),
+                ('parent', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='components', to='kitchen.recipe', verbose_name='Receta')),
+            ],
+            options={
+                'verbose_name': 'Preparación de Receta',
+                'verbose_name_plural': 'Preparaciones de Receta',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='reciperequirement',
+            index=models.Index(fields=['ingredient', 'recipe'], name='requirement_ingredient_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='reciperequirement',
+            unique_together={('recipe', 'ingredient')},
+        ),
+        migrations.AlterUniqueTogether(
+            name='recipecomponent',
+            unique_together={('parent', 'component')},
+        ),
+        migrations.RunPython(populate_requirements, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,70 @@
+# Generated by Django 4.2 on 2026-10-16 20:54
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+def open_ledger(apps, schema_editor):
+    # The stock held so far becomes each ingredient's opening movement
+    Ingredient = apps.get_model('kitchen', 'Ingredient')
+    StockMovement = apps.get_model('kitchen', 'StockMovement')
+    now = django.utils.timezone.now()
+    StockMovement.objects.bulk_create(
+        (
+            StockMovement(ingredient_id=pk, kind='adjustment', quantity=stock, note="Saldo inicial", created_at=now)
+            for pk, stock in Ingredient.objects.exclude(current_stock=0).values_list('pk', 'current_stock').iterator()
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('kitchen', '0006_sub_recipes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='ingredient',
+            name='current_stock',
+            field=models.DecimalField(decimal_places=2, default=0, help_text='Cantidad disponible en inventario; saldo de los movimientos de stock', max_digits=10, verbose_name='Stock actual'),
+        ),
+        migrations.CreateModel(
+            name='StockMovement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('receipt', 'Entrada'), ('consumption', 'Consumo'), ('waste', 'Merma'), ('adjustment', 'Ajuste')], max_length=20, verbose_name='Tipo')),
+                ('quantity', models.DecimalField(decimal_places=2, help_text='Positiva si entra stock, negativa si sale', max_digits=12, verbose_name='Cantidad')),
+                ('note', models.CharField(blank=True, max_length=200, verbose_name='Nota')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Fecha')),
+                ('ingredient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='movements', to='kitchen.ingredient', verbose_name='Ingrediente')),
+                ('recipe', models.ForeignKey(blank=True, help_text='Receta producida, en los consumos de producción', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='stock_movements', to='kitchen.recipe', verbose_name='Receta')),
+            ],
+            options={
+                'verbose_name': 'Movimiento de stock',
+                'verbose_name_plural': 'Movimientos de stock',
+                'ordering': ['-created_at', '-id'],
+            },
+        ),
+        migrations.CreateModel(
+            name='StockSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('taken_at', models.DateTimeField(verbose_name='Fecha')),
+                ('balance', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='Stock')),
+                ('ingredient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_snapshots', to='kitchen.ingredient', verbose_name='Ingrediente')),
+            ],
+            options={
+                'verbose_name': 'Cierre de stock',
+                'verbose_name_plural': 'Cierres de stock',
+                'unique_together': {('ingredient', 'taken_at')},
+            },
+        ),
+        migrations.AddIndex(
+            model_name='stockmovement',
+            index=models.Index(fields=['ingredient', 'created_at'], name='movement_ingredient_idx'),
+        ),
+        migrations.RunPython(open_ledger, migrations.RunPython.noop),
+    ]
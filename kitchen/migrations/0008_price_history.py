@@ -0,0 +1,73 @@
+# Generated by Django 4.2 on 2026-10-16 20:58
+
+from datetime import timedelta
+
+from django.db import migrations, models
+from django.utils import timezone
+import django.db.models.deletion
+
+
+def seed_prices(apps, schema_editor):
+    # Only the current price is known: it is taken as valid since the ingredient was created
+    Ingredient = apps.get_model('kitchen', 'Ingredient')
+    IngredientPrice = apps.get_model('kitchen', 'IngredientPrice')
+    IngredientPriceRollup = apps.get_model('kitchen', 'IngredientPriceRollup')
+    prices = []
+    rollups = []
+    for pk, cost, created_at in Ingredient.objects.values_list('pk', 'cost_per_unit', 'created_at').iterator():
+        prices.append(IngredientPrice(ingredient_id=pk, cost_per_unit=cost, effective_at=created_at))
+        day = timezone.localdate(created_at)
+        for period, start in (('day', day), ('week', day - timedelta(days=day.weekday()))):
+            rollups.append(IngredientPriceRollup(
+                ingredient_id=pk, period=period, period_start=start,
+                open=cost, high=cost, low=cost, close=cost, changes=1,
+            ))
+    IngredientPrice.objects.bulk_create(prices, batch_size=1000)
+    IngredientPriceRollup.objects.bulk_create(rollups, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('kitchen', '0007_stock_ledger'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IngredientPrice',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cost_per_unit', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='Costo por unidad')),
+                ('effective_at', models.DateTimeField(verbose_name='Vigente desde')),
+                ('ingredient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='prices', to='kitchen.ingredient', verbose_name='Ingrediente')),
+            ],
+            options={
+                'verbose_name': 'Precio de ingrediente',
+                'verbose_name_plural': 'Historial de precios',
+            },
+        ),
+        migrations.CreateModel(
+            name='IngredientPriceRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('day', 'Día'), ('week', 'Semana')], max_length=10, verbose_name='Periodo')),
+                ('period_start', models.DateField(help_text='Lunes para los periodos semanales', verbose_name='Inicio del periodo')),
+                ('open', models.DecimalField(decimal_places=2, help_text='Precio vigente al empezar el periodo', max_digits=10, verbose_name='Apertura')),
+                ('high', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='Máximo')),
+                ('low', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='Mínimo')),
+                ('close', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='Cierre')),
+                ('changes', models.PositiveIntegerField(default=0, verbose_name='Cambios de precio')),
+                ('ingredient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='price_rollups', to='kitchen.ingredient', verbose_name='Ingrediente')),
+            ],
+            options={
+                'verbose_name': 'Resumen de precios',
+                'verbose_name_plural': 'Resúmenes de precios',
+                'unique_together': {('ingredient', 'period', 'period_start')},
+            },
+        ),
+        migrations.AddIndex(
+            model_name='ingredientprice',
+            index=models.Index(fields=['ingredient', 'effective_at'], name='price_ingredient_idx'),
+        ),
+        migrations.RunPython(seed_prices, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2 on 2026-10-16 21:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('kitchen', '0008_price_history'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='recipeingredient',
+            index=models.Index(fields=['ingredient', 'recipe'], name='line_ingredient_recipe_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2 on 2026-10-16 21:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('kitchen', '0009_recipe_line_ingredient_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='stockmovement',
+            index=models.Index(fields=['-created_at', '-id'], name='movement_created_idx'),
+        ),
+    ]
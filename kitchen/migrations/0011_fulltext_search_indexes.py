@@ -0,0 +1,34 @@
+from django.db import migrations
+
+
+# ngram FULLTEXT indexes for the MATCH ... AGAINST searches that
+# IndexedSearchFilter runs on MySQL, one per view's fulltext_search_fields.
+FULLTEXT_INDEXES = [
+    ('kitchen_ingredient_name_ft', 'kitchen_ingredient', 'name'),
+    ('kitchen_recipe_name_description_ft', 'kitchen_recipe', 'name, description'),
+]
+
+
+def create_fulltext_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'mysql':
+        return
+    for index_name, table, columns in FULLTEXT_INDEXES:
+        schema_editor.execute(f'CREATE FULLTEXT INDEX {index_name} ON {table} ({columns}) WITH PARSER ngram')
+
+
+def drop_fulltext_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'mysql':
+        return
+    for index_name, table, _columns in FULLTEXT_INDEXES:
+        schema_editor.execute(f'DROP INDEX {index_name} ON {table}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('kitchen', '0010_stock_movement_created_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fulltext_indexes, drop_fulltext_indexes),
+    ]
@@ -1,5 +1,77 @@
+from django.core.exceptions import ValidationError
+from django.core.validators import MinValueValidator
 from django.db import models
-from decimal import Decimal
+from django.db.models import (
+    Case, Count, ExpressionWrapper, F, Min, OuterRef, Q, Subquery, Sum, Value, When
+)
+from django.db.models.functions import Cast, Coalesce, Floor, Greatest
+from django.utils import timezone
+from datetime import datetime, timezone as dt_timezone
+from decimal import ROUND_HALF_UP, Decimal
+
+from .units import can_convert, conversion_factor
+
+
+# Output field used for cost expressions computed in the database. It is wider
+# than the model fields so intermediate sums do not overflow or lose precision.
+COST_FIELD = models.DecimalField(max_digits=20, decimal_places=5)
+
+# RecipeIngredient.base_quantity keeps this many decimal places
+BASE_QUANTITY_PLACES = Decimal('0.000001')
+
+# Ingredient.current_stock and the stock movements keep this many decimal places
+STOCK_PLACES = Decimal('0.01')
+
+# Output field for stock sums computed in the database
+STOCK_FIELD = models.DecimalField(max_digits=14, decimal_places=2)
+
+# Earlier than any stock movement, for ingredients without a snapshot yet
+LEDGER_START = datetime(2000, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def price_at(moment, ingredient=OuterRef('pk')):
+    """Subquery for the ``cost_per_unit`` in effect at ``moment`` for the outer query's ingredient."""
+    return Subquery(
+        IngredientPrice.objects.filter(
+            ingredient=ingredient, effective_at__lte=moment
+        ).order_by('-effective_at', '-id').values('cost_per_unit')[:1],
+        output_field=models.DecimalField(max_digits=10, decimal_places=2)
+    )
+
+
+class IngredientQuerySet(models.QuerySet):
+    """QuerySet with database-side stock and price history calculations for ingredients."""
+
+    def with_stock_at(self, moment):
+        """
+        Annotate ``stock_at``, the stock of each ingredient at ``moment``.
+
+        Starts from the latest snapshot taken at or before ``moment`` and adds
+        the movements recorded after it, so the rows read per ingredient are
+        bounded by the snapshot interval instead of the size of the ledger.
+        """
+        snapshots = StockSnapshot.objects.filter(
+            ingredient=OuterRef('pk'), taken_at__lte=moment
+        ).order_by('-taken_at')
+        since = Coalesce(OuterRef('snapshot_taken_at'), Value(LEDGER_START), output_field=models.DateTimeField())
+        movements = StockMovement.objects.filter(
+            ingredient=OuterRef('pk'), created_at__gt=since, created_at__lte=moment
+        ).order_by().values('ingredient').annotate(
+            total=Sum('quantity', output_field=STOCK_FIELD)
+        ).values('total')
+        return self.annotate(
+            snapshot_taken_at=Subquery(snapshots.values('taken_at')[:1]),
+        ).annotate(
+            stock_at=ExpressionWrapper(
+                Coalesce(Subquery(snapshots.values('balance')[:1]), Value(Decimal('0')), output_field=STOCK_FIELD)
+                + Coalesce(Subquery(movements, output_field=STOCK_FIELD), Value(Decimal('0')), output_field=STOCK_FIELD),
+                output_field=STOCK_FIELD
+            ),
+        )
+
+    def with_price_at(self, moment):
+        """Annotate ``price_at``, the ``cost_per_unit`` in effect at ``moment`` (``None`` before the first price)."""
+        return self.annotate(price_at=price_at(moment))
 
 
 class Ingredient(models.Model):
@@ -29,18 +101,178 @@ class Ingredient(models.Model):
         decimal_places=2, 
         default=0, 
         verbose_name="Stock actual",
-        help_text="Cantidad disponible en inventario"
+        help_text="Cantidad disponible en inventario; saldo de los movimientos de stock"
+    )
+    density = models.DecimalField(
+        max_digits=8, 
+        decimal_places=4, 
+        null=True, 
+        blank=True, 
+        validators=[MinValueValidator(Decimal('0.0001'))],
+        verbose_name="Densidad",
+        help_text="Gramos por mililitro; permite usar unidades de peso y de volumen en las recetas"
     )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    objects = IngredientQuerySet.as_manager()
+    
     class Meta:
         verbose_name = "Ingrediente"
         verbose_name_plural = "Ingredientes"
         ordering = ['name']
+        indexes = [
+            models.Index(fields=['updated_at', 'id'], name='ingredient_updated_idx'),
+            models.Index(fields=['current_stock'], name='ingredient_stock_idx'),
+            models.Index(fields=['cost_per_unit'], name='ingredient_cost_idx'),
+        ]
     
     def __str__(self):
         return f"{self.name} ({self.get_unit_display()})"
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the loaded price so saves can tell whether it changed
+        if 'cost_per_unit' in field_names:
+            instance._loaded_cost_per_unit = instance.cost_per_unit
+        # ...and whether its recipe lines need converting again
+        if 'unit' in field_names and 'density' in field_names:
+            instance._loaded_conversion = (instance.unit, instance.density)
+        return instance
+    
+    @property
+    def cost_changed(self):
+        """Whether ``cost_per_unit`` differs from the value loaded from the database."""
+        if not hasattr(self, '_loaded_cost_per_unit'):
+            return True
+        return Decimal(str(self.cost_per_unit)) != self._loaded_cost_per_unit
+    
+    @property
+    def conversion_changed(self):
+        """Whether ``unit`` or ``density`` differ from the values loaded from the database."""
+        if not hasattr(self, '_loaded_conversion'):
+            return True
+        density = None if self.density is None else Decimal(str(self.density))
+        return (self.unit, density) != self._loaded_conversion
+    
+    def unconvertible_line_units(self, unit=None, density=None):
+        """Units used by recipe lines of this ingredient that can't be converted to ``unit``."""
+        if self.pk is None:
+            return []
+        unit = unit or self.unit
+        line_units = self.recipeingredient_set.order_by().values_list('unit', flat=True).distinct()
+        return sorted(line_unit for line_unit in line_units if not can_convert(line_unit, unit, density))
+    
+    def clean(self):
+        super().clean()
+        if self.unit:
+            invalid = self.unconvertible_line_units(self.unit, self.density)
+            if invalid:
+                raise ValidationError({
+                    'unit': f"Hay recetas que usan este ingrediente en {', '.join(invalid)}, "
+                            f"que no se puede convertir a {self.unit}."
+                })
+    
+    def refresh_base_quantities(self):
+        """Convert the quantities of this ingredient's recipe lines to its current unit."""
+        line_units = self.recipeingredient_set.order_by().values_list('unit', flat=True).distinct()
+        factors = {
+            line_unit: conversion_factor(line_unit, self.unit, self.density)
+            for line_unit in line_units if can_convert(line_unit, self.unit, self.density)
+        }
+        if not factors:
+            return 0
+        return self.recipeingredient_set.filter(unit__in=factors).update(
+            base_quantity=Case(
+                *[When(unit=line_unit, then=F('quantity') * Value(factor)) for line_unit, factor in factors.items()],
+                output_field=RecipeIngredient._meta.get_field('base_quantity')
+            )
+        )
+
+
+class RecipeQuerySet(models.QuerySet):
+    """QuerySet with database-side cost and stock calculations for recipes."""
+
+    def with_costs(self):
+        """
+        Annotate batch cost and cost per portion computed from the recipe lines.
+
+        The values are computed with SQL aggregates, so a whole page of
+        recipes is costed in a single query. They are the reference used to
+        rebuild and verify the stored ``batch_cost`` and ``cost_per_portion``
+        columns.
+        """
+        line_cost = ExpressionWrapper(
+            F('requirements__quantity') * F('requirements__ingredient__cost_per_unit'),
+            output_field=COST_FIELD
+        )
+        return self.annotate(
+            computed_line_count=Count('requirements'),
+            computed_batch_cost=Coalesce(Sum(line_cost), Value(Decimal('0')), output_field=COST_FIELD),
+        ).annotate(
+            computed_cost_per_portion=Case(
+                When(yield_portions=0, then=Value(Decimal('0'))),
+                default=F('computed_batch_cost') / F('yield_portions'),
+                output_field=COST_FIELD
+            ),
+        )
+
+    def with_producible(self):
+        """
+        Annotate the batches and portions that can be produced with current stock.
+
+        Stock changes far more often than prices, so these values are always
+        computed with SQL aggregates instead of being stored. The annotations
+        are read by ``Recipe.producible_portions`` when present.
+        """
+        available_batches = ExpressionWrapper(
+            F('requirements__ingredient__current_stock') / F('requirements__quantity'),
+            output_field=COST_FIELD
+        )
+        return self.annotate(
+            computed_producible_batches=Cast(
+                Greatest(
+                    Coalesce(
+                        Floor(Min(available_batches, filter=Q(requirements__quantity__gt=0))),
+                        Value(Decimal('0')),
+                        output_field=COST_FIELD
+                    ),
+                    Value(Decimal('0')),
+                    output_field=COST_FIELD
+                ),
+                models.IntegerField()
+            ),
+        ).annotate(
+            computed_producible_portions=ExpressionWrapper(
+                F('computed_producible_batches') * F('yield_portions'),
+                output_field=models.IntegerField()
+            ),
+        )
+
+    def refresh_costs(self):
+        """
+        Recompute the stored cost columns of the recipes in this queryset.
+
+        Runs as a single UPDATE statement with correlated subqueries, so it
+        never loads the recipes or their lines into Python. ``updated_at`` is
+        bumped so delta sync clients pick up the new costs.
+        """
+        line_costs = RecipeRequirement.objects.filter(
+            recipe=OuterRef('pk')
+        ).order_by().values('recipe').annotate(
+            total=Sum(F('quantity') * F('ingredient__cost_per_unit'), output_field=COST_FIELD)
+        ).values('total')
+        batch_cost = Coalesce(Subquery(line_costs, output_field=COST_FIELD), Value(Decimal('0')), output_field=COST_FIELD)
+        return self.update(
+            batch_cost=batch_cost,
+            cost_per_portion=Case(
+                When(yield_portions=0, then=Value(Decimal('0'))),
+                default=batch_cost / F('yield_portions'),
+                output_field=COST_FIELD
+            ),
+            updated_at=timezone.now(),
+        )
 
 
 class Recipe(models.Model):
@@ -57,46 +289,53 @@ class Recipe(models.Model):
         null=True, 
         verbose_name="Tiempo de preparación (minutos)"
     )
+    batch_cost = models.DecimalField(
+        max_digits=14, 
+        decimal_places=4, 
+        default=0, 
+        editable=False, 
+        verbose_name="Costo del lote",
+        help_text="Calculado automáticamente a partir de los ingredientes"
+    )
+    cost_per_portion = models.DecimalField(
+        max_digits=14, 
+        decimal_places=4, 
+        default=0, 
+        editable=False, 
+        verbose_name="Costo por porción",
+        help_text="Calculado automáticamente a partir del costo del lote"
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    objects = RecipeQuerySet.as_manager()
+    
     class Meta:
         verbose_name = "Receta"
         verbose_name_plural = "Recetas"
         ordering = ['name']
+        indexes = [
+            models.Index(fields=['updated_at', 'id'], name='recipe_updated_idx'),
+            models.Index(fields=['cost_per_portion'], name='recipe_cost_per_portion_idx'),
+            models.Index(fields=['batch_cost'], name='recipe_batch_cost_idx'),
+        ]
     
     def __str__(self):
         return f"{self.name} ({self.yield_portions} porciones)"
     
-    @property
-    def batch_cost(self):
-        """Calculate the total cost of the recipe batch."""
-        total_cost = Decimal('0')
-        for recipe_ingredient in self.recipeingredient_set.all():
-            ingredient_cost = recipe_ingredient.quantity * recipe_ingredient.ingredient.cost_per_unit
-            total_cost += ingredient_cost
-        return total_cost
-    
-    @property
-    def cost_per_portion(self):
-        """Calculate the cost per portion."""
-        if self.yield_portions == 0:
-            return Decimal('0')
-        return self.batch_cost / Decimal(str(self.yield_portions))
-    
     @property
     def producible_portions(self):
         """Calculate how many portions can be produced with current stock."""
-        if not self.recipeingredient_set.exists():
-            return 0
-            
+        if hasattr(self, 'computed_producible_portions'):
+            return self.computed_producible_portions
+        
         min_portions = None
         
-        for recipe_ingredient in self.recipeingredient_set.all():
-            if recipe_ingredient.quantity == 0:
+        for requirement in self.requirements.select_related('ingredient'):
+            if requirement.quantity == 0:
                 continue
                 
-            available_portions = recipe_ingredient.ingredient.current_stock / recipe_ingredient.quantity
+            available_portions = requirement.ingredient.current_stock / requirement.quantity
             if min_portions is None:
                 min_portions = available_portions
             else:
@@ -106,7 +345,53 @@ class Recipe(models.Model):
             return 0
             
         # Return the number of complete batches possible
-        return int(min_portions) * int(self.yield_portions)
+        return max(int(min_portions), 0) * int(self.yield_portions)
+    
+    def cost_breakdown(self):
+        """
+        Cost of each line and preparation of the recipe and its share of the batch cost.
+        
+        Reads the prefetched lines and preparations when present. The stored
+        batch cost is read once and shared by every entry.
+        """
+        batch_cost = self.batch_cost
+        
+        def share(cost):
+            return cost / batch_cost * 100 if batch_cost > 0 else 0
+        
+        ingredients = []
+        for line in self.recipeingredient_set.all():
+            total_cost = line.total_cost
+            ingredients.append({
+                'name': line.ingredient.name,
+                'quantity': line.quantity,
+                'unit': line.get_unit_display(),
+                'base_quantity': line.base_quantity,
+                'ingredient_unit': line.ingredient.get_unit_display(),
+                'cost_per_unit': line.ingredient.cost_per_unit,
+                'total_cost': total_cost,
+                'percentage_of_total': share(total_cost)
+            })
+        
+        components = []
+        for component in self.components.all():
+            total_cost = component.total_cost
+            components.append({
+                'name': component.component.name,
+                'portions': component.portions,
+                'cost_per_portion': component.component.cost_per_portion,
+                'total_cost': total_cost,
+                'percentage_of_total': share(total_cost)
+            })
+        
+        return {
+            'recipe_name': self.name,
+            'yield_portions': self.yield_portions,
+            'batch_cost': batch_cost,
+            'cost_per_portion': self.cost_per_portion,
+            'ingredients': ingredients,
+            'components': components
+        }
 
 
 class RecipeIngredient(models.Model):
@@ -120,19 +405,69 @@ class RecipeIngredient(models.Model):
         verbose_name="Cantidad",
         help_text="Cantidad necesaria del ingrediente"
     )
+    unit = models.CharField(
+        max_length=10, 
+        choices=Ingredient.UNIT_CHOICES, 
+        blank=True, 
+        verbose_name="Unidad",
+        help_text="Unidad de la cantidad; por defecto, la del ingrediente"
+    )
+    base_quantity = models.DecimalField(
+        max_digits=18, 
+        decimal_places=6, 
+        default=0, 
+        editable=False, 
+        verbose_name="Cantidad en la unidad del ingrediente",
+        help_text="Calculada a partir de la cantidad y la unidad; se usa para costos y stock"
+    )
     
     class Meta:
         verbose_name = "Ingrediente de Receta"
         verbose_name_plural = "Ingredientes de Receta"
         unique_together = ('recipe', 'ingredient')
+        indexes = [
+            models.Index(fields=['ingredient', 'recipe'], name='line_ingredient_recipe_idx'),
+        ]
     
     def __str__(self):
-        return f"{self.recipe.name} - {self.quantity} {self.ingredient.get_unit_display()} de {self.ingredient.name}"
+        unit = self.get_unit_display() if self.unit else self.ingredient.get_unit_display()
+        return f"{self.recipe.name} - {self.quantity} {unit} de {self.ingredient.name}"
+    
+    def set_base_quantity(self, ingredient=None):
+        """
+        Fill in ``unit`` and convert ``quantity`` to the ingredient's unit.
+        
+        Pass ``ingredient`` to avoid loading it again for bulk writes. Raises
+        ``UnitConversionError`` when the units can't be converted.
+        """
+        ingredient = ingredient or self.ingredient
+        if not self.unit:
+            self.unit = ingredient.unit
+        factor = conversion_factor(self.unit, ingredient.unit, ingredient.density)
+        self.base_quantity = (Decimal(str(self.quantity)) * factor).quantize(
+            BASE_QUANTITY_PLACES, rounding=ROUND_HALF_UP
+        )
+    
+    def clean(self):
+        super().clean()
+        if self.ingredient_id and self.unit:
+            ingredient = self.ingredient
+            if not can_convert(self.unit, ingredient.unit, ingredient.density):
+                raise ValidationError({
+                    'unit': f"No se puede convertir {self.unit} a la unidad del ingrediente ({ingredient.unit})."
+                })
+    
+    def save(self, *args, **kwargs):
+        self.set_base_quantity()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = {*update_fields, 'unit', 'base_quantity'}
+        super().save(*args, **kwargs)
     
     @property
     def total_cost(self):
         """Calculate the total cost of this ingredient in the recipe."""
-        return self.quantity * self.ingredient.cost_per_unit
+        return self.base_quantity * self.ingredient.cost_per_unit
     
     @property
     def available_stock(self):
@@ -142,4 +477,256 @@ class RecipeIngredient(models.Model):
     @property
     def is_sufficient(self):
         """Check if there's enough stock for this ingredient."""
-        return self.ingredient.current_stock >= self.quantity
\ No newline at end of file
+        return self.ingredient.current_stock >= self.base_quantity
+
+
+class RecipeComponent(models.Model):
+    """Model to use a recipe (a preparation such as a stock, sauce or dough) inside another recipe."""
+    
+    parent = models.ForeignKey(
+        Recipe, 
+        on_delete=models.CASCADE, 
+        related_name='components', 
+        verbose_name="Receta"
+    )
+    component = models.ForeignKey(
+        Recipe, 
+        on_delete=models.CASCADE, 
+        related_name='used_in', 
+        verbose_name="Preparación"
+    )
+    portions = models.DecimalField(
+        max_digits=10, 
+        decimal_places=3, 
+        verbose_name="Porciones",
+        help_text="Porciones de la preparación que necesita un lote de la receta"
+    )
+    
+    class Meta:
+        verbose_name = "Preparación de Receta"
+        verbose_name_plural = "Preparaciones de Receta"
+        unique_together = ('parent', 'component')
+    
+    def __str__(self):
+        return f"{self.parent.name} - {self.portions} porciones de {self.component.name}"
+    
+    def clean(self):
+        super().clean()
+        from .requirements import cycle_components
+        if self.parent_id and self.component_id and cycle_components(self.parent_id, [self.component_id]):
+            raise ValidationError({
+                'component': "La preparación ya usa esta receta; se formaría un ciclo."
+            })
+    
+    @property
+    def total_cost(self):
+        """Cost of the portions of the preparation used by the recipe."""
+        return self.portions * self.component.cost_per_portion
+
+
+class RecipeRequirement(models.Model):
+    """
+    Ingredient quantity needed by one batch of a recipe, preparations included.
+    
+    Rows are maintained by ``kitchen.requirements`` from the recipe lines and
+    components, so cost and stock calculations are single SQL aggregates
+    however deep the preparations are nested.
+    """
+    
+    recipe = models.ForeignKey(
+        Recipe, 
+        on_delete=models.CASCADE, 
+        related_name='requirements', 
+        verbose_name="Receta"
+    )
+    ingredient = models.ForeignKey(
+        Ingredient, 
+        on_delete=models.CASCADE, 
+        related_name='requirements', 
+        verbose_name="Ingrediente"
+    )
+    quantity = models.DecimalField(
+        max_digits=18, 
+        decimal_places=6, 
+        verbose_name="Cantidad",
+        help_text="En la unidad del ingrediente"
+    )
+    
+    class Meta:
+        verbose_name = "Requerimiento de Receta"
+        verbose_name_plural = "Requerimientos de Receta"
+        unique_together = ('recipe', 'ingredient')
+        indexes = [
+            models.Index(fields=['ingredient', 'recipe'], name='requirement_ingredient_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.recipe.name} - {self.quantity} {self.ingredient.get_unit_display()} de {self.ingredient.name}"
+
+
+class IngredientPrice(models.Model):
+    """
+    Price of an ingredient from ``effective_at`` until its next price.
+    
+    One row is recorded per change of ``Ingredient.cost_per_unit`` by
+    ``kitchen.prices``, which also maintains the daily and weekly roll-ups.
+    """
+    
+    ingredient = models.ForeignKey(
+        Ingredient, 
+        on_delete=models.CASCADE, 
+        related_name='prices', 
+        verbose_name="Ingrediente"
+    )
+    cost_per_unit = models.DecimalField(max_digits=10, decimal_places=2, verbose_name="Costo por unidad")
+    effective_at = models.DateTimeField(verbose_name="Vigente desde")
+    
+    class Meta:
+        verbose_name = "Precio de ingrediente"
+        verbose_name_plural = "Historial de precios"
+        indexes = [
+            models.Index(fields=['ingredient', 'effective_at'], name='price_ingredient_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.ingredient.name}: {self.cost_per_unit} ({self.effective_at:%Y-%m-%d %H:%M})"
+
+
+class IngredientPriceRollup(models.Model):
+    """Open, high, low and close price of an ingredient over a day or a week with price changes."""
+    
+    DAY = 'day'
+    WEEK = 'week'
+    PERIOD_CHOICES = [
+        (DAY, 'Día'),
+        (WEEK, 'Semana'),
+    ]
+    
+    ingredient = models.ForeignKey(
+        Ingredient, 
+        on_delete=models.CASCADE, 
+        related_name='price_rollups', 
+        verbose_name="Ingrediente"
+    )
+    period = models.CharField(max_length=10, choices=PERIOD_CHOICES, verbose_name="Periodo")
+    period_start = models.DateField(verbose_name="Inicio del periodo", help_text="Lunes para los periodos semanales")
+    open = models.DecimalField(
+        max_digits=10, 
+        decimal_places=2, 
+        verbose_name="Apertura",
+        help_text="Precio vigente al empezar el periodo"
+    )
+    high = models.DecimalField(max_digits=10, decimal_places=2, verbose_name="Máximo")
+    low = models.DecimalField(max_digits=10, decimal_places=2, verbose_name="Mínimo")
+    close = models.DecimalField(max_digits=10, decimal_places=2, verbose_name="Cierre")
+    changes = models.PositiveIntegerField(default=0, verbose_name="Cambios de precio")
+    
+    class Meta:
+        verbose_name = "Resumen de precios"
+        verbose_name_plural = "Resúmenes de precios"
+        unique_together = ('ingredient', 'period', 'period_start')
+    
+    def __str__(self):
+        return f"{self.ingredient.name} {self.get_period_display()} {self.period_start}: {self.close}"
+
+
+class StockMovement(models.Model):
+    """
+    Append-only ledger entry for a change of an ingredient's stock.
+    
+    ``Ingredient.current_stock`` is the running balance of these rows and is
+    updated in the same transaction as each movement by ``kitchen.stock``.
+    """
+    
+    RECEIPT = 'receipt'
+    CONSUMPTION = 'consumption'
+    WASTE = 'waste'
+    ADJUSTMENT = 'adjustment'
+    KIND_CHOICES = [
+        (RECEIPT, 'Entrada'),
+        (CONSUMPTION, 'Consumo'),
+        (WASTE, 'Merma'),
+        (ADJUSTMENT, 'Ajuste'),
+    ]
+    
+    ingredient = models.ForeignKey(
+        Ingredient, 
+        on_delete=models.CASCADE, 
+        related_name='movements', 
+        verbose_name="Ingrediente"
+    )
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES, verbose_name="Tipo")
+    quantity = models.DecimalField(
+        max_digits=12, 
+        decimal_places=2, 
+        verbose_name="Cantidad",
+        help_text="Positiva si entra stock, negativa si sale"
+    )
+    recipe = models.ForeignKey(
+        Recipe, 
+        on_delete=models.SET_NULL, 
+        null=True, 
+        blank=True, 
+        related_name='stock_movements', 
+        verbose_name="Receta",
+        help_text="Receta producida, en los consumos de producción"
+    )
+    note = models.CharField(max_length=200, blank=True, verbose_name="Nota")
+    created_at = models.DateTimeField(default=timezone.now, verbose_name="Fecha")
+    
+    class Meta:
+        verbose_name = "Movimiento de stock"
+        verbose_name_plural = "Movimientos de stock"
+        ordering = ['-created_at', '-id']
+        indexes = [
+            models.Index(fields=['ingredient', 'created_at'], name='movement_ingredient_idx'),
+            # Newest-first listing of the whole ledger (admin changelist)
+            models.Index(fields=['-created_at', '-id'], name='movement_created_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.get_kind_display()} de {self.quantity} {self.ingredient.name} ({self.created_at:%Y-%m-%d %H:%M})"
+
+
+class StockSnapshot(models.Model):
+    """Stock of an ingredient at a point in time, so history queries don't replay the whole ledger."""
+    
+    ingredient = models.ForeignKey(
+        Ingredient, 
+        on_delete=models.CASCADE, 
+        related_name='stock_snapshots', 
+        verbose_name="Ingrediente"
+    )
+    taken_at = models.DateTimeField(verbose_name="Fecha")
+    balance = models.DecimalField(max_digits=10, decimal_places=2, verbose_name="Stock")
+    
+    class Meta:
+        verbose_name = "Cierre de stock"
+        verbose_name_plural = "Cierres de stock"
+        unique_together = ('ingredient', 'taken_at')
+    
+    def __str__(self):
+        return f"{self.ingredient.name}: {self.balance} ({self.taken_at:%Y-%m-%d %H:%M})"
+
+
+class Tombstone(models.Model):
+    """Record of a deleted ingredient or recipe, so sync clients can drop it."""
+    
+    MODEL_CHOICES = [
+        ('ingredient', 'Ingrediente'),
+        ('recipe', 'Receta'),
+    ]
+    
+    model = models.CharField(max_length=20, choices=MODEL_CHOICES, verbose_name="Modelo")
+    object_id = models.BigIntegerField(verbose_name="ID del objeto")
+    deleted_at = models.DateTimeField(default=timezone.now, verbose_name="Eliminado el")
+    
+    class Meta:
+        verbose_name = "Registro de eliminación"
+        verbose_name_plural = "Registros de eliminación"
+        indexes = [
+            models.Index(fields=['model', 'deleted_at'], name='tombstone_model_deleted_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.get_model_display()} #{self.object_id} ({self.deleted_at:%Y-%m-%d %H:%M})"
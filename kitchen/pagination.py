@@ -0,0 +1,32 @@
+from rest_framework.pagination import CursorPagination
+
+
+class UpdatedCursorPagination(CursorPagination):
+    """
+    Cursor pagination in ``(updated_at, id)`` order, used for delta sync.
+
+    Pages are read with an indexed range condition instead of OFFSET and
+    without a COUNT(*), so deep pages cost the same as the first one.
+    """
+
+    ordering = ('updated_at', 'id')
+    page_size = 100
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+
+    def get_ordering(self, request, queryset, view):
+        # Ignore the view's OrderingFilter: the cursor needs a stable order
+        return self.ordering
+
+
+class MovementCursorPagination(CursorPagination):
+    """Cursor pagination over the stock ledger, newest movements first."""
+
+    ordering = ('-created_at', '-id')
+    page_size = 100
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+
+    def get_ordering(self, request, queryset, view):
+        # The ingredient view's OrderingFilter fields don't apply to movements
+        return self.ordering
@@ -0,0 +1,203 @@
+"""Ingredient price history: recording price changes and reading price series."""
+
+from datetime import datetime, time, timedelta
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.db import transaction
+from django.db.models import OuterRef
+from django.utils import timezone
+
+from .models import IngredientPrice, IngredientPriceRollup, price_at
+
+
+INTERVALS = ('raw', IngredientPriceRollup.DAY, IngredientPriceRollup.WEEK)
+
+# Largest number of points returned by one price series
+MAX_POINTS = 2000
+
+# Precision of Ingredient.cost_per_unit and of the recorded prices
+PRICE_PLACES = Decimal('0.01')
+
+# Ids per query, keeping IN lists within database limits
+QUERY_BATCH_SIZE = 1000
+
+
+class PriceHistoryError(ValueError):
+    """Raised for price series with an invalid range or too many points to return at once."""
+
+
+def period_start(moment, period):
+    """First day of the day or week (starting on Monday) that contains ``moment``."""
+    day = timezone.localdate(moment)
+    if period == IngredientPriceRollup.WEEK:
+        day -= timedelta(days=day.weekday())
+    return day
+
+
+def _next_period(day, period):
+    return day + timedelta(days=7 if period == IngredientPriceRollup.WEEK else 1)
+
+
+def _start_of(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def _new_rollup(ingredient_id, period, start, previous_cost, cost):
+    # The period opens with the price in effect before its first change
+    opening = cost if previous_cost is None else previous_cost
+    return IngredientPriceRollup(
+        ingredient_id=ingredient_id, period=period, period_start=start,
+        open=opening, high=max(opening, cost), low=min(opening, cost), close=cost, changes=1,
+    )
+
+
+def _add_change(rollup, cost):
+    rollup.high = max(rollup.high, cost)
+    rollup.low = min(rollup.low, cost)
+    rollup.close = cost
+    rollup.changes += 1
+
+
+@transaction.atomic
+def record_price_changes(changes, at=None):
+    """
+    Record new ingredient prices and update their daily and weekly roll-ups.
+
+    ``changes`` is an iterable of ``(ingredient_id, previous_cost, cost)``,
+    with ``previous_cost`` ``None`` for new ingredients; unchanged prices are
+    skipped. The roll-up rows of the current day and week are locked and
+    updated in place, so the work per change is constant however long the
+    history is. Returns the number of prices recorded.
+    """
+    at = at or timezone.now()
+    recorded = []
+    for ingredient_id, previous_cost, cost in changes:
+        cost = Decimal(cost).quantize(PRICE_PLACES, rounding=ROUND_HALF_UP)
+        if previous_cost != cost:
+            recorded.append((ingredient_id, previous_cost, cost))
+    changes = recorded
+    IngredientPrice.objects.bulk_create(
+        [IngredientPrice(ingredient_id=ingredient_id, cost_per_unit=cost, effective_at=at)
+         for ingredient_id, _previous_cost, cost in changes],
+        batch_size=QUERY_BATCH_SIZE,
+    )
+
+    for period in (IngredientPriceRollup.DAY, IngredientPriceRollup.WEEK):
+        start = period_start(at, period)
+        for offset in range(0, len(changes), QUERY_BATCH_SIZE):
+            batch = changes[offset:offset + QUERY_BATCH_SIZE]
+            existing = {
+                rollup.ingredient_id: rollup
+                for rollup in IngredientPriceRollup.objects.select_for_update().filter(
+                    period=period, period_start=start, ingredient_id__in=[change[0] for change in batch]
+                )
+            }
+            to_create = []
+            to_update = []
+            for ingredient_id, previous_cost, cost in batch:
+                rollup = existing.get(ingredient_id)
+                if rollup is None:
+                    to_create.append(_new_rollup(ingredient_id, period, start, previous_cost, cost))
+                else:
+                    _add_change(rollup, cost)
+                    to_update.append(rollup)
+            IngredientPriceRollup.objects.bulk_create(to_create)
+            IngredientPriceRollup.objects.bulk_update(to_update, ['high', 'low', 'close', 'changes'])
+    return len(changes)
+
+
+def _price_before(ingredient_id, moment):
+    # Latest price at or before ``moment``: one descending step on the (ingredient, effective_at) index
+    return IngredientPrice.objects.filter(
+        ingredient_id=ingredient_id, effective_at__lte=moment
+    ).order_by('-effective_at', '-id').values_list('cost_per_unit', flat=True).first()
+
+
+def price_series(ingredient_id, interval, since, until):
+    """
+    Price series of an ingredient between ``since`` and ``until``.
+
+    ``raw`` lists every price change, starting with the price in effect at
+    ``since``. ``day`` and ``week`` read the precomputed roll-ups and fill the
+    periods without changes with the price carried over from the previous
+    one. Each variant is one indexed range query plus one indexed lookup.
+    """
+    if since > until:
+        raise PriceHistoryError("'since' must be before 'until'")
+
+    if interval == 'raw':
+        opening = _price_before(ingredient_id, since)
+        changes = list(
+            IngredientPrice.objects.filter(
+                ingredient_id=ingredient_id, effective_at__gt=since, effective_at__lte=until
+            ).order_by('effective_at', 'id').values_list('effective_at', 'cost_per_unit')[:MAX_POINTS + 1]
+        )
+        if len(changes) > MAX_POINTS:
+            raise PriceHistoryError(f"More than {MAX_POINTS} price changes in range; narrow it or use a roll-up")
+        points = [] if opening is None else [{'at': since, 'cost_per_unit': opening}]
+        points += [{'at': effective_at, 'cost_per_unit': cost} for effective_at, cost in changes]
+        return points
+
+    first = period_start(since, interval)
+    last = period_start(until, interval)
+    step = 7 if interval == IngredientPriceRollup.WEEK else 1
+    if (last - first).days // step + 1 > MAX_POINTS:
+        raise PriceHistoryError(f"More than {MAX_POINTS} periods in range; narrow it or use a longer interval")
+
+    rollups = {
+        rollup['period_start']: rollup
+        for rollup in IngredientPriceRollup.objects.filter(
+            ingredient_id=ingredient_id, period=interval, period_start__gte=first, period_start__lte=last
+        ).values('period_start', 'open', 'high', 'low', 'close', 'changes')
+    }
+    carried = _price_before(ingredient_id, _start_of(first) - timedelta(microseconds=1))
+    points = []
+    day = first
+    while day <= last:
+        rollup = rollups.get(day)
+        if rollup is not None:
+            carried = rollup['close']
+            points.append(rollup)
+        elif carried is not None:
+            points.append({
+                'period_start': day, 'open': carried, 'high': carried, 'low': carried, 'close': carried, 'changes': 0,
+            })
+        day = _next_period(day, interval)
+    return points
+
+
+def requirement_costs_at(recipe, moment):
+    """
+    Ingredient requirements of ``recipe`` priced as of ``moment``, in one query.
+
+    Uses the recipe's current composition. Ingredients without a price at
+    that moment come back with a ``None`` price.
+    """
+    return recipe.requirements.annotate(
+        price=price_at(moment, ingredient=OuterRef('ingredient'))
+    ).order_by('ingredient__name').values_list(
+        'ingredient_id', 'ingredient__name', 'ingredient__unit', 'quantity', 'price'
+    )
+
+
+def rebuild_price_rollups():
+    """Recompute every roll-up from the raw price history. Returns the number of roll-up rows written."""
+    rollups = {}
+    previous = {}
+    prices = IngredientPrice.objects.order_by('ingredient_id', 'effective_at', 'id').values_list(
+        'ingredient_id', 'effective_at', 'cost_per_unit'
+    )
+    for ingredient_id, effective_at, cost in prices.iterator(chunk_size=QUERY_BATCH_SIZE):
+        previous_cost = previous.get(ingredient_id)
+        previous[ingredient_id] = cost
+        for period in (IngredientPriceRollup.DAY, IngredientPriceRollup.WEEK):
+            key = (ingredient_id, period, period_start(effective_at, period))
+            if key in rollups:
+                _add_change(rollups[key], cost)
+            else:
+                rollups[key] = _new_rollup(ingredient_id, period, key[2], previous_cost, cost)
+
+    with transaction.atomic():
+        IngredientPriceRollup.objects.all().delete()
+        IngredientPriceRollup.objects.bulk_create(rollups.values(), batch_size=QUERY_BATCH_SIZE)
+    return len(rollups)
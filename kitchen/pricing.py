@@ -0,0 +1,99 @@
+"""What-if simulation of ingredient price changes across the recipe catalog."""
+
+from decimal import Decimal
+
+import numpy as np
+
+from .matrix import load_ingredient_columns, load_recipe_matrix
+from .models import Ingredient
+
+
+DEFAULT_LIMIT = 50
+
+COST_PLACES = Decimal('0.0001')
+
+
+class SimulationError(ValueError):
+    """Raised for price changes that refer to unknown ingredients or units."""
+
+
+def _decimal(value):
+    return Decimal(f'{value:.4f}').quantize(COST_PLACES)
+
+
+def simulate_price_changes(changes=(), unit_shifts=None, limit=DEFAULT_LIMIT):
+    """
+    Compute the effect of hypothetical ingredient prices on every recipe.
+
+    ``changes`` is a list of ``{"id", "cost_per_unit"}`` or ``{"id", "percent"}``
+    items and ``unit_shifts`` maps a unit code to a percentage applied to all
+    ingredients measured in it; per-ingredient changes win over unit shifts.
+
+    The new batch costs of the whole catalog are one sparse matrix-vector
+    product of the recipe quantities with the price deltas. Returns a summary
+    and the ``limit`` recipes with the largest absolute batch cost change.
+    """
+    unit_shifts = unit_shifts or {}
+    unknown_units = set(unit_shifts) - {code for code, _label in Ingredient.UNIT_CHOICES}
+    if unknown_units:
+        raise SimulationError(f"Unknown units: {', '.join(sorted(unknown_units))}")
+
+    requested_ids = {change['id'] for change in changes}
+    existing_ids = set(Ingredient.objects.filter(pk__in=requested_ids).values_list('pk', flat=True))
+    if requested_ids - existing_ids:
+        missing = ', '.join(str(pk) for pk in sorted(requested_ids - existing_ids))
+        raise SimulationError(f"Ingredients not found: {missing}")
+
+    matrix = load_recipe_matrix()
+    costs, units = load_ingredient_columns(matrix, 'cost_per_unit', 'unit')
+
+    new_costs = costs.copy()
+    for unit, percent in unit_shifts.items():
+        new_costs[units == unit] *= 1 + float(percent) / 100
+    columns = matrix.ingredient_columns([change['id'] for change in changes])
+    for change, column in zip(changes, columns):
+        if column < 0:
+            # Not used by any recipe
+            continue
+        if 'cost_per_unit' in change:
+            new_costs[column] = float(change['cost_per_unit'])
+        else:
+            new_costs[column] = costs[column] * (1 + float(change['percent']) / 100)
+
+    batch_costs = matrix.quantities @ costs
+    batch_deltas = matrix.quantities @ (new_costs - costs)
+    new_batch_costs = batch_costs + batch_deltas
+    portion_costs = matrix.per_portion(batch_costs)
+    new_portion_costs = matrix.per_portion(new_batch_costs)
+
+    # Ignore float noise far below the stored 4 decimal places
+    affected = np.flatnonzero(np.abs(batch_deltas) >= 0.00005)
+    top = affected
+    if len(affected) > limit:
+        top = affected[np.argpartition(-np.abs(batch_deltas[affected]), limit - 1)[:limit]]
+    top = top[np.lexsort((matrix.recipe_ids[top], -np.abs(batch_deltas[top])))]
+
+    recipes = []
+    for row in top:
+        recipes.append({
+            'id': int(matrix.recipe_ids[row]),
+            'name': matrix.recipe_names[row],
+            'yield_portions': int(matrix.yields[row]),
+            'batch_cost': _decimal(batch_costs[row]),
+            'new_batch_cost': _decimal(new_batch_costs[row]),
+            'batch_cost_delta': _decimal(batch_deltas[row]),
+            'cost_per_portion': _decimal(portion_costs[row]),
+            'new_cost_per_portion': _decimal(new_portion_costs[row]),
+            'cost_per_portion_delta': _decimal(new_portion_costs[row] - portion_costs[row]),
+            'percent_change': (
+                _decimal(batch_deltas[row] / batch_costs[row] * 100) if batch_costs[row] > 0 else None
+            ),
+        })
+
+    return {
+        'recipes_evaluated': len(matrix.recipe_ids),
+        'recipes_affected': len(affected),
+        'ingredients_changed': int(np.count_nonzero(new_costs != costs)),
+        'total_batch_cost_delta': _decimal(batch_deltas[affected].sum()),
+        'recipes': recipes,
+    }
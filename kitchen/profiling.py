@@ -0,0 +1,245 @@
+"""Statistical request profiling, switched on at runtime, written as collapsed stacks per endpoint."""
+
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+
+# Runtime switch, read from the profile directory by every process
+CONFIG_FILE = 'profiling.json'
+
+# Seconds between two checks of the runtime switch
+CONFIG_CHECK_INTERVAL = 1.0
+
+# Seconds between two stack samples of a profiled request
+DEFAULT_INTERVAL = 0.005
+
+COLLAPSED_SUFFIX = '.collapsed'
+
+_write_lock = threading.Lock()
+
+
+class ProfilingError(ValueError):
+    """Raised for an invalid profiling configuration or unreadable profiles."""
+
+
+def _config_path(directory):
+    return os.path.join(directory, CONFIG_FILE)
+
+
+def profile_path(directory, endpoint):
+    """Collapsed-stack file of an endpoint (URL name)."""
+    return os.path.join(directory, re.sub(r'[^\w.-]', '_', endpoint or 'unnamed') + COLLAPSED_SUFFIX)
+
+
+def read_config(directory):
+    """Current runtime switch, ``None`` when profiling is off."""
+    try:
+        with open(_config_path(directory)) as config_file:
+            return json.load(config_file)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as exc:
+        raise ProfilingError(f"Can't read {_config_path(directory)}: {exc}")
+
+
+def enable_profiling(directory, rate=1.0, endpoints=(), interval=DEFAULT_INTERVAL):
+    """
+    Profile a ``rate`` fraction of the requests to ``endpoints`` (URL names, all when empty).
+
+    Takes effect in every running process within ``CONFIG_CHECK_INTERVAL``.
+    """
+    if not 0 < rate <= 1:
+        raise ProfilingError("The rate must be greater than 0 and at most 1")
+    if interval <= 0:
+        raise ProfilingError("The interval must be positive")
+    os.makedirs(directory, exist_ok=True)
+    config = {'rate': rate, 'endpoints': sorted(set(endpoints)), 'interval': interval}
+    # Replace the file atomically so no process reads it half-written
+    temporary = _config_path(directory) + '.tmp'
+    with open(temporary, 'w') as config_file:
+        json.dump(config, config_file)
+    os.replace(temporary, _config_path(directory))
+    return config
+
+
+def disable_profiling(directory):
+    """Stop profiling; the profiles collected so far are kept."""
+    try:
+        os.remove(_config_path(directory))
+    except FileNotFoundError:
+        pass
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    return f"{frame.f_globals.get('__name__', '?')}:{getattr(code, 'co_qualname', code.co_name)}"
+
+
+class StackSampler:
+    """
+    Background thread sampling the stacks of the threads being profiled.
+
+    One sampler serves every profiled request of the process. It sleeps
+    while no request is profiled, and each stack is kept from the frame
+    right after ``root_code`` (the profiling middleware) down to the leaf.
+    """
+
+    def __init__(self, root_code):
+        self.root_code = root_code
+        self._lock = threading.Lock()
+        self._active = threading.Event()
+        self._profiles = {}
+        self._thread = None
+
+    def start(self, thread_id, interval):
+        with self._lock:
+            self._profiles[thread_id] = (Counter(), interval)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='request-profiler', daemon=True)
+                self._thread.start()
+            self._active.set()
+
+    def stop(self, thread_id):
+        """Samples of a thread as a Counter of collapsed stacks."""
+        with self._lock:
+            samples, _interval = self._profiles.pop(thread_id, (Counter(), None))
+        return samples
+
+    def _collapse(self, frame):
+        labels = []
+        while frame is not None and frame.f_code is not self.root_code:
+            labels.append(_frame_label(frame))
+            frame = frame.f_back
+        return ';'.join(reversed(labels))
+
+    def _run(self):
+        while True:
+            self._active.wait()
+            with self._lock:
+                interval = min((interval for _samples, interval in self._profiles.values()), default=DEFAULT_INTERVAL)
+            time.sleep(interval)
+            frames = sys._current_frames()
+            with self._lock:
+                for thread_id, (samples, _interval) in self._profiles.items():
+                    frame = frames.get(thread_id)
+                    if frame is not None:
+                        samples[self._collapse(frame)] += 1
+                if not self._profiles:
+                    self._active.clear()
+            del frames
+
+
+def write_samples(directory, endpoint, samples):
+    """Append a request's samples to its endpoint's collapsed-stack file."""
+    if not samples:
+        return
+    lines = ''.join(f"{stack} {count}\n" for stack, count in samples.items() if stack)
+    with _write_lock:
+        os.makedirs(directory, exist_ok=True)
+        with open(profile_path(directory, endpoint), 'a') as profile_file:
+            profile_file.write(lines)
+
+
+def read_samples(path):
+    """Collapsed stacks of a file with their sample counts, merging repeated stacks."""
+    samples = Counter()
+    with open(path) as profile_file:
+        for line in profile_file:
+            stack, _, count = line.rstrip('\n').rpartition(' ')
+            if stack and count.isdigit():
+                samples[stack] += int(count)
+    return samples
+
+
+def summarize(samples, limit=20, match=''):
+    """
+    Functions with the most samples in ``samples``.
+
+    ``cumulative`` counts the samples with the function anywhere on the
+    stack (once per sample, even when recursive) and ``own`` those with it
+    as the leaf. Returns the total sample count and the top ``limit``
+    functions by cumulative samples whose label contains ``match``.
+    """
+    cumulative = Counter()
+    own = Counter()
+    total = 0
+    for stack, count in samples.items():
+        frames = stack.split(';')
+        total += count
+        own[frames[-1]] += count
+        for label in set(frames):
+            cumulative[label] += count
+    return total, [
+        {'function': label, 'cumulative': count, 'own': own[label]}
+        for label, count in cumulative.most_common()
+        if match in label
+    ][:limit]
+
+
+class RequestProfilingMiddleware:
+    """
+    Sample the Python stacks of the requests selected by the runtime switch.
+
+    Profiling is switched with ``python manage.py profiling enable/disable``,
+    which writes the switch to ``PROFILING_DIR``; every process rereads it
+    at most once per ``CONFIG_CHECK_INTERVAL``, so a request that isn't
+    profiled only costs a clock read. The stacks of each profiled request
+    are appended to ``PROFILING_DIR/<url name>.collapsed`` in the collapsed
+    format read by flamegraph.pl and speedscope. An empty ``PROFILING_DIR``
+    removes the middleware.
+    """
+
+    def __init__(self, get_response):
+        if not settings.PROFILING_DIR:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.directory = str(settings.PROFILING_DIR)
+        self.sampler = StackSampler(type(self).__call__.__code__)
+        self._config = None
+        self._config_checked = 0.0
+        self._config_mtime = None
+
+    def _current_config(self):
+        now = time.monotonic()
+        if now - self._config_checked >= CONFIG_CHECK_INTERVAL:
+            self._config_checked = now
+            try:
+                mtime = os.stat(_config_path(self.directory)).st_mtime
+            except OSError:
+                mtime = None
+            if mtime != self._config_mtime:
+                self._config_mtime = mtime
+                try:
+                    self._config = None if mtime is None else read_config(self.directory)
+                except ProfilingError:
+                    self._config = None
+        return self._config
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        endpoint = getattr(request, '_profiled_endpoint', None)
+        if endpoint is not None:
+            write_samples(self.directory, endpoint, self.sampler.stop(threading.get_ident()))
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        config = self._current_config()
+        if config is None:
+            return None
+        endpoint = request.resolver_match.url_name
+        if config.get('endpoints') and endpoint not in config['endpoints']:
+            return None
+        if random.random() >= config.get('rate', 1):
+            return None
+        request._profiled_endpoint = endpoint or 'unnamed'
+        self.sampler.start(threading.get_ident(), config.get('interval', DEFAULT_INTERVAL))
+        return None
@@ -0,0 +1,210 @@
+"""Flattened ingredient requirements of recipes built from preparations."""
+
+from collections import defaultdict
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.db import connection, transaction
+
+from .models import (
+    BASE_QUANTITY_PLACES, Recipe, RecipeComponent, RecipeIngredient, RecipeRequirement
+)
+
+
+# Ids per query, keeping IN lists within database limits
+QUERY_BATCH_SIZE = 1000
+
+
+class CycleError(ValueError):
+    """Raised when the preparations of a recipe end up using the recipe itself."""
+
+
+def _chunks(ids):
+    ids = sorted(ids)
+    for start in range(0, len(ids), QUERY_BATCH_SIZE):
+        yield ids[start:start + QUERY_BATCH_SIZE]
+
+
+def _reachable(start_ids, towards_preparations):
+    """
+    Every recipe reachable from ``start_ids`` through preparations, the start recipes included.
+
+    Follows recipes to the preparations they use when
+    ``towards_preparations``, else to the recipes using them. The walk runs
+    breadth-first in the database, as one recursive query per batch of start
+    ids, so it only reads the edges it reaches and its number of queries
+    doesn't grow with the depth of the graph.
+    """
+    quote = connection.ops.quote_name
+    parent = quote(RecipeComponent._meta.get_field('parent').column)
+    component = quote(RecipeComponent._meta.get_field('component').column)
+    source, target = (parent, component) if towards_preparations else (component, parent)
+    table = quote(RecipeComponent._meta.db_table)
+
+    reached = set(start_ids)
+    with connection.cursor() as cursor:
+        for chunk in _chunks(reached):
+            cursor.execute(
+                f"WITH RECURSIVE walk (id) AS ("
+                f"SELECT {target} FROM {table} WHERE {source} IN ({', '.join(['%s'] * len(chunk))}) "
+                f"UNION SELECT edge.{target} FROM {table} edge JOIN walk ON edge.{source} = walk.id"
+                f") SELECT id FROM walk",
+                chunk,
+            )
+            reached.update(recipe_id for recipe_id, in cursor.fetchall())
+    return reached
+
+
+def cycle_components(parent_id, component_ids):
+    """Ids in ``component_ids`` that would create a cycle as components of ``parent_id``."""
+    # A preparation creates a cycle when it is the recipe itself or uses it, directly or not
+    ancestors = ancestor_ids([parent_id])
+    return sorted(component_id for component_id in component_ids if component_id in ancestors)
+
+
+def ancestor_ids(recipe_ids):
+    """The given recipes plus every recipe that uses them, directly or not."""
+    return _reachable(recipe_ids, towards_preparations=False)
+
+
+def _load_children(recipe_ids):
+    """``{recipe: [(preparation, portions), ...]}`` for the given recipes."""
+    children = defaultdict(list)
+    for chunk in _chunks(recipe_ids):
+        for parent_id, component_id, portions in RecipeComponent.objects.filter(
+            parent_id__in=chunk
+        ).order_by().values_list('parent_id', 'component_id', 'portions'):
+            children[parent_id].append((component_id, portions))
+    return children
+
+
+def _topological_order(nodes, children):
+    """Order ``nodes`` so every recipe comes after the preparations it uses."""
+    order = []
+    state = {}
+    for root in nodes:
+        if root in state:
+            continue
+        stack = [(root, iter(children.get(root, ())))]
+        state[root] = 'open'
+        while stack:
+            node, edges = stack[-1]
+            for child, _portions in edges:
+                if child not in nodes:
+                    continue
+                if state.get(child) == 'open':
+                    raise CycleError(f"Recipe {child} is a preparation of itself")
+                if child not in state:
+                    state[child] = 'open'
+                    stack.append((child, iter(children.get(child, ()))))
+                    break
+            else:
+                stack.pop()
+                state[node] = 'done'
+                order.append(node)
+    return order
+
+
+def _compute_requirements(recipe_ids):
+    """
+    Recompute in memory the requirements of the given recipes and of every recipe using them.
+
+    Returns the affected recipe ids and ``{(recipe, ingredient): quantity}``.
+    """
+    affected = ancestor_ids(set(recipe_ids))
+    children = _load_children(affected)
+
+    yields = {}
+    for chunk in _chunks(affected | {child for node in affected for child, _ in children.get(node, ())}):
+        yields.update(Recipe.objects.filter(pk__in=chunk).values_list('pk', 'yield_portions'))
+    # Deleted recipes have nothing left to compute
+    affected &= set(yields)
+
+    totals = defaultdict(lambda: defaultdict(Decimal))
+    for chunk in _chunks(affected):
+        for recipe_id, ingredient_id, quantity in RecipeIngredient.objects.filter(
+            recipe_id__in=chunk
+        ).order_by().values_list('recipe_id', 'ingredient_id', 'base_quantity'):
+            totals[recipe_id][ingredient_id] += quantity
+    stored = {child for node in affected for child, _ in children.get(node, ()) if child not in affected}
+    for chunk in _chunks(stored):
+        for recipe_id, ingredient_id, quantity in RecipeRequirement.objects.filter(
+            recipe_id__in=chunk
+        ).order_by().values_list('recipe_id', 'ingredient_id', 'quantity'):
+            totals[recipe_id][ingredient_id] = quantity
+
+    for recipe_id in _topological_order(affected, children):
+        recipe_totals = totals[recipe_id]
+        for child, portions in children.get(recipe_id, ()):
+            if not yields.get(child):
+                continue
+            scale = portions / yields[child]
+            for ingredient_id, quantity in totals[child].items():
+                recipe_totals[ingredient_id] += quantity * scale
+
+    return affected, {
+        (recipe_id, ingredient_id): quantity.quantize(BASE_QUANTITY_PLACES, rounding=ROUND_HALF_UP)
+        for recipe_id in affected
+        for ingredient_id, quantity in totals[recipe_id].items()
+    }
+
+
+def _stored_requirements(recipe_ids):
+    """``{(recipe, ingredient): (pk, quantity)}`` of the stored rows of the given recipes."""
+    current = {}
+    for chunk in _chunks(recipe_ids):
+        for pk, recipe_id, ingredient_id, quantity in RecipeRequirement.objects.filter(
+            recipe_id__in=chunk
+        ).order_by().values_list('pk', 'recipe_id', 'ingredient_id', 'quantity'):
+            current[recipe_id, ingredient_id] = (pk, quantity)
+    return current
+
+
+def requirement_differences(recipe_ids):
+    """
+    Stored requirements of the given recipes, and the recipes using them, that differ from a fresh computation.
+
+    Nothing is written. Returns ``(recipe, ingredient, stored, expected)``
+    tuples sorted by ids, with ``None`` for a missing or an extra row.
+    """
+    affected, expected = _compute_requirements(recipe_ids)
+    current = {key: quantity for key, (_pk, quantity) in _stored_requirements(affected).items()}
+    return [
+        (recipe_id, ingredient_id, current.get((recipe_id, ingredient_id)), expected.get((recipe_id, ingredient_id)))
+        for recipe_id, ingredient_id in sorted(current.keys() | expected.keys())
+        if current.get((recipe_id, ingredient_id)) != expected.get((recipe_id, ingredient_id))
+    ]
+
+
+@transaction.atomic
+def rebuild_requirements(recipe_ids):
+    """
+    Recompute the requirements of the given recipes and of every recipe using them.
+
+    The affected part of the component graph is evaluated once in topological
+    order: each recipe's totals are its own lines plus the memoized totals of
+    its preparations, scaled from their yield to the portions used. Totals of
+    unaffected preparations are read from their stored rows. Only the
+    affected recipes and their edges are read, in bulk, and only the rows
+    that differ are written, so the number of queries depends neither on the
+    size of the catalog nor on the depth of the graph.
+
+    Returns the ids of the recipes whose requirements were rewritten.
+    """
+    affected, expected = _compute_requirements(recipe_ids)
+    # Only write the rows that changed, so re-costing an untouched graph is cheap
+    current = _stored_requirements(affected)
+
+    to_create = []
+    to_update = []
+    for (recipe_id, ingredient_id), quantity in expected.items():
+        pk, stored_quantity = current.pop((recipe_id, ingredient_id), (None, None))
+        if pk is None:
+            to_create.append(RecipeRequirement(recipe_id=recipe_id, ingredient_id=ingredient_id, quantity=quantity))
+        elif stored_quantity != quantity:
+            to_update.append(RecipeRequirement(pk=pk, quantity=quantity))
+
+    for chunk in _chunks(pk for pk, _quantity in current.values()):
+        RecipeRequirement.objects.filter(pk__in=chunk).delete()
+    RecipeRequirement.objects.bulk_update(to_update, ['quantity'], batch_size=QUERY_BATCH_SIZE)
+    RecipeRequirement.objects.bulk_create(to_create, batch_size=QUERY_BATCH_SIZE)
+    return affected
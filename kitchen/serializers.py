@@ -1,5 +1,65 @@
+from django.db import transaction
 from rest_framework import serializers
-from .models import Ingredient, Recipe, RecipeIngredient
+from .costs import deferred_cost_refresh, refresh_recipe_requirements
+from .models import Ingredient, Recipe, RecipeComponent, RecipeIngredient, StockMovement
+from .planning import DEFAULT_TIME_LIMIT, METHODS
+from .requirements import cycle_components
+from .stock import apply_stock_changes
+from .units import can_convert
+
+
+class SparseFieldsMixin:
+    """
+    Serializer mixin for sparse fieldsets.
+    
+    ``fields`` keeps only the given fields and ``expand`` adds
+    ``expandable_fields`` (nested, costly fields) to the default set, which
+    leaves them out; without either argument every field is included except
+    ``included_fields``, which are only added when named in ``include``.
+    When the selected fields are all plain columns the serializer also
+    represents ``values()`` rows, reading each column directly instead of
+    resolving every field's source per object. ``values_sources`` names the
+    annotations read for fields that aren't columns.
+    """
+    
+    expandable_fields = []
+    included_fields = []
+    values_sources = {}
+    
+    def __init__(self, *args, fields=None, expand=None, include=(), **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            selected = set(fields)
+        else:
+            selected = set(self.fields) - set(self.included_fields)
+            if expand is not None:
+                selected -= set(self.expandable_fields)
+        selected |= set(expand or ()) | set(include)
+        for name in list(self.fields):
+            if name not in selected:
+                self.fields.pop(name)
+    
+    def values_lookups(self):
+        """``values()`` lookup per selected field, or ``None`` if a field needs the model instance."""
+        lookups = {}
+        for name, field in self.fields.items():
+            if isinstance(field, serializers.BaseSerializer) or field.source == '*' or '.' in field.source:
+                return None
+            lookups[name] = self.values_sources.get(name, field.source)
+        return lookups
+    
+    def to_representation(self, instance):
+        if not isinstance(instance, dict):
+            return super().to_representation(instance)
+        if not hasattr(self, '_values_columns'):
+            self._values_columns = [
+                (name, lookup, self.fields[name].to_representation)
+                for name, lookup in self.values_lookups().items()
+            ]
+        return {
+            name: None if instance[lookup] is None else to_representation(instance[lookup])
+            for name, lookup, to_representation in self._values_columns
+        }
 
 
 class IngredientSerializer(serializers.ModelSerializer):
@@ -11,9 +71,173 @@ class IngredientSerializer(serializers.ModelSerializer):
         model = Ingredient
         fields = [
             'id', 'name', 'unit', 'unit_display', 'cost_per_unit', 
-            'current_stock', 'created_at', 'updated_at'
+            'current_stock', 'density', 'created_at', 'updated_at'
         ]
         read_only_fields = ['created_at', 'updated_at']
+    
+    def validate(self, attrs):
+        if self.instance is not None and ('unit' in attrs or 'density' in attrs):
+            invalid = self.instance.unconvertible_line_units(
+                attrs.get('unit', self.instance.unit), 
+                attrs.get('density', self.instance.density)
+            )
+            if invalid:
+                raise serializers.ValidationError({
+                    'unit': f"Recipes use this ingredient in {', '.join(invalid)}, which can't be converted to the new unit"
+                })
+        return attrs
+    
+    @transaction.atomic
+    def create(self, validated_data):
+        current_stock = validated_data.pop('current_stock', None)
+        ingredient = super().create(validated_data)
+        if current_stock:
+            self._set_stock(ingredient, current_stock, "Stock inicial")
+        return ingredient
+    
+    @transaction.atomic
+    def update(self, instance, validated_data):
+        current_stock = validated_data.pop('current_stock', None)
+        for attr, value in validated_data.items():
+            setattr(instance, attr, value)
+        # Never write the balance read with the instance: a concurrent movement could be lost
+        instance.save(update_fields=[*validated_data, 'updated_at'])
+        instance.refresh_from_db(fields=['current_stock'])
+        if current_stock is not None and current_stock != instance.current_stock:
+            self._set_stock(instance, current_stock, "Ajuste desde la ficha del ingrediente")
+        return instance
+    
+    def _set_stock(self, ingredient, current_stock, note):
+        """Record the stock change in the ledger instead of overwriting the balance."""
+        errors = apply_stock_changes([{'id': ingredient.pk, 'current_stock': current_stock, 'note': note}])
+        if errors:
+            raise serializers.ValidationError({'current_stock': errors[0]['error']})
+        ingredient.refresh_from_db(fields=['current_stock', 'updated_at'])
+
+
+class StockChangeSerializer(serializers.Serializer):
+    """Serializer for one absolute or relative stock change, recorded as a stock movement."""
+    
+    id = serializers.IntegerField()
+    current_stock = serializers.DecimalField(max_digits=10, decimal_places=2, required=False)
+    delta = serializers.DecimalField(max_digits=10, decimal_places=2, required=False)
+    kind = serializers.ChoiceField(choices=StockMovement.KIND_CHOICES, default=StockMovement.ADJUSTMENT)
+    note = serializers.CharField(max_length=200, required=False, allow_blank=True)
+    
+    def validate(self, attrs):
+        if ('current_stock' in attrs) == ('delta' in attrs):
+            raise serializers.ValidationError("Provide exactly one of 'current_stock' or 'delta'")
+        if attrs['kind'] != StockMovement.ADJUSTMENT:
+            if 'delta' not in attrs:
+                raise serializers.ValidationError("Only adjustments can set an absolute 'current_stock'")
+            if (attrs['kind'] == StockMovement.RECEIPT) != (attrs['delta'] > 0):
+                raise serializers.ValidationError(
+                    "Receipts need a positive 'delta'; consumption and waste a negative one"
+                )
+        return attrs
+
+
+class StockMovementSerializer(serializers.ModelSerializer):
+    """Serializer for a stock ledger entry."""
+    
+    kind_display = serializers.CharField(source='get_kind_display', read_only=True)
+    
+    class Meta:
+        model = StockMovement
+        fields = ['id', 'ingredient', 'kind', 'kind_display', 'quantity', 'recipe', 'note', 'created_at']
+        read_only_fields = fields
+
+
+class ProduceSerializer(serializers.Serializer):
+    """Serializer for the number of batches of a recipe to produce."""
+    
+    batches = serializers.IntegerField(min_value=1, max_value=10000, default=1)
+
+
+class PriceChangeSerializer(serializers.Serializer):
+    """Serializer for one hypothetical ingredient price, absolute or relative."""
+    
+    id = serializers.IntegerField()
+    cost_per_unit = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=0, required=False)
+    percent = serializers.DecimalField(max_digits=7, decimal_places=2, min_value=-100, required=False)
+    
+    def validate(self, attrs):
+        if ('cost_per_unit' in attrs) == ('percent' in attrs):
+            raise serializers.ValidationError("Provide exactly one of 'cost_per_unit' or 'percent'")
+        return attrs
+
+
+class PriceSimulationSerializer(serializers.Serializer):
+    """Serializer for a what-if price simulation request."""
+    
+    changes = PriceChangeSerializer(many=True, required=False, default=list)
+    unit_shifts = serializers.DictField(
+        child=serializers.DecimalField(max_digits=7, decimal_places=2, min_value=-100),
+        required=False,
+        default=dict
+    )
+    limit = serializers.IntegerField(min_value=1, max_value=1000, default=50)
+    
+    def validate_changes(self, value):
+        ids = [change['id'] for change in value]
+        if len(ids) != len(set(ids)):
+            raise serializers.ValidationError("Each ingredient can only appear once")
+        return value
+    
+    def validate(self, attrs):
+        if not attrs['changes'] and not attrs['unit_shifts']:
+            raise serializers.ValidationError("Provide 'changes' or 'unit_shifts'")
+        return attrs
+
+
+class PlanTargetSerializer(serializers.Serializer):
+    """Serializer for one recipe taking part in a production plan."""
+    
+    id = serializers.IntegerField()
+    weight = serializers.DecimalField(max_digits=10, decimal_places=3, min_value=0, default=1)
+    demand_portions = serializers.IntegerField(min_value=0, required=False)
+
+
+class ProductionPlanSerializer(serializers.Serializer):
+    """Serializer for a production planning request."""
+    
+    recipes = PlanTargetSerializer(many=True, required=False, default=list)
+    method = serializers.ChoiceField(choices=METHODS, default='auto')
+    time_limit = serializers.FloatField(min_value=0.01, max_value=10, default=DEFAULT_TIME_LIMIT)
+    
+    def validate_recipes(self, value):
+        if len(value) > 1000:
+            raise serializers.ValidationError("At most 1000 recipes can be planned per request")
+        ids = [target['id'] for target in value]
+        if len(ids) != len(set(ids)):
+            raise serializers.ValidationError("Each recipe can only appear once")
+        return value
+
+
+class ShoppingListItemSerializer(serializers.Serializer):
+    """Serializer for one recipe of a shopping list, scaled by factor or portions."""
+    
+    recipe_id = serializers.IntegerField()
+    scale_factor = serializers.DecimalField(max_digits=10, decimal_places=4, required=False)
+    target_portions = serializers.IntegerField(min_value=1, required=False)
+    
+    def validate(self, attrs):
+        if ('scale_factor' in attrs) == ('target_portions' in attrs):
+            raise serializers.ValidationError("Provide exactly one of 'scale_factor' or 'target_portions'")
+        if 'scale_factor' in attrs and attrs['scale_factor'] <= 0:
+            raise serializers.ValidationError({'scale_factor': "Scale factor must be positive"})
+        return attrs
+
+
+class ShoppingListSerializer(serializers.Serializer):
+    """Serializer for a consolidated shopping list request."""
+    
+    items = ShoppingListItemSerializer(many=True, allow_empty=False)
+    
+    def validate_items(self, value):
+        if len(value) > 500:
+            raise serializers.ValidationError("At most 500 items are allowed per request")
+        return value
 
 
 class RecipeIngredientSerializer(serializers.ModelSerializer):
@@ -21,6 +245,7 @@ class RecipeIngredientSerializer(serializers.ModelSerializer):
     
     ingredient_name = serializers.CharField(source='ingredient.name', read_only=True)
     ingredient_unit = serializers.CharField(source='ingredient.get_unit_display', read_only=True)
+    unit_display = serializers.CharField(source='get_unit_display', read_only=True)
     total_cost = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True)
     available_stock = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True)
     is_sufficient = serializers.BooleanField(read_only=True)
@@ -29,80 +254,285 @@ class RecipeIngredientSerializer(serializers.ModelSerializer):
         model = RecipeIngredient
         fields = [
             'id', 'ingredient', 'ingredient_name', 'ingredient_unit',
-            'quantity', 'total_cost', 'available_stock', 'is_sufficient'
+            'quantity', 'unit', 'unit_display', 'base_quantity',
+            'total_cost', 'available_stock', 'is_sufficient'
         ]
+    
+    def validate(self, attrs):
+        ingredient = attrs.get('ingredient') or getattr(self.instance, 'ingredient', None)
+        unit = attrs.get('unit') or getattr(self.instance, 'unit', None)
+        if ingredient is not None and unit and not can_convert(unit, ingredient.unit, ingredient.density):
+            raise serializers.ValidationError({
+                'unit': f"Cannot convert {unit} to the ingredient's unit ({ingredient.unit})"
+            })
+        return attrs
+
+
+class RecipeIngredientWriteSerializer(RecipeIngredientSerializer):
+    """Serializer for creating and updating a single recipe line through its own endpoint."""
+    
+    class Meta(RecipeIngredientSerializer.Meta):
+        fields = ['recipe', *RecipeIngredientSerializer.Meta.fields]
 
 
-class RecipeSerializer(serializers.ModelSerializer):
+class RecipeComponentSerializer(serializers.ModelSerializer):
+    """Serializer for a preparation used inside a recipe."""
+    
+    component_name = serializers.CharField(source='component.name', read_only=True)
+    yield_portions = serializers.IntegerField(source='component.yield_portions', read_only=True)
+    total_cost = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True)
+    
+    class Meta:
+        model = RecipeComponent
+        fields = ['id', 'component', 'component_name', 'yield_portions', 'portions', 'total_cost']
+
+
+class CostBreakdownLineSerializer(serializers.Serializer):
+    """One ingredient line of a cost breakdown."""
+    
+    name = serializers.CharField()
+    quantity = serializers.DecimalField(max_digits=10, decimal_places=3)
+    unit = serializers.CharField()
+    base_quantity = serializers.DecimalField(max_digits=18, decimal_places=6)
+    ingredient_unit = serializers.CharField()
+    cost_per_unit = serializers.DecimalField(max_digits=10, decimal_places=2)
+    total_cost = serializers.DecimalField(max_digits=10, decimal_places=2)
+    percentage_of_total = serializers.DecimalField(max_digits=6, decimal_places=2)
+
+
+class CostBreakdownComponentSerializer(serializers.Serializer):
+    """One preparation of a cost breakdown."""
+    
+    name = serializers.CharField()
+    portions = serializers.DecimalField(max_digits=10, decimal_places=3)
+    cost_per_portion = serializers.DecimalField(max_digits=10, decimal_places=2)
+    total_cost = serializers.DecimalField(max_digits=10, decimal_places=2)
+    percentage_of_total = serializers.DecimalField(max_digits=6, decimal_places=2)
+
+
+class CostBreakdownSerializer(serializers.Serializer):
+    """``Recipe.cost_breakdown()``, with amounts formatted like the recipe's own fields."""
+    
+    recipe_name = serializers.CharField()
+    yield_portions = serializers.IntegerField()
+    batch_cost = serializers.DecimalField(max_digits=10, decimal_places=2)
+    cost_per_portion = serializers.DecimalField(max_digits=10, decimal_places=2)
+    ingredients = CostBreakdownLineSerializer(many=True)
+    components = CostBreakdownComponentSerializer(many=True)
+
+
+class RecipeSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """Serializer for the Recipe model."""
     
     ingredients = RecipeIngredientSerializer(source='recipeingredient_set', many=True, read_only=True)
+    components = RecipeComponentSerializer(many=True, read_only=True)
     batch_cost = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True)
     cost_per_portion = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True)
     producible_portions = serializers.IntegerField(read_only=True)
+    cost_breakdown = serializers.SerializerMethodField()
+    
+    # Nested lines are left out of lists unless expanded
+    expandable_fields = ['ingredients', 'components']
+    included_fields = ['cost_breakdown']
+    values_sources = {'producible_portions': 'computed_producible_portions'}
     
     class Meta:
         model = Recipe
         fields = [
             'id', 'name', 'description', 'yield_portions', 'preparation_time',
             'batch_cost', 'cost_per_portion', 'producible_portions',
-            'ingredients', 'created_at', 'updated_at'
+            'ingredients', 'components', 'cost_breakdown', 'created_at', 'updated_at'
         ]
         read_only_fields = ['created_at', 'updated_at']
+    
+    def get_cost_breakdown(self, recipe):
+        return CostBreakdownSerializer(recipe.cost_breakdown()).data
+
+
+class RecipeIngredientInputSerializer(serializers.Serializer):
+    """Serializer for one ingredient line sent when creating or updating a recipe."""
+    
+    ingredient_id = serializers.IntegerField()
+    quantity = serializers.DecimalField(max_digits=10, decimal_places=3, min_value=0)
+    unit = serializers.ChoiceField(choices=Ingredient.UNIT_CHOICES, required=False)
+
+
+class RecipeComponentInputSerializer(serializers.Serializer):
+    """Serializer for one preparation sent when creating or updating a recipe."""
+    
+    recipe_id = serializers.IntegerField()
+    portions = serializers.DecimalField(max_digits=10, decimal_places=3, min_value=0)
+    
+    def validate_portions(self, value):
+        if value <= 0:
+            raise serializers.ValidationError("Portions must be positive")
+        return value
 
 
 class RecipeCreateUpdateSerializer(serializers.ModelSerializer):
     """Serializer for creating and updating recipes with ingredients."""
     
-    ingredients = serializers.ListField(
-        child=serializers.DictField(), 
+    ingredients = RecipeIngredientInputSerializer(
+        many=True, 
         write_only=True, 
         required=False,
-        help_text="Lista de ingredientes con 'ingredient_id' y 'quantity'"
+        help_text="Lista de ingredientes con 'ingredient_id', 'quantity' y opcionalmente 'unit'"
+    )
+    components = RecipeComponentInputSerializer(
+        many=True, 
+        write_only=True, 
+        required=False,
+        help_text="Lista de preparaciones con 'recipe_id' y 'portions'"
     )
     
     class Meta:
         model = Recipe
         fields = [
             'id', 'name', 'description', 'yield_portions', 
-            'preparation_time', 'ingredients'
+            'preparation_time', 'ingredients', 'components'
         ]
     
+    def validate_ingredients(self, value):
+        ingredient_ids = [item['ingredient_id'] for item in value]
+        
+        duplicates = sorted({i for i in ingredient_ids if ingredient_ids.count(i) > 1})
+        if duplicates:
+            raise serializers.ValidationError(f"Duplicate ingredients: {duplicates}")
+        
+        # Check that every ingredient exists with a single query
+        ingredients = Ingredient.objects.only('unit', 'density').in_bulk(ingredient_ids)
+        missing = sorted(set(ingredient_ids) - set(ingredients))
+        if missing:
+            raise serializers.ValidationError(f"Ingredients not found: {missing}")
+        
+        for item in value:
+            ingredient = ingredients[item['ingredient_id']]
+            item.setdefault('unit', ingredient.unit)
+            if not can_convert(item['unit'], ingredient.unit, ingredient.density):
+                raise serializers.ValidationError(
+                    f"Cannot convert {item['unit']} to the unit of ingredient {ingredient.pk} ({ingredient.unit})"
+                )
+            # Kept for converting the quantities when the lines are written
+            item['ingredient'] = ingredient
+        
+        return value
+    
+    def validate_components(self, value):
+        recipe_ids = [item['recipe_id'] for item in value]
+        
+        duplicates = sorted({i for i in recipe_ids if recipe_ids.count(i) > 1})
+        if duplicates:
+            raise serializers.ValidationError(f"Duplicate preparations: {duplicates}")
+        
+        missing = sorted(set(recipe_ids) - set(Recipe.objects.filter(pk__in=recipe_ids).values_list('pk', flat=True)))
+        if missing:
+            raise serializers.ValidationError(f"Recipes not found: {missing}")
+        
+        # A new recipe can't be used by anything yet, so only updates can form cycles
+        if self.instance is not None:
+            cycles = cycle_components(self.instance.pk, recipe_ids)
+            if cycles:
+                raise serializers.ValidationError(f"Preparations would create a cycle: {cycles}")
+        
+        return value
+    
+    @transaction.atomic
     def create(self, validated_data):
         ingredients_data = validated_data.pop('ingredients', [])
-        recipe = Recipe.objects.create(**validated_data)
+        components_data = validated_data.pop('components', [])
         
-        for ingredient_data in ingredients_data:
-            RecipeIngredient.objects.create(
-                recipe=recipe,
-                ingredient_id=ingredient_data['ingredient_id'],
-                quantity=ingredient_data['quantity']
-            )
+        with deferred_cost_refresh():
+            recipe = Recipe.objects.create(**validated_data)
+            self._write_ingredients(recipe, ingredients_data, existing_lines=[])
+            self._write_components(recipe, components_data, existing_components=[])
         
         return recipe
     
+    @transaction.atomic
     def update(self, instance, validated_data):
         ingredients_data = validated_data.pop('ingredients', None)
+        components_data = validated_data.pop('components', None)
         
-        # Update recipe fields
-        for attr, value in validated_data.items():
-            setattr(instance, attr, value)
-        instance.save()
-        
-        # Update ingredients if provided
-        if ingredients_data is not None:
-            # Clear existing ingredients
-            instance.recipeingredient_set.all().delete()
+        with deferred_cost_refresh():
+            # Update recipe fields
+            for attr, value in validated_data.items():
+                setattr(instance, attr, value)
+            instance.save()
             
-            # Create new ingredients
-            for ingredient_data in ingredients_data:
-                RecipeIngredient.objects.create(
-                    recipe=instance,
-                    ingredient_id=ingredient_data['ingredient_id'],
-                    quantity=ingredient_data['quantity']
-                )
+            # Update ingredients and preparations if provided
+            if ingredients_data is not None:
+                self._write_ingredients(instance, ingredients_data)
+            if components_data is not None:
+                self._write_components(instance, components_data)
         
         return instance
+    
+    def _write_ingredients(self, recipe, ingredients_data, existing_lines=None):
+        """
+        Apply only the difference between the stored and the submitted lines.
+        
+        Uses at most one delete, one bulk insert and one bulk update, and
+        refreshes the recipe costs once, whatever the number of lines.
+        """
+        if existing_lines is None:
+            existing_lines = RecipeIngredient.objects.filter(recipe=recipe)
+        existing = {line.ingredient_id: line for line in existing_lines}
+        wanted = {item['ingredient_id']: item for item in ingredients_data}
+        
+        to_delete = [line.pk for ingredient_id, line in existing.items() if ingredient_id not in wanted]
+        to_create = []
+        to_update = []
+        for ingredient_id, item in wanted.items():
+            line = existing.get(ingredient_id)
+            if line is None:
+                line = RecipeIngredient(
+                    recipe=recipe, ingredient_id=ingredient_id, quantity=item['quantity'], unit=item['unit']
+                )
+                to_create.append(line)
+            elif line.quantity != item['quantity'] or line.unit != item['unit']:
+                line.quantity = item['quantity']
+                line.unit = item['unit']
+                to_update.append(line)
+            else:
+                continue
+            line.set_base_quantity(item['ingredient'])
+        
+        if to_delete:
+            RecipeIngredient.objects.filter(pk__in=to_delete).delete()
+        if to_create:
+            RecipeIngredient.objects.bulk_create(to_create)
+        if to_update:
+            RecipeIngredient.objects.bulk_update(to_update, ['quantity', 'unit', 'base_quantity'])
+        
+        # Bulk writes bypass the model signals, so refresh the requirements explicitly
+        refresh_recipe_requirements([recipe.pk])
+    
+    def _write_components(self, recipe, components_data, existing_components=None):
+        """Apply only the difference between the stored and the submitted preparations."""
+        if existing_components is None:
+            existing_components = RecipeComponent.objects.filter(parent=recipe)
+        existing = {component.component_id: component for component in existing_components}
+        wanted = {item['recipe_id']: item['portions'] for item in components_data}
+        
+        to_delete = [component.pk for recipe_id, component in existing.items() if recipe_id not in wanted]
+        to_create = []
+        to_update = []
+        for recipe_id, portions in wanted.items():
+            component = existing.get(recipe_id)
+            if component is None:
+                to_create.append(RecipeComponent(parent=recipe, component_id=recipe_id, portions=portions))
+            elif component.portions != portions:
+                component.portions = portions
+                to_update.append(component)
+        
+        if to_delete:
+            RecipeComponent.objects.filter(pk__in=to_delete).delete()
+        if to_create:
+            RecipeComponent.objects.bulk_create(to_create)
+        if to_update:
+            RecipeComponent.objects.bulk_update(to_update, ['portions'])
+        
+        refresh_recipe_requirements([recipe.pk])
 
 
 class RecipeIngredientDetailSerializer(serializers.ModelSerializer):
@@ -116,6 +546,6 @@ class RecipeIngredientDetailSerializer(serializers.ModelSerializer):
     class Meta:
         model = RecipeIngredient
         fields = [
-            'id', 'recipe', 'recipe_name', 'ingredient', 'quantity',
-            'total_cost', 'is_sufficient'
+            'id', 'recipe', 'recipe_name', 'ingredient', 'quantity', 'unit',
+            'base_quantity', 'total_cost', 'is_sufficient'
         ]
\ No newline at end of file
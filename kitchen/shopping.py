@@ -0,0 +1,111 @@
+"""Consolidated shopping list for a set of scaled recipes."""
+
+from decimal import ROUND_HALF_UP, Decimal
+
+from .models import Recipe, RecipeRequirement
+
+
+QUANTITY_PLACES = Decimal('0.001')
+FACTOR_PLACES = Decimal('0.0001')
+COST_PLACES = Decimal('0.01')
+
+
+class ShoppingListError(ValueError):
+    """Raised for unknown recipes or recipes that cannot be scaled to a portion count."""
+
+
+def _quantity(value):
+    return value.quantize(QUANTITY_PLACES, rounding=ROUND_HALF_UP)
+
+
+def _cost(value):
+    return value.quantize(COST_PLACES, rounding=ROUND_HALF_UP)
+
+
+def build_shopping_list(items):
+    """
+    Add up the ingredients needed for many recipes and compare them with stock.
+
+    ``items`` is a list of ``{"recipe_id", "scale_factor"}`` or
+    ``{"recipe_id", "target_portions"}`` dicts; a recipe may appear more than
+    once. The flattened requirements, preparations included, are loaded in
+    one query and every sum is done with ``Decimal``, so totals are exact
+    before the final rounding.
+    """
+    recipe_ids = {item['recipe_id'] for item in items}
+    recipes = Recipe.objects.only('name', 'yield_portions').in_bulk(recipe_ids)
+    missing = recipe_ids - set(recipes)
+    if missing:
+        raise ShoppingListError(f"Recipes not found: {', '.join(str(pk) for pk in sorted(missing))}")
+
+    factors = {}
+    planned = []
+    for item in items:
+        recipe = recipes[item['recipe_id']]
+        if 'scale_factor' in item:
+            factor = item['scale_factor']
+        elif recipe.yield_portions:
+            factor = Decimal(item['target_portions']) / recipe.yield_portions
+        else:
+            raise ShoppingListError(f"Recipe '{recipe.name}' has no yield to scale to target_portions")
+        factors[recipe.pk] = factors.get(recipe.pk, Decimal('0')) + factor
+        planned.append((recipe, factor))
+
+    lines = RecipeRequirement.objects.filter(recipe_id__in=recipe_ids).order_by().values_list(
+        'recipe_id', 'quantity', 'ingredient_id', 'ingredient__name', 'ingredient__unit',
+        'ingredient__cost_per_unit', 'ingredient__current_stock'
+    )
+    batch_costs = {}
+    ingredients = {}
+    for recipe_id, quantity, ingredient_id, name, unit, cost_per_unit, current_stock in lines:
+        batch_costs[recipe_id] = batch_costs.get(recipe_id, Decimal('0')) + quantity * cost_per_unit
+        entry = ingredients.setdefault(ingredient_id, {
+            'id': ingredient_id,
+            'name': name,
+            'unit': unit,
+            'cost_per_unit': cost_per_unit,
+            'current_stock': current_stock,
+            'required': Decimal('0'),
+        })
+        entry['required'] += quantity * factors[recipe_id]
+
+    shopping_list = []
+    purchase_list = []
+    required_cost = purchase_cost = Decimal('0')
+    for entry in sorted(ingredients.values(), key=lambda entry: entry['name']):
+        required = _quantity(entry.pop('required'))
+        shortfall = max(required - entry['current_stock'], Decimal('0'))
+        entry.update({
+            'required_quantity': required,
+            'shortfall': shortfall,
+            'required_cost': _cost(required * entry['cost_per_unit']),
+            'purchase_cost': _cost(shortfall * entry['cost_per_unit']),
+        })
+        required_cost += entry['required_cost']
+        purchase_cost += entry['purchase_cost']
+        shopping_list.append(entry)
+        if shortfall:
+            purchase_list.append({
+                'id': entry['id'],
+                'name': entry['name'],
+                'unit': entry['unit'],
+                'quantity': shortfall,
+                'cost': entry['purchase_cost'],
+            })
+
+    return {
+        'recipes': [
+            {
+                'id': recipe.pk,
+                'name': recipe.name,
+                'scale_factor': factor.quantize(FACTOR_PLACES, rounding=ROUND_HALF_UP),
+                'portions': _quantity(recipe.yield_portions * factor),
+                'batch_cost': _cost(batch_costs.get(recipe.pk, Decimal('0')) * factor),
+            }
+            for recipe, factor in planned
+        ],
+        'ingredients': shopping_list,
+        'purchase_list': purchase_list,
+        'required_cost': required_cost,
+        'purchase_cost': purchase_cost,
+    }
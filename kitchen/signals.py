@@ -0,0 +1,118 @@
+"""Signal handlers that keep the stored recipe requirements, costs and the tombstones up to date."""
+
+from decimal import Decimal
+
+from django.db.models import QuerySet
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from .costs import refresh_recipe_costs, refresh_recipe_requirements
+from .models import Ingredient, Recipe, RecipeComponent, RecipeIngredient, RecipeRequirement, Tombstone
+from .prices import record_price_changes
+
+
+def _deleted_with(origin, *models):
+    """Whether a deletion was started from an instance or queryset of ``models``."""
+    if isinstance(origin, QuerySet):
+        return issubclass(origin.model, models)
+    return isinstance(origin, models)
+
+
+@receiver(post_save, sender=Ingredient)
+def ingredient_saved(sender, instance, created, update_fields=None, **kwargs):
+    """Record price changes and re-cost only the recipes that use an ingredient whose price or unit changed."""
+    if created:
+        record_price_changes([(instance.pk, None, Decimal(str(instance.cost_per_unit)))])
+        _remember_loaded(instance)
+        return
+    fields = set(update_fields) if update_fields is not None else {'cost_per_unit', 'unit', 'density'}
+    if 'cost_per_unit' in fields and instance.cost_changed:
+        record_price_changes([
+            (instance.pk, getattr(instance, '_loaded_cost_per_unit', None), Decimal(str(instance.cost_per_unit)))
+        ])
+    conversion_changed = bool(fields & {'unit', 'density'}) and instance.conversion_changed
+    if conversion_changed:
+        # Line quantities are stored in the ingredient's unit
+        instance.refresh_base_quantities()
+        refresh_recipe_requirements(
+            RecipeIngredient.objects.filter(ingredient=instance).values_list('recipe_id', flat=True)
+        )
+    elif 'cost_per_unit' in fields and instance.cost_changed:
+        # Requirements include preparations, so this reaches every recipe using them
+        refresh_recipe_costs(
+            RecipeRequirement.objects.filter(ingredient=instance).values_list('recipe_id', flat=True)
+        )
+    _remember_loaded(instance)
+
+
+def _remember_loaded(instance):
+    # Later saves of the same instance compare against what was just written
+    instance._loaded_cost_per_unit = Decimal(str(instance.cost_per_unit))
+    instance._loaded_conversion = (
+        instance.unit, None if instance.density is None else Decimal(str(instance.density))
+    )
+
+
+@receiver(pre_delete, sender=Ingredient)
+def ingredient_deleting(sender, instance, **kwargs):
+    # The requirements are gone by post_delete, so remember the recipes now
+    instance._affected_recipe_ids = list(
+        RecipeRequirement.objects.filter(ingredient=instance).values_list('recipe_id', flat=True)
+    )
+
+
+@receiver(post_delete, sender=Ingredient)
+def ingredient_deleted(sender, instance, **kwargs):
+    refresh_recipe_costs(getattr(instance, '_affected_recipe_ids', []))
+    Tombstone.objects.create(model='ingredient', object_id=instance.pk)
+
+
+@receiver(pre_delete, sender=Recipe)
+def recipe_deleting(sender, instance, **kwargs):
+    # Recipes using this one as a preparation must be rebuilt without it
+    instance._parent_recipe_ids = list(
+        RecipeComponent.objects.filter(component=instance).values_list('parent_id', flat=True)
+    )
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_deleted(sender, instance, **kwargs):
+    refresh_recipe_requirements(getattr(instance, '_parent_recipe_ids', []))
+    Tombstone.objects.create(model='recipe', object_id=instance.pk)
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_saved(sender, instance, created, **kwargs):
+    # A save rewrites the cost columns from memory and may change the yield,
+    # which scales the requirements of the recipes using it
+    if created:
+        refresh_recipe_costs([instance.pk])
+    else:
+        refresh_recipe_requirements([instance.pk])
+
+
+@receiver(post_save, sender=RecipeIngredient)
+def recipe_ingredient_saved(sender, instance, **kwargs):
+    refresh_recipe_requirements([instance.recipe_id])
+
+
+@receiver(post_delete, sender=RecipeIngredient)
+def recipe_ingredient_deleted(sender, instance, origin=None, **kwargs):
+    # Cascades from a recipe need no refresh; those from an ingredient are
+    # handled once per ingredient by ingredient_deleted.
+    if _deleted_with(origin, Recipe, Ingredient):
+        return
+    refresh_recipe_requirements([instance.recipe_id])
+
+
+@receiver(post_save, sender=RecipeComponent)
+def recipe_component_saved(sender, instance, **kwargs):
+    refresh_recipe_requirements([instance.parent_id])
+
+
+@receiver(post_delete, sender=RecipeComponent)
+def recipe_component_deleted(sender, instance, origin=None, **kwargs):
+    # Cascades from a recipe are handled by recipe_deleted
+    if _deleted_with(origin, Recipe):
+        return
+    refresh_recipe_requirements([instance.parent_id])
@@ -0,0 +1,14 @@
+// Admin changelist filters that pick their value with the autocomplete widget
+window.addEventListener('load', function() {
+    // Select2 only triggers jQuery change events
+    django.jQuery('.autocomplete-filter select').on('change', function() {
+        const params = new URLSearchParams(window.location.search);
+        params.delete('p');
+        if (this.value) {
+            params.set(this.name, this.value);
+        } else {
+            params.delete(this.name);
+        }
+        window.location.search = params.toString();
+    });
+});
@@ -1,22 +1,49 @@
 // Ingredients page JavaScript functionality
 document.addEventListener('DOMContentLoaded', function() {
+    // Ingredients currently displayed, used by the edit and stock modals
     let allIngredients = [];
-    let filteredIngredients = [];
     
-    // Load all ingredients
+    // Search, filtering and ordering run on the server
+    const query = { search: '', unit: '', sort: 'name' };
+    let requestId = 0;
+    
+    const SORT_FIELDS = {
+        name: 'name',
+        stock: '-current_stock',
+        cost: 'cost_per_unit'
+    };
+    
+    // Build the API query string for the current search, filter and sort
+    function buildQueryString() {
+        const params = new URLSearchParams();
+        if (query.search.trim()) {
+            params.set('search', query.search.trim());
+        }
+        if (query.unit) {
+            params.set('unit', query.unit);
+        }
+        params.set('ordering', SORT_FIELDS[query.sort] || 'name');
+        return params.toString();
+    }
+    
+    // Load ingredients matching the current query
     async function loadIngredients() {
         const container = document.getElementById('ingredients-container');
         const loading = document.getElementById('loading-ingredients');
+        const currentRequest = ++requestId;
         
         try {
             KitchenUtils.showLoading(loading);
             
-            const response = await KitchenUtils.apiRequest('ingredients/');
+            const response = await KitchenUtils.apiRequest(`ingredients/?${buildQueryString()}`);
+            
+            // Ignore responses to queries the user has already replaced
+            if (currentRequest !== requestId) return;
+            
             allIngredients = response.results || response;
-            filteredIngredients = [...allIngredients];
             
             KitchenUtils.hideLoading(loading);
-            displayIngredients(filteredIngredients);
+            displayIngredients(allIngredients);
             
         } catch (error) {
             KitchenUtils.hideLoading(loading);
@@ -124,48 +151,6 @@ document.addEventListener('DOMContentLoaded', function() {
         return emojis[unit] || '📦';
     }
     
-    // Search ingredients
-    function searchIngredients(query) {
-        if (!query.trim()) {
-            filteredIngredients = [...allIngredients];
-        } else {
-            const searchTerm = query.toLowerCase();
-            filteredIngredients = allIngredients.filter(ingredient => 
-                ingredient.name.toLowerCase().includes(searchTerm)
-            );
-        }
-        displayIngredients(filteredIngredients);
-    }
-    
-    // Filter by unit
-    function filterByUnit(unit) {
-        if (!unit) {
-            filteredIngredients = [...allIngredients];
-        } else {
-            filteredIngredients = allIngredients.filter(ingredient => 
-                ingredient.unit === unit
-            );
-        }
-        displayIngredients(filteredIngredients);
-    }
-    
-    // Sort ingredients
-    function sortIngredients(criteria) {
-        filteredIngredients.sort((a, b) => {
-            switch (criteria) {
-                case 'name':
-                    return a.name.localeCompare(b.name);
-                case 'stock':
-                    return parseFloat(b.current_stock) - parseFloat(a.current_stock);
-                case 'cost':
-                    return parseFloat(a.cost_per_unit) - parseFloat(b.cost_per_unit);
-                default:
-                    return 0;
-            }
-        });
-        displayIngredients(filteredIngredients);
-    }
-    
     // Edit ingredient
     window.editIngredient = function(ingredientId) {
         const ingredient = allIngredients.find(ing => ing.id === ingredientId);
@@ -301,15 +286,18 @@ document.addEventListener('DOMContentLoaded', function() {
     const sortSelect = document.getElementById('sort-ingredients');
     
     searchInput.addEventListener('input', KitchenUtils.debounce((e) => {
-        searchIngredients(e.target.value);
+        query.search = e.target.value;
+        loadIngredients();
     }, 300));
     
     filterSelect.addEventListener('change', (e) => {
-        filterByUnit(e.target.value);
+        query.unit = e.target.value;
+        loadIngredients();
     });
     
     sortSelect.addEventListener('change', (e) => {
-        sortIngredients(e.target.value);
+        query.sort = e.target.value;
+        loadIngredients();
     });
     
     // Modal event listeners
@@ -1,30 +1,64 @@
 // Recipes page JavaScript functionality
 document.addEventListener('DOMContentLoaded', function() {
-    let allRecipes = [];
-    let filteredRecipes = [];
+    // Search, filtering and ordering run on the server
+    const query = { search: '', cost: '', sort: 'name' };
+    let requestId = 0;
     
-    // Load all recipes
+    const COST_FILTERS = {
+        low: { cost_per_portion__lt: 2 },
+        medium: { cost_per_portion__gte: 2, cost_per_portion__lte: 5 },
+        high: { cost_per_portion__gt: 5 }
+    };
+    
+    const SORT_FIELDS = {
+        name: 'name',
+        cost: 'cost_per_portion',
+        portions: 'yield_portions'
+    };
+    
+    // Build the API query string for the current search, filter and sort
+    function buildQueryString() {
+        const params = new URLSearchParams();
+        if (query.search.trim()) {
+            params.set('search', query.search.trim());
+        }
+        Object.entries(COST_FILTERS[query.cost] || {}).forEach(([key, value]) => {
+            params.set(key, value);
+        });
+        params.set('ordering', SORT_FIELDS[query.sort] || 'name');
+        return params.toString();
+    }
+    
+    function hasActiveFilters() {
+        return Boolean(query.search.trim() || query.cost);
+    }
+    
+    // Load recipes matching the current query
     async function loadRecipes() {
         const container = document.getElementById('recipes-container');
         const loading = document.getElementById('loading-recipes');
         const noRecipes = document.getElementById('no-recipes');
+        const currentRequest = ++requestId;
         
         try {
             KitchenUtils.showLoading(loading);
             
-            const response = await KitchenUtils.apiRequest('recipes/');
-            allRecipes = response.results || response;
-            filteredRecipes = [...allRecipes];
+            const response = await KitchenUtils.apiRequest(`recipes/?${buildQueryString()}`);
+            
+            // Ignore responses to queries the user has already replaced
+            if (currentRequest !== requestId) return;
+            
+            const recipes = response.results || response;
             
             KitchenUtils.hideLoading(loading);
             
-            if (allRecipes.length === 0) {
+            if (recipes.length === 0 && !hasActiveFilters()) {
                 container.style.display = 'none';
                 noRecipes.style.display = 'block';
             } else {
                 noRecipes.style.display = 'none';
                 container.style.display = 'block';
-                displayRecipes(filteredRecipes);
+                displayRecipes(recipes);
             }
             
         } catch (error) {
@@ -96,8 +130,8 @@ document.addEventListener('DOMContentLoaded', function() {
     // View recipe details
     window.viewRecipe = async function(recipeId) {
         try {
-            const recipe = await KitchenUtils.apiRequest(`recipes/${recipeId}/`);
-            const costBreakdown = await KitchenUtils.apiRequest(`recipes/${recipeId}/cost_breakdown/`);
+            const recipe = await KitchenUtils.apiRequest(`recipes/${recipeId}/?include=cost_breakdown`);
+            const costBreakdown = recipe.cost_breakdown;
             
             document.getElementById('recipeModalTitle').textContent = recipe.name;
             
@@ -115,7 +149,7 @@ document.addEventListener('DOMContentLoaded', function() {
                                     <div>
                                         <strong>${ing.ingredient_name}</strong><br>
                                         <small class="text-muted">
-                                            ${KitchenUtils.formatNumber(ing.quantity, 3)} ${ing.ingredient_unit}
+                                            ${KitchenUtils.formatNumber(ing.quantity, 3)} ${ing.unit_display || ing.ingredient_unit}
                                         </small>
                                     </div>
                                     <div class="text-end">
@@ -195,68 +229,24 @@ document.addEventListener('DOMContentLoaded', function() {
         });
     };
     
-    // Search and filter functions
-    function searchRecipes(query) {
-        if (!query.trim()) {
-            filteredRecipes = [...allRecipes];
-        } else {
-            const searchTerm = query.toLowerCase();
-            filteredRecipes = allRecipes.filter(recipe => 
-                recipe.name.toLowerCase().includes(searchTerm) ||
-                recipe.description.toLowerCase().includes(searchTerm)
-            );
-        }
-        displayRecipes(filteredRecipes);
-    }
-    
-    function filterByCost(range) {
-        if (!range) {
-            filteredRecipes = [...allRecipes];
-        } else {
-            filteredRecipes = allRecipes.filter(recipe => {
-                const cost = parseFloat(recipe.cost_per_portion);
-                switch (range) {
-                    case 'low': return cost < 2;
-                    case 'medium': return cost >= 2 && cost <= 5;
-                    case 'high': return cost > 5;
-                    default: return true;
-                }
-            });
-        }
-        displayRecipes(filteredRecipes);
-    }
-    
-    function sortRecipes(criteria) {
-        filteredRecipes.sort((a, b) => {
-            switch (criteria) {
-                case 'name':
-                    return a.name.localeCompare(b.name);
-                case 'cost':
-                    return parseFloat(a.cost_per_portion) - parseFloat(b.cost_per_portion);
-                case 'portions':
-                    return a.yield_portions - b.yield_portions;
-                default:
-                    return 0;
-            }
-        });
-        displayRecipes(filteredRecipes);
-    }
-    
     // Event listeners
     const searchInput = document.getElementById('search-recipes');
     const filterSelect = document.getElementById('filter-by-cost');
     const sortSelect = document.getElementById('sort-recipes');
     
     searchInput.addEventListener('input', KitchenUtils.debounce((e) => {
-        searchRecipes(e.target.value);
+        query.search = e.target.value;
+        loadRecipes();
     }, 300));
     
     filterSelect.addEventListener('change', (e) => {
-        filterByCost(e.target.value);
+        query.cost = e.target.value;
+        loadRecipes();
     });
     
     sortSelect.addEventListener('change', (e) => {
-        sortRecipes(e.target.value);
+        query.sort = e.target.value;
+        loadRecipes();
     });
     
     // Initialize
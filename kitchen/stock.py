@@ -0,0 +1,224 @@
+"""Stock mutations that are safe under concurrent requests, recorded in the stock ledger."""
+
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.db import transaction
+from django.db.models import Case, DateTimeField, DecimalField, Exists, F, OuterRef, Subquery, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import LEDGER_START, STOCK_FIELD, Ingredient, StockMovement, StockSnapshot
+
+
+class InsufficientStock(Exception):
+    """
+    Raised when there is not enough stock to produce the requested batches.
+
+    ``missing`` is true when some required ingredient no longer exists, which
+    no amount of restocking can fix.
+    """
+
+    def __init__(self, shortages, missing=False):
+        super().__init__('Insufficient stock')
+        self.shortages = shortages
+        self.missing = missing
+
+
+# Largest absolute value that fits Ingredient.current_stock (max_digits=10, decimal_places=2)
+MAX_STOCK = Decimal('99999999.99')
+
+# Ingredients locked per snapshot transaction
+SNAPSHOT_BATCH_SIZE = 1000
+
+
+def _stock_quantity(value):
+    # Movements and balances are stored with the precision of current_stock
+    places = Decimal(1).scaleb(-Ingredient._meta.get_field('current_stock').decimal_places)
+    return value.quantize(places, rounding=ROUND_HALF_UP)
+
+
+def apply_stock_changes(changes):
+    """
+    Apply absolute and relative stock changes to many ingredients at once.
+
+    ``changes`` is a list of dicts with an ``id`` and either ``current_stock``
+    (new absolute value) or ``delta`` (amount to add, may be negative), plus
+    an optional movement ``kind`` (``adjustment`` by default) and ``note``.
+    The affected rows are locked in primary key order, every change is
+    validated against the locked values, and then all of them are written
+    with a single UPDATE using ``F()`` expressions and a single insert into
+    the stock ledger. If any change is invalid nothing is written.
+
+    Returns a list of per-item errors, empty when the changes were applied.
+    """
+    errors = []
+    seen = set()
+    for index, change in enumerate(changes):
+        if change['id'] in seen:
+            errors.append({'index': index, 'id': change['id'], 'error': 'Duplicate ingredient in request'})
+        seen.add(change['id'])
+
+    with transaction.atomic():
+        current = dict(
+            Ingredient.objects.select_for_update()
+            .filter(pk__in=seen)
+            .order_by('pk')
+            .values_list('pk', 'current_stock')
+        )
+        now = timezone.now()
+
+        whens = []
+        movements = []
+        for index, change in enumerate(changes):
+            ingredient_id = change['id']
+            if ingredient_id not in current:
+                errors.append({'index': index, 'id': ingredient_id, 'error': 'Ingredient not found'})
+                continue
+            if 'delta' in change:
+                delta = _stock_quantity(change['delta'])
+                value = F('current_stock') + Value(delta)
+            else:
+                delta = _stock_quantity(change['current_stock'] - current[ingredient_id])
+                value = Value(change['current_stock'])
+            new_stock = current[ingredient_id] + delta
+            if new_stock < 0:
+                errors.append({'index': index, 'id': ingredient_id, 'error': 'Resulting stock cannot be negative'})
+            elif new_stock > MAX_STOCK:
+                errors.append({'index': index, 'id': ingredient_id, 'error': 'Resulting stock is too large'})
+            whens.append(When(pk=ingredient_id, then=value))
+            if delta:
+                movements.append(StockMovement(
+                    ingredient_id=ingredient_id,
+                    kind=change.get('kind', StockMovement.ADJUSTMENT),
+                    quantity=delta,
+                    note=change.get('note', ''),
+                    created_at=now,
+                ))
+
+        if errors:
+            return sorted(errors, key=lambda error: error['index'])
+
+        Ingredient.objects.filter(pk__in=current).update(
+            current_stock=Case(
+                *whens,
+                default=F('current_stock'),
+                output_field=DecimalField(max_digits=10, decimal_places=2)
+            ),
+            updated_at=now,
+        )
+        StockMovement.objects.bulk_create(movements)
+    return []
+
+
+def produce_batches(recipe, batches):
+    """
+    Consume the ingredient stock needed to produce ``batches`` of ``recipe``.
+
+    The affected ingredients are locked in primary key order, so concurrent
+    producers sharing ingredients queue up instead of deadlocking, and all of
+    them are decremented with a single UPDATE using ``F()`` expressions. The
+    flattened requirements include the ingredients of the recipe's
+    preparations, and the number of queries does not depend on how many
+    ingredients the recipe has. Each consumption is recorded in the stock
+    ledger with the recipe.
+
+    Raises ``InsufficientStock`` without writing anything if any ingredient
+    falls short, including ingredients deleted since the requirements were
+    read, which count as having no stock. Returns a list of the consumed quantities and the remaining
+    stock per ingredient.
+    """
+    required = {
+        ingredient_id: _stock_quantity(quantity * batches)
+        for ingredient_id, quantity in recipe.requirements.filter(quantity__gt=0).values_list('ingredient_id', 'quantity')
+    }
+    required = {ingredient_id: quantity for ingredient_id, quantity in required.items() if quantity}
+
+    with transaction.atomic():
+        locked = {
+            ingredient['pk']: ingredient
+            for ingredient in Ingredient.objects.select_for_update()
+            .filter(pk__in=required)
+            .order_by('pk')
+            .values('pk', 'name', 'current_stock')
+        }
+
+        # Ingredients deleted since the requirements were read have no stock left
+        missing = required.keys() - locked.keys()
+        shortages = [
+            {
+                'ingredient': ingredient_id,
+                'name': locked[ingredient_id]['name'] if ingredient_id in locked else None,
+                'required': quantity,
+                'available': locked[ingredient_id]['current_stock'] if ingredient_id in locked else Decimal('0'),
+            }
+            for ingredient_id, quantity in sorted(required.items())
+            if ingredient_id in missing or locked[ingredient_id]['current_stock'] < quantity
+        ]
+        if shortages:
+            raise InsufficientStock(shortages, missing=bool(missing))
+
+        if required:
+            now = timezone.now()
+            Ingredient.objects.filter(pk__in=required).update(
+                current_stock=F('current_stock') - Case(
+                    *[When(pk=ingredient_id, then=Value(quantity)) for ingredient_id, quantity in required.items()],
+                    output_field=STOCK_FIELD
+                ),
+                updated_at=now,
+            )
+            StockMovement.objects.bulk_create([
+                StockMovement(
+                    ingredient_id=ingredient_id,
+                    kind=StockMovement.CONSUMPTION,
+                    quantity=-quantity,
+                    recipe=recipe,
+                    created_at=now,
+                )
+                for ingredient_id, quantity in sorted(required.items())
+            ])
+
+    return [
+        {
+            'ingredient': ingredient_id,
+            'name': locked[ingredient_id]['name'],
+            'consumed': quantity,
+            'remaining_stock': locked[ingredient_id]['current_stock'] - quantity,
+        }
+        for ingredient_id, quantity in sorted(required.items())
+    ]
+
+
+def take_stock_snapshots():
+    """
+    Record the current stock of every ingredient that moved since its last snapshot.
+
+    Ingredients are locked in batches while their balance is read, so no
+    movement can be half-recorded: every movement timestamped before the
+    snapshot is included in it and every later one comes after it. Returns
+    the number of snapshots written.
+    """
+    last_snapshot = StockSnapshot.objects.filter(ingredient=OuterRef('pk')).order_by('-taken_at').values('taken_at')[:1]
+    moved = Ingredient.objects.annotate(last_snapshot_at=Subquery(last_snapshot)).filter(
+        Exists(StockMovement.objects.filter(
+            ingredient=OuterRef('pk'),
+            created_at__gt=Coalesce(OuterRef('last_snapshot_at'), Value(LEDGER_START), output_field=DateTimeField()),
+        ))
+    ).order_by('pk').values_list('pk', flat=True)
+    ingredient_ids = list(moved)
+
+    written = 0
+    for start in range(0, len(ingredient_ids), SNAPSHOT_BATCH_SIZE):
+        with transaction.atomic():
+            balances = list(
+                Ingredient.objects.select_for_update()
+                .filter(pk__in=ingredient_ids[start:start + SNAPSHOT_BATCH_SIZE])
+                .order_by('pk')
+                .values_list('pk', 'current_stock')
+            )
+            taken_at = timezone.now()
+            StockSnapshot.objects.bulk_create([
+                StockSnapshot(ingredient_id=ingredient_id, taken_at=taken_at, balance=balance)
+                for ingredient_id, balance in balances
+            ])
+        written += len(balances)
+    return written
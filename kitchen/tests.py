@@ -1,3 +1,1134 @@
-from django.test import TestCase
+import io
+import json
+import threading
+import time
+import unittest
+from datetime import datetime
+from unittest import mock
+from decimal import Decimal
 
-# Create your tests here.
+from django.core.exceptions import ValidationError
+from django.core.management import CommandError, call_command
+from django.db import connection, connections
+from django.db.models import F
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework.request import Request
+from rest_framework.test import APIClient
+
+from . import requirements
+from .benchmarks import check_results, run_benchmarks
+from .catalog import import_catalog
+from .dataset import generate_dataset
+from .filters import IndexedSearchFilter
+from .instrumentation import RequestInstrumentationMiddleware
+from .models import (
+    Ingredient, IngredientPrice, IngredientPriceRollup, Recipe, RecipeComponent, RecipeIngredient,
+    RecipeRequirement, StockMovement,
+)
+from .planning import plan_production
+from .prices import record_price_changes
+from .stock import apply_stock_changes, produce_batches, take_stock_snapshots
+from .profiling import summarize
+from .serializers import IngredientSerializer
+from .units import UNITS, UnitConversionError, conversion_factor
+from .views import RecipeViewSet
+
+
+def create_recipe(name, lines, yield_portions=4):
+    """Create a recipe from ``(ingredient, quantity)`` pairs."""
+    recipe = Recipe.objects.create(name=name, yield_portions=yield_portions)
+    for ingredient, quantity in lines:
+        RecipeIngredient.objects.create(recipe=recipe, ingredient=ingredient, quantity=Decimal(quantity))
+    return recipe
+
+
+class ProduceBatchesTests(TestCase):
+    """Tests for the recipe produce action."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.flour = Ingredient.objects.create(
+            name='Harina', unit='kg', cost_per_unit=Decimal('1.20'), current_stock=Decimal('10')
+        )
+        self.eggs = Ingredient.objects.create(
+            name='Huevo', unit='u', cost_per_unit=Decimal('0.25'), current_stock=Decimal('12')
+        )
+        self.recipe = create_recipe('Pan', [(self.flour, '1'), (self.eggs, '3')])
+
+    def produce(self, recipe, batches):
+        return self.client.post(f'/api/recipes/{recipe.pk}/produce/', {'batches': batches}, format='json')
+
+    def test_produce_consumes_stock(self):
+        response = self.produce(self.recipe, 2)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['portions_produced'], 8)
+        self.flour.refresh_from_db()
+        self.eggs.refresh_from_db()
+        self.assertEqual(self.flour.current_stock, Decimal('8'))
+        self.assertEqual(self.eggs.current_stock, Decimal('6'))
+        self.assertEqual(
+            sorted(StockMovement.objects.filter(recipe=self.recipe).values_list('kind', 'quantity')),
+            [('consumption', Decimal('-6')), ('consumption', Decimal('-2'))]
+        )
+
+    def test_insufficient_stock_is_refused_without_changes(self):
+        response = self.produce(self.recipe, 5)
+
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual([item['name'] for item in response.data['shortages']], ['Huevo'])
+        self.eggs.refresh_from_db()
+        self.flour.refresh_from_db()
+        self.assertEqual(self.eggs.current_stock, Decimal('12'))
+        self.assertEqual(self.flour.current_stock, Decimal('10'))
+
+    def test_ingredient_deleted_before_the_lock_is_refused(self):
+        select_for_update = Ingredient.objects.select_for_update
+
+        def delete_then_lock(*args, **kwargs):
+            # A concurrent delete between the requirement read and the lock
+            Ingredient.objects.filter(pk=self.eggs.pk).delete()
+            return select_for_update(*args, **kwargs)
+
+        with mock.patch.object(Ingredient.objects, 'select_for_update', side_effect=delete_then_lock):
+            response = self.produce(self.recipe, 1)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            [(item['ingredient'], item['available']) for item in response.data['shortages']],
+            [(self.eggs.pk, Decimal('0'))]
+        )
+        self.flour.refresh_from_db()
+        self.assertEqual(self.flour.current_stock, Decimal('10'))
+        self.assertFalse(StockMovement.objects.filter(recipe=self.recipe).exists())
+
+    def test_consumption_matches_the_stock_precision(self):
+        self.flour.current_stock = Decimal('10.00')
+        self.flour.save()
+        fine = create_recipe('Pan fino', [(self.flour, '0.333')], yield_portions=1)
+
+        response = self.produce(fine, 3)
+
+        self.assertEqual(response.status_code, 200)
+        self.flour.refresh_from_db()
+        consumed = StockMovement.objects.get(recipe=fine).quantity
+        self.assertEqual(consumed, Decimal('-1.00'))
+        self.assertEqual(self.flour.current_stock, Decimal('10') + consumed)
+
+    def test_query_count_does_not_depend_on_ingredient_count(self):
+        extra = [
+            Ingredient.objects.create(
+                name=f'Especia {i}', unit='g', cost_per_unit=Decimal('0.01'), current_stock=Decimal('100')
+            )
+            for i in range(10)
+        ]
+        big_recipe = create_recipe('Pan especiado', [(ingredient, '1') for ingredient in extra])
+
+        # Recipe, its requirements, then savepoint, lock, update, ledger insert, release
+        with self.assertNumQueries(7):
+            self.produce(self.recipe, 1)
+        with self.assertNumQueries(7):
+            self.produce(big_recipe, 1)
+
+
+@unittest.skipUnless(
+    connection.features.has_select_for_update,
+    "Concurrent producers need row locks (SELECT ... FOR UPDATE)"
+)
+class ConcurrentProduceTests(TransactionTestCase):
+    """Stress test running parallel producers against the same ingredients."""
+
+    THREADS = 8
+    REQUESTS_PER_THREAD = 10
+
+    def test_parallel_producers_never_lose_updates(self):
+        flour = Ingredient.objects.create(
+            name='Harina', unit='kg', cost_per_unit=Decimal('1'), current_stock=Decimal('50')
+        )
+        eggs = Ingredient.objects.create(
+            name='Huevo', unit='u', cost_per_unit=Decimal('1'), current_stock=Decimal('100')
+        )
+        # Lines created in opposite orders, so unordered locking would deadlock
+        bread = create_recipe('Pan', [(flour, '1'), (eggs, '1')])
+        omelette = create_recipe('Tortilla', [(eggs, '1'), (flour, '1')])
+
+        results = []
+        lock = threading.Lock()
+
+        def producer(recipe):
+            client = APIClient()
+            try:
+                for _ in range(self.REQUESTS_PER_THREAD):
+                    response = client.post(f'/api/recipes/{recipe.pk}/produce/', {'batches': 1}, format='json')
+                    with lock:
+                        results.append(response.status_code)
+            finally:
+                connections.close_all()
+
+        threads = [
+            threading.Thread(target=producer, args=(bread if i % 2 else omelette,))
+            for i in range(self.THREADS)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        flour.refresh_from_db()
+        eggs.refresh_from_db()
+        produced = results.count(200)
+        self.assertEqual(set(results) - {200, 409}, set())
+        # Flour runs out first: exactly 50 batches succeed across all producers
+        self.assertEqual(produced, 50)
+        self.assertEqual(flour.current_stock, Decimal('0'))
+        self.assertEqual(eggs.current_stock, Decimal('100') - produced)
+
+
+class RecipeUpdateTests(TestCase):
+    """Recipe updates write only the lines that differ."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.ingredients = [
+            Ingredient.objects.create(name=f'Ingrediente {index}', unit='kg', cost_per_unit=Decimal('1'))
+            for index in range(30)
+        ]
+
+    def lines(self, recipe):
+        return {
+            line.ingredient_id: (line.pk, line.quantity)
+            for line in RecipeIngredient.objects.filter(recipe=recipe)
+        }
+
+    def update(self, recipe, quantities):
+        return self.client.patch(f'/api/recipes/{recipe.pk}/', {'ingredients': [
+            {'ingredient_id': ingredient.pk, 'quantity': quantity} for ingredient, quantity in quantities
+        ]}, format='json')
+
+    def test_only_changed_lines_are_written(self):
+        kept, changed, removed, added = self.ingredients[:4]
+        recipe = create_recipe('Pan', [(kept, '1'), (changed, '2'), (removed, '3')])
+        before = self.lines(recipe)
+
+        response = self.update(recipe, [(kept, '1'), (changed, '2.5'), (added, '4')])
+
+        self.assertEqual(response.status_code, 200)
+        after = self.lines(recipe)
+        self.assertEqual(set(after), {kept.pk, changed.pk, added.pk})
+        self.assertEqual(after[kept.pk], before[kept.pk])
+        self.assertEqual(after[changed.pk], (before[changed.pk][0], Decimal('2.5')))
+        self.assertEqual(RecipeRequirement.objects.get(recipe=recipe, ingredient=added).quantity, Decimal('4'))
+
+    def test_query_count_does_not_depend_on_line_count(self):
+        counts = []
+        for size in (3, 15):
+            recipe = create_recipe(f'Receta {size}', [(ingredient, '1') for ingredient in self.ingredients[:size]])
+            # Change, drop and add lines in the same proportion
+            quantities = [(ingredient, '2') for ingredient in self.ingredients[1:size]]
+            quantities.append((self.ingredients[size + 1], '1'))
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(self.update(recipe, quantities).status_code, 200)
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+
+
+class BulkStockUpdateTests(TestCase):
+    """Tests for the all-or-nothing bulk stock update."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.flour = Ingredient.objects.create(name='Harina', unit='kg', cost_per_unit=Decimal('1.20'))
+        self.eggs = Ingredient.objects.create(name='Huevo', unit='u', cost_per_unit=Decimal('0.25'))
+        apply_stock_changes([
+            {'id': self.flour.pk, 'current_stock': Decimal('10')},
+            {'id': self.eggs.pk, 'current_stock': Decimal('12')},
+        ])
+
+    def update(self, changes):
+        return self.client.post('/api/ingredients/bulk_update_stock/', {'changes': changes}, format='json')
+
+    def stock(self):
+        return list(Ingredient.objects.order_by('pk').values_list('current_stock', flat=True))
+
+    def test_changes_are_applied_together(self):
+        response = self.update([
+            {'id': self.flour.pk, 'delta': '-2.5'},
+            {'id': self.eggs.pk, 'current_stock': '30', 'note': 'Inventario'},
+        ])
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.stock(), [Decimal('7.50'), Decimal('30.00')])
+        self.assertEqual(
+            list(StockMovement.objects.order_by('-id')[:2].values_list('ingredient_id', 'quantity', 'note')),
+            [(self.eggs.pk, Decimal('18.00'), 'Inventario'), (self.flour.pk, Decimal('-2.50'), '')]
+        )
+
+    def test_any_invalid_change_rolls_back_the_batch(self):
+        movements = StockMovement.objects.count()
+        response = self.update([
+            {'id': self.flour.pk, 'delta': '-1'},
+            {'id': self.eggs.pk, 'delta': '-20'},
+            {'id': 999999, 'delta': '1'},
+            {'id': self.flour.pk, 'delta': '1'},
+        ])
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([(error['index'], error['error']) for error in response.data['errors']], [
+            (1, 'Resulting stock cannot be negative'),
+            (2, 'Ingredient not found'),
+            (3, 'Duplicate ingredient in request'),
+        ])
+        self.assertEqual(self.stock(), [Decimal('10.00'), Decimal('12.00')])
+        self.assertEqual(StockMovement.objects.count(), movements)
+
+    def test_invalid_items_are_reported_by_index(self):
+        response = self.update([{'id': self.flour.pk, 'delta': '1'}, {'id': self.eggs.pk}])
+
+        self.assertEqual(response.status_code, 400)
+        error, = response.data['errors']
+        self.assertEqual((error['index'], error['id']), (1, self.eggs.pk))
+        self.assertEqual(self.stock(), [Decimal('10.00'), Decimal('12.00')])
+
+
+class StockLedgerTests(TestCase):
+    """Tests for the stock ledger verification."""
+
+    def verify(self):
+        out = io.StringIO()
+        call_command('snapshot_stock', '--verify', stdout=out)
+        return out.getvalue()
+
+    def test_verify_passes_after_mixed_movements(self):
+        flour = Ingredient.objects.create(name='Harina', unit='kg', cost_per_unit=Decimal('1.20'))
+        eggs = Ingredient.objects.create(name='Huevo', unit='u', cost_per_unit=Decimal('0.25'))
+        recipe = create_recipe('Pan', [(flour, '0.333'), (eggs, '3')])
+
+        self.assertEqual(apply_stock_changes([
+            {'id': flour.pk, 'current_stock': Decimal('10')},
+            {'id': eggs.pk, 'delta': Decimal('24'), 'kind': StockMovement.RECEIPT},
+        ]), [])
+        produce_batches(recipe, 2)
+        self.assertEqual(take_stock_snapshots(), 2)
+        produce_batches(recipe, 1)
+        self.assertEqual(apply_stock_changes([{'id': eggs.pk, 'delta': Decimal('-2'), 'kind': StockMovement.WASTE, 'note': 'Rotos'}]), [])
+
+        self.assertIn('Every current_stock matches', self.verify())
+        flour.refresh_from_db()
+        # 10 - 0.67 - 0.33: each consumption rounded to the stock precision
+        self.assertEqual(flour.current_stock, Decimal('9.00'))
+
+        Ingredient.objects.filter(pk=eggs.pk).update(current_stock=F('current_stock') + 1)
+        with self.assertRaises(CommandError):
+            self.verify()
+
+
+class RecipeCostVerificationTests(TestCase):
+    """Tests for ``rebuild_recipe_costs --verify``."""
+
+    def verify(self):
+        out = io.StringIO()
+        call_command('rebuild_recipe_costs', '--verify', stdout=out)
+        return out.getvalue()
+
+    def test_verify_catches_requirement_drift(self):
+        flour = Ingredient.objects.create(name='Harina', unit='kg', cost_per_unit=Decimal('1.20'))
+        eggs = Ingredient.objects.create(name='Huevo', unit='u', cost_per_unit=Decimal('0.25'))
+        dough = create_recipe('Masa', [(flour, '1')], yield_portions=2)
+        pie = create_recipe('Tarta', [(eggs, '2')])
+        RecipeComponent.objects.create(parent=pie, component=dough, portions=Decimal('1'))
+        self.assertIn('up to date', self.verify())
+
+        # Drift the costs don't show: they're computed from these same rows
+        RecipeRequirement.objects.filter(recipe=pie, ingredient=flour).delete()
+        RecipeRequirement.objects.filter(recipe=dough).update(quantity=Decimal('3'))
+        Recipe.objects.all().refresh_costs()
+        out = io.StringIO()
+        with self.assertRaises(CommandError):
+            call_command('rebuild_recipe_costs', '--verify', stdout=out)
+        self.assertIn(f'#{pie.pk} ingredient #{flour.pk}: stored requirement None, expected 0.500000', out.getvalue())
+        self.assertIn(f'#{dough.pk} ingredient #{flour.pk}: stored requirement 3.000000', out.getvalue())
+
+        call_command('rebuild_recipe_costs', stdout=io.StringIO())
+        self.assertIn('up to date', self.verify())
+        self.assertEqual(RecipeRequirement.objects.get(recipe=pie, ingredient=flour).quantity, Decimal('0.5'))
+
+
+class RecipeCostAnnotationTests(TestCase):
+    """The ``with_costs()`` annotations agree with the stored cost columns."""
+
+    def assertStoredCostsMatch(self):
+        recipes = Recipe.objects.with_costs().order_by('pk')
+        self.assertTrue(recipes)
+        for recipe in recipes:
+            self.assertEqual(
+                (recipe.batch_cost, recipe.cost_per_portion),
+                (
+                    recipe.computed_batch_cost.quantize(Decimal('0.0001')),
+                    recipe.computed_cost_per_portion.quantize(Decimal('0.0001')),
+                ),
+                recipe.name,
+            )
+
+    def test_annotations_equal_stored_columns(self):
+        flour = Ingredient.objects.create(name='Harina', unit='kg', cost_per_unit=Decimal('1.20'))
+        eggs = Ingredient.objects.create(name='Huevo', unit='u', cost_per_unit=Decimal('0.25'))
+        dough = create_recipe('Masa', [(flour, '1'), (eggs, '2')], yield_portions=3)
+        pie = create_recipe('Tarta', [(eggs, '1')])
+        RecipeComponent.objects.create(parent=pie, component=dough, portions=Decimal('2'))
+        create_recipe('Vacía', [])
+        create_recipe('Sin rendimiento', [(flour, '1')], yield_portions=0)
+        self.assertStoredCostsMatch()
+        pie = Recipe.objects.with_costs().get(pk=pie.pk)
+        self.assertEqual(pie.computed_batch_cost.quantize(Decimal('0.0001')), Decimal('1.3833'))
+
+        # Every kind of edit keeps them in step
+        flour.cost_per_unit = Decimal('2.10')
+        flour.save()
+        RecipeIngredient.objects.filter(recipe=dough, ingredient=eggs).update(quantity=Decimal('5'))
+        line = RecipeIngredient.objects.get(recipe=dough, ingredient=eggs)
+        line.save()
+        dough.yield_portions = 7
+        dough.save()
+        self.assertStoredCostsMatch()
+
+
+class PriceChangeRecostTests(TestCase):
+    """A price change re-costs only the recipes that use the ingredient."""
+
+    def test_only_recipes_using_the_ingredient_are_recosted(self):
+        flour = Ingredient.objects.create(name='Harina', unit='kg', cost_per_unit=Decimal('1.20'))
+        eggs = Ingredient.objects.create(name='Huevo', unit='u', cost_per_unit=Decimal('0.25'))
+        dough = create_recipe('Masa', [(flour, '1')], yield_portions=2)
+        pie = create_recipe('Tarta', [(eggs, '2')])
+        RecipeComponent.objects.create(parent=pie, component=dough, portions=Decimal('1'))
+        omelette = create_recipe('Tortilla', [(eggs, '3')])
+        before = {recipe.pk: recipe for recipe in Recipe.objects.all()}
+
+        response = APIClient().patch(f'/api/ingredients/{flour.pk}/', {'cost_per_unit': '2.00'}, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        after = {recipe.pk: recipe for recipe in Recipe.objects.all()}
+        # Through the preparation, Tarta uses half a kilo of flour
+        self.assertEqual(after[dough.pk].batch_cost, Decimal('2.00'))
+        self.assertEqual(after[pie.pk].batch_cost, Decimal('1.50'))
+        for recipe in (dough, pie):
+            self.assertGreater(after[recipe.pk].updated_at, before[recipe.pk].updated_at)
+        self.assertEqual(
+            (after[omelette.pk].batch_cost, after[omelette.pk].updated_at),
+            (before[omelette.pk].batch_cost, before[omelette.pk].updated_at),
+        )
+
+
+class IngredientUpdateTests(TestCase):
+    """Ingredient edits leave the stock balance to the ledger."""
+
+    def test_edit_keeps_a_movement_made_after_the_ingredient_was_read(self):
+        flour = Ingredient.objects.create(name='Harina', unit='kg', cost_per_unit=Decimal('1.20'))
+        self.assertEqual(apply_stock_changes([{'id': flour.pk, 'current_stock': Decimal('10')}]), [])
+        stale = Ingredient.objects.get(pk=flour.pk)
+        serializer = IngredientSerializer(stale, data={'cost_per_unit': '1.30'}, partial=True)
+        self.assertTrue(serializer.is_valid())
+
+        # A production commits between the read and the save
+        self.assertEqual(apply_stock_changes([{'id': flour.pk, 'delta': Decimal('-3')}]), [])
+        serializer.save()
+
+        flour.refresh_from_db()
+        self.assertEqual((flour.cost_per_unit, flour.current_stock), (Decimal('1.30'), Decimal('7.00')))
+        self.assertEqual(serializer.data['current_stock'], '7.00')
+        call_command('snapshot_stock', '--verify', stdout=io.StringIO())
+
+
+class UnitConversionTests(TestCase):
+    """Tests for unit and density conversions."""
+
+    def test_conversions_round_trip(self):
+        density = Decimal('0.92')
+        quantity = Decimal('2.5')
+        for from_unit in UNITS:
+            for to_unit in UNITS:
+                try:
+                    there = quantity * conversion_factor(from_unit, to_unit, density)
+                except UnitConversionError:
+                    self.assertIn('u', (from_unit, to_unit))
+                    continue
+                back = there * conversion_factor(to_unit, from_unit, density)
+                self.assertAlmostEqual(back, quantity, places=6, msg=f'{from_unit} -> {to_unit}')
+
+    def test_mass_and_volume_need_a_density(self):
+        with self.assertRaises(UnitConversionError):
+            conversion_factor('cup', 'kg')
+        self.assertEqual(conversion_factor('l', 'kg', Decimal('0.92')), Decimal('0.92'))
+
+    def test_lines_store_the_quantity_in_the_ingredient_unit(self):
+        oil = Ingredient.objects.create(
+            name='Aceite', unit='kg', cost_per_unit=Decimal('5'), density=Decimal('0.92')
+        )
+        recipe = create_recipe('Aliño', [])
+        line = RecipeIngredient.objects.create(recipe=recipe, ingredient=oil, quantity=Decimal('2'), unit='cup')
+        # 2 cups of 240 ml at 0.92 g/ml
+        self.assertEqual(line.base_quantity, Decimal('0.4416'))
+        self.assertEqual(RecipeRequirement.objects.get(recipe=recipe, ingredient=oil).quantity, Decimal('0.4416'))
+
+
+class ConditionalGetTests(TestCase):
+    """Tests for the ETag validators of the recipe endpoints."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.flour = Ingredient.objects.create(
+            name='Harina', unit='kg', cost_per_unit=Decimal('1.20'), current_stock=Decimal('10')
+        )
+        self.recipe = create_recipe('Pan', [(self.flour, '1')])
+        self.other = create_recipe('Galleta', [(self.flour, '1')])
+
+    def etag(self, path):
+        response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.get(path, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        return response['ETag']
+
+    def test_matching_etag_answers_304_until_a_write(self):
+        detail = f'/api/recipes/{self.recipe.pk}/'
+        paths = [detail, f'{detail}cost_breakdown/', '/api/recipes/', '/api/recipes/producible/']
+        writes = [
+            lambda: self.client.patch(detail, {'description': 'Masa madre'}, format='json'),
+            lambda: self.client.patch(f'/api/ingredients/{self.flour.pk}/', {'cost_per_unit': '1.50'}, format='json'),
+            lambda: self.client.post(f'{detail}produce/', {'batches': 1}, format='json'),
+        ]
+        for write in writes:
+            etags = [self.etag(path) for path in paths]
+            self.assertLess(write().status_code, 300)
+            self.assertEqual(
+                [self.client.get(path, HTTP_IF_NONE_MATCH=etag).status_code for path, etag in zip(paths, etags)],
+                [200] * len(paths)
+            )
+
+    def test_detail_validators_aggregate_each_relation_on_its_own(self):
+        RecipeComponent.objects.create(parent=self.recipe, component=self.other, portions=Decimal('1'))
+        detail = f'/api/recipes/{self.recipe.pk}/'
+        etag = self.etag(detail)
+
+        view = RecipeViewSet(
+            action='retrieve', kwargs={'pk': self.recipe.pk}, request=Request(RequestFactory().get(detail))
+        )
+        with CaptureQueriesContext(connection) as queries:
+            view.get_object_validators(None, pk=self.recipe.pk)
+        sql, = [query['sql'] for query in queries]
+        # Requirements and preparations are never joined together
+        parts = sql.split('(SELECT')
+        self.assertEqual(len(parts), 3)
+        self.assertFalse([part for part in parts if 'reciperequirement' in part and 'recipecomponent' in part])
+
+        self.other.description = 'Dulce'
+        self.other.save()
+        self.assertEqual(self.client.get(detail, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_deleting_a_recipe_changes_the_list_etag(self):
+        etag = self.etag('/api/recipes/')
+        self.assertEqual(self.client.delete(f'/api/recipes/{self.other.pk}/').status_code, 204)
+        self.assertEqual(self.client.get('/api/recipes/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class DeltaSyncTests(TestCase):
+    """Tests for ``?updated_since=`` delta lists."""
+
+    def sync(self, since):
+        response = self.client.get('/api/ingredients/', {'updated_since': since.isoformat()})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_deletions_are_listed_as_tombstones_since_the_last_sync(self):
+        kept = Ingredient.objects.create(name='Harina', unit='kg', cost_per_unit=Decimal('1.20'))
+        deleted = Ingredient.objects.create(name='Huevo', unit='u', cost_per_unit=Decimal('0.25'))
+        deleted_id = deleted.pk
+        before = timezone.now()
+        deleted.delete()
+
+        delta = self.sync(before)
+        self.assertEqual(delta['deleted'], [deleted_id])
+        self.assertEqual([row['id'] for row in delta['results']], [])
+
+        kept.cost_per_unit = Decimal('1.30')
+        kept.save()
+        delta = self.sync(parse_datetime(delta['server_time']))
+        self.assertEqual(delta['deleted'], [])
+        self.assertEqual([row['id'] for row in delta['results']], [kept.pk])
+
+
+class ProducibleTests(TestCase):
+    """Tests for the producible recipes list."""
+
+    def setUp(self):
+        self.flour = Ingredient.objects.create(
+            name='Harina', unit='kg', cost_per_unit=Decimal('1.20'), current_stock=Decimal('10')
+        )
+        create_recipe('Pan', [(self.flour, '1')])
+        create_recipe('Bizcocho', [(self.flour, '2')], yield_portions=2)
+        create_recipe('Torta', [(self.flour, '4')], yield_portions=1)
+        create_recipe('Hogaza', [(self.flour, '20')])
+        create_recipe('Vacía', [])
+
+    def producible(self, query=''):
+        response = self.client.get(f'/api/recipes/producible/{query}')
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def portions(self, query=''):
+        return [(recipe['name'], recipe['producible_portions']) for recipe in self.producible(query)['results']]
+
+    def test_min_portions(self):
+        self.assertEqual(self.portions(), [('Pan', 40), ('Bizcocho', 10), ('Torta', 2)])
+        self.assertEqual(self.portions('?min_portions=10'), [('Pan', 40), ('Bizcocho', 10)])
+        self.assertEqual(self.portions('?min_portions=41'), [])
+
+    def test_ordering(self):
+        self.assertEqual(self.portions('?ordering=producible_portions'), [('Torta', 2), ('Bizcocho', 10), ('Pan', 40)])
+        self.assertEqual([name for name, _portions in self.portions('?ordering=name')], ['Bizcocho', 'Pan', 'Torta'])
+        self.assertEqual([name for name, _portions in self.portions('?ordering=-name')], ['Torta', 'Pan', 'Bizcocho'])
+
+    def test_invalid_parameters_are_refused(self):
+        for query in ('?min_portions=0', '?min_portions=muchas', '?ordering=cost'):
+            response = self.client.get(f'/api/recipes/producible/{query}')
+            self.assertEqual(response.status_code, 400, query)
+
+    def test_pagination(self):
+        for number in range(25):
+            create_recipe(f'Galleta {number:02}', [(self.flour, '1')], yield_portions=1)
+
+        first = self.producible('?ordering=name')
+        second = self.producible('?ordering=name&page=2')
+        self.assertEqual(first['count'], 28)
+        self.assertIsNone(second['next'])
+        names = [recipe['name'] for recipe in first['results'] + second['results']]
+        self.assertEqual((len(first['results']), len(names)), (20, 28))
+        self.assertEqual(names, sorted(names))
+
+
+class ProducibleFieldSelectionTests(TestCase):
+    """The producible list selects fields like the recipe list."""
+
+    def setUp(self):
+        flour = Ingredient.objects.create(
+            name='Harina', unit='kg', cost_per_unit=Decimal('1.20'), current_stock=Decimal('10')
+        )
+        create_recipe('Pan', [(flour, '1')])
+
+    def producible(self, query=''):
+        response = self.client.get(f'/api/recipes/producible/{query}')
+        self.assertEqual(response.status_code, 200)
+        return response.json()['results']
+
+    def test_fields_expand_and_include(self):
+        recipe, = self.producible()
+        self.assertNotIn('ingredients', recipe)
+        self.assertEqual(self.producible('?fields=id,name,producible_portions'), [
+            {'id': recipe['id'], 'name': 'Pan', 'producible_portions': recipe['producible_portions']}
+        ])
+        recipe, = self.producible('?expand=ingredients&include=cost_breakdown')
+        self.assertEqual([line['ingredient_name'] for line in recipe['ingredients']], ['Harina'])
+        self.assertIn('cost_breakdown', recipe)
+
+    def test_unknown_fields_are_refused(self):
+        response = self.client.get('/api/recipes/producible/?fields=secret')
+        self.assertEqual(response.status_code, 400)
+
+
+class RecipeBatchTests(TestCase):
+    """Tests for ``?ids=`` batch retrieves and ``?include=cost_breakdown``."""
+
+    def setUp(self):
+        self.flour = Ingredient.objects.create(
+            name='Harina', unit='kg', cost_per_unit=Decimal('0.85'), current_stock=Decimal('10')
+        )
+        self.eggs = Ingredient.objects.create(
+            name='Huevo', unit='u', cost_per_unit=Decimal('0.25'), current_stock=Decimal('12')
+        )
+        self.recipes = [
+            create_recipe(f'Pan {index}', [(self.flour, '0.5'), (self.eggs, str(index))]) for index in range(1, 4)
+        ]
+
+    def test_ids_return_every_requested_recipe_at_once(self):
+        ids = [recipe.pk for recipe in self.recipes]
+        # Three aggregates for the ETag, then one query for the recipes
+        with self.assertNumQueries(4):
+            response = self.client.get('/api/recipes/', {'ids': f'{ids[2]},{ids[0]}', 'fields': 'id,name'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), [{'id': ids[0], 'name': 'Pan 1'}, {'id': ids[2], 'name': 'Pan 3'}])
+
+        data = self.client.get('/api/recipes/', {'ids': ','.join(map(str, ids)), 'include': 'cost_breakdown'}).json()
+        self.assertEqual([recipe['cost_breakdown']['recipe_name'] for recipe in data], ['Pan 1', 'Pan 2', 'Pan 3'])
+        self.assertEqual(
+            [recipe['cost_breakdown']['batch_cost'] for recipe in data], [recipe['batch_cost'] for recipe in data]
+        )
+
+    def test_bad_ids_are_refused(self):
+        too_many = ','.join(str(pk) for pk in range(1, RecipeViewSet.MAX_BATCH_IDS + 2))
+        for ids in ('1,dos', '', ',', too_many):
+            response = self.client.get('/api/recipes/', {'ids': ids})
+            self.assertEqual(response.status_code, 400, ids)
+        self.assertEqual(self.client.get('/api/recipes/', {'include': 'secret'}).status_code, 400)
+
+    def test_breakdown_amounts_match_the_recipe_fields(self):
+        recipe = self.recipes[0]
+        data = self.client.get(f'/api/recipes/{recipe.pk}/', {'include': 'cost_breakdown'}).json()
+        lines = {line['ingredient_name']: line['total_cost'] for line in data['ingredients']}
+        breakdown = data['cost_breakdown']
+
+        self.assertEqual(breakdown['batch_cost'], data['batch_cost'])
+        self.assertEqual(breakdown['cost_per_portion'], data['cost_per_portion'])
+        self.assertEqual(
+            [(line['name'], line['total_cost'], line['percentage_of_total']) for line in breakdown['ingredients']],
+            [('Harina', lines['Harina'], '62.96'), ('Huevo', lines['Huevo'], '37.04')]
+        )
+        self.assertEqual(self.client.get(f'/api/recipes/{recipe.pk}/cost_breakdown/').json(), breakdown)
+
+
+class CatalogImportTests(TestCase):
+    """Tests for the catalog import report."""
+
+    LINES = [
+        'name,unit,cost_per_unit,current_stock\n',
+        'Harina,kg,1.20,10\n',
+        'Huevo,u,0.25,12\n',
+    ]
+
+    def import_with_stock_error(self, dry_run):
+        error = [{'index': 1, 'id': 0, 'error': 'Resulting stock is too large'}]
+        with mock.patch('kitchen.catalog.apply_stock_changes', return_value=error):
+            return import_catalog('ingredients', self.LINES, 'csv', dry_run=dry_run)
+
+    def test_stock_errors_roll_back_the_import(self):
+        result = self.import_with_stock_error(dry_run=False)
+
+        self.assertTrue(result['rolled_back'])
+        self.assertEqual(result['errors'], [{'line': 3, 'error': 'Resulting stock is too large'}])
+        self.assertEqual((result['created'], result['updated']), (0, 0))
+        self.assertFalse(Ingredient.objects.exists())
+
+    def test_stock_errors_are_reported_by_dry_runs(self):
+        result = self.import_with_stock_error(dry_run=True)
+
+        self.assertTrue(result['rolled_back'])
+        self.assertEqual(result['errors'], [{'line': 3, 'error': 'Resulting stock is too large'}])
+        self.assertFalse(Ingredient.objects.exists())
+
+    def test_import_applies_stock_through_the_ledger(self):
+        result = import_catalog('ingredients', self.LINES, 'csv')
+
+        self.assertEqual((result['created'], result['rolled_back'], result['errors']), (2, False, []))
+        self.assertEqual(Ingredient.objects.get(name='Huevo').current_stock, Decimal('12'))
+        self.assertEqual(StockMovement.objects.count(), 2)
+
+
+class SearchTests(TestCase):
+    """``?search=`` matches substrings of the name and description on every database."""
+
+    def setUp(self):
+        chicken = Ingredient.objects.create(name='Pechuga de pollo', unit='kg', cost_per_unit=Decimal('6'))
+        create_recipe('Sopa de pollo', [(chicken, '0.5')])
+        Recipe.objects.create(name='Caldo', description='Caldo corto de pollo y verduras', yield_portions=4)
+        Recipe.objects.create(name='Pollo asado', yield_portions=2)
+        Recipe.objects.create(name='Ensalada', yield_portions=2)
+
+    def search(self, path):
+        return sorted(item['name'] for item in self.client.get(path).json()['results'])
+
+    def test_fallback_matches_substrings_of_name_and_description(self):
+        self.assertEqual(self.search('/api/recipes/?search=pollo'), ['Caldo', 'Pollo asado', 'Sopa de pollo'])
+        self.assertEqual(self.search('/api/recipes/?search=verduras'), ['Caldo'])
+        self.assertEqual(self.search('/api/recipes/?search=pollo sopa'), ['Sopa de pollo'])
+        self.assertEqual(self.search('/api/ingredients/?search=pollo'), ['Pechuga de pollo'])
+
+    def test_mysql_searches_the_fulltext_index(self):
+        request = Request(RequestFactory().get('/', {'search': 'pollo y'}))
+        with mock.patch.object(connection, 'vendor', 'mysql'):
+            sql = str(IndexedSearchFilter().filter_queryset(request, Recipe.objects.all(), RecipeViewSet()).query)
+        self.assertIn('MATCH ("kitchen_recipe"."name", "kitchen_recipe"."description") AGAINST (+"pollo"', sql)
+        # Terms shorter than an ngram aren't indexed
+        self.assertIn('LIKE', sql)
+
+
+class PriceSimulationTests(TestCase):
+    """Tests for the what-if price simulation."""
+
+    def setUp(self):
+        self.flour = Ingredient.objects.create(name='Harina', unit='kg', cost_per_unit=Decimal('1.20'))
+        self.eggs = Ingredient.objects.create(name='Huevo', unit='u', cost_per_unit=Decimal('0.25'))
+        self.milk = Ingredient.objects.create(name='Leche', unit='l', cost_per_unit=Decimal('0.90'))
+        self.dough = create_recipe('Masa', [(self.flour, '2'), (self.eggs, '4')], yield_portions=2)
+        self.pie = create_recipe('Tarta', [(self.milk, '0.5')], yield_portions=8)
+        RecipeComponent.objects.create(parent=self.pie, component=self.dough, portions=Decimal('1'))
+        self.drink = create_recipe('Batido', [(self.milk, '0.3')], yield_portions=1)
+
+    def manual_batch_cost(self, recipe, prices):
+        return sum(
+            requirement.quantity * prices.get(requirement.ingredient_id, requirement.ingredient.cost_per_unit)
+            for requirement in RecipeRequirement.objects.filter(recipe=recipe).select_related('ingredient')
+        )
+
+    def test_deltas_match_a_manual_recost(self):
+        prices = {self.flour.pk: Decimal('1.50'), self.eggs.pk: Decimal('0.25') * Decimal('1.2')}
+        response = APIClient().post('/api/recipes/price_simulation/', {
+            'changes': [{'id': self.flour.pk, 'cost_per_unit': '1.50'}, {'id': self.eggs.pk, 'percent': '20'}],
+        }, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        results = {entry['id']: entry for entry in response.data['recipes']}
+        self.assertEqual(set(results), {self.dough.pk, self.pie.pk})
+        for recipe in (self.dough, self.pie):
+            recipe.refresh_from_db()
+            old_cost = self.manual_batch_cost(recipe, {})
+            new_cost = self.manual_batch_cost(recipe, prices)
+            entry = results[recipe.pk]
+            self.assertEqual(Decimal(entry['batch_cost']), old_cost)
+            self.assertEqual(Decimal(entry['new_batch_cost']), new_cost)
+            self.assertEqual(Decimal(entry['batch_cost_delta']), new_cost - old_cost)
+            # Per-portion costs come from floats rounded to 4 places
+            self.assertAlmostEqual(
+                Decimal(entry['new_cost_per_portion']), new_cost / recipe.yield_portions, delta=Decimal('0.0001')
+            )
+        self.assertEqual(response.data['recipes_affected'], 2)
+        self.assertEqual(
+            Decimal(response.data['total_batch_cost_delta']),
+            sum(Decimal(entry['batch_cost_delta']) for entry in results.values()),
+        )
+        # The simulation never writes the hypothetical prices
+        self.flour.refresh_from_db()
+        self.assertEqual(self.flour.cost_per_unit, Decimal('1.20'))
+
+    def test_unit_shift_yields_to_ingredient_change(self):
+        response = APIClient().post('/api/recipes/price_simulation/', {
+            'changes': [{'id': self.milk.pk, 'cost_per_unit': '0.90'}],
+            'unit_shifts': {'l': '50', 'kg': '10'},
+        }, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        results = {entry['id']: entry for entry in response.data['recipes']}
+        self.assertNotIn(self.drink.pk, results)
+        expected = self.manual_batch_cost(self.dough, {self.flour.pk: Decimal('1.32')})
+        self.assertEqual(Decimal(results[self.dough.pk]['new_batch_cost']), expected)
+
+
+class ShoppingListTests(TestCase):
+    """Tests for the consolidated shopping list."""
+
+    def setUp(self):
+        self.flour = Ingredient.objects.create(
+            name='Harina', unit='kg', cost_per_unit=Decimal('1.20'), current_stock=Decimal('3')
+        )
+        self.eggs = Ingredient.objects.create(
+            name='Huevo', unit='u', cost_per_unit=Decimal('0.25'), current_stock=Decimal('20')
+        )
+        self.bread = create_recipe('Pan', [(self.flour, '1'), (self.eggs, '2')])
+        self.pie = create_recipe('Tarta', [(self.flour, '0.5')])
+        RecipeComponent.objects.create(parent=self.pie, component=self.bread, portions=Decimal('2'))
+
+    def shopping_list(self, items):
+        return APIClient().post('/api/recipes/shopping_list/', {'items': items}, format='json')
+
+    def test_totals_and_shortfall(self):
+        response = self.shopping_list([
+            {'recipe_id': self.bread.pk, 'scale_factor': '2'},
+            {'recipe_id': self.pie.pk, 'target_portions': 8},
+            {'recipe_id': self.bread.pk, 'scale_factor': '1'},
+        ])
+
+        self.assertEqual(response.status_code, 200)
+        ingredients = {entry['name']: entry for entry in response.data['ingredients']}
+        # Pan x3 plus Tarta x2, whose half batch of Pan counts towards both ingredients
+        self.assertEqual(ingredients['Harina']['required_quantity'], Decimal('5'))
+        self.assertEqual(ingredients['Huevo']['required_quantity'], Decimal('8'))
+        self.assertEqual(ingredients['Harina']['shortfall'], Decimal('2'))
+        self.assertEqual(ingredients['Huevo']['shortfall'], Decimal('0'))
+        self.assertEqual(ingredients['Harina']['required_cost'], Decimal('6.00'))
+        self.assertEqual(ingredients['Harina']['purchase_cost'], Decimal('2.40'))
+        self.assertEqual(
+            [(entry['name'], entry['quantity'], entry['cost']) for entry in response.data['purchase_list']],
+            [('Harina', Decimal('2'), Decimal('2.40'))],
+        )
+        self.assertEqual(response.data['required_cost'], Decimal('8.00'))
+        self.assertEqual(response.data['purchase_cost'], Decimal('2.40'))
+        self.assertEqual(
+            [(entry['name'], entry['scale_factor'], entry['batch_cost']) for entry in response.data['recipes']],
+            [('Pan', Decimal('2'), Decimal('3.40')), ('Tarta', Decimal('2'), Decimal('2.90')), ('Pan', Decimal('1'), Decimal('1.70'))],
+        )
+
+    def test_unknown_recipe_is_rejected(self):
+        response = self.shopping_list([{'recipe_id': self.bread.pk + 1000, 'scale_factor': '1'}])
+        self.assertEqual(response.status_code, 400)
+
+
+class PriceHistoryTests(TestCase):
+    """Tests for the price roll-ups and recipe costs at past prices."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.flour = Ingredient.objects.create(name='Harina', unit='kg', cost_per_unit=Decimal('1.20'))
+        self.eggs = Ingredient.objects.create(name='Huevo', unit='u', cost_per_unit=Decimal('0.25'))
+        self.recipe = create_recipe('Pan', [(self.flour, '2'), (self.eggs, '4')])
+        # Replace the prices recorded on creation with a known history
+        IngredientPrice.objects.all().delete()
+        IngredientPriceRollup.objects.all().delete()
+        record_price_changes([(self.flour.pk, None, '1.00')], at=self.moment(4, 9))
+        record_price_changes([(self.flour.pk, Decimal('1.00'), '1.50')], at=self.moment(4, 15))
+        record_price_changes(
+            [(self.flour.pk, Decimal('1.50'), '1.20'), (self.eggs.pk, None, '0.25')], at=self.moment(6, 10)
+        )
+
+    def moment(self, day, hour):
+        """A time in the week starting on Monday 2024-03-04."""
+        return timezone.make_aware(datetime(2024, 3, day, hour))
+
+    def rollups(self):
+        return list(IngredientPriceRollup.objects.order_by('ingredient', 'period', 'period_start').values_list(
+            'ingredient', 'period', 'period_start', 'open', 'high', 'low', 'close', 'changes'
+        ))
+
+    def price_history(self, interval):
+        response = self.client.get(f'/api/ingredients/{self.flour.pk}/price_history/', {
+            'interval': interval, 'since': self.moment(4, 0).isoformat(), 'until': self.moment(6, 23).isoformat(),
+        })
+        self.assertEqual(response.status_code, 200)
+        return response.data['points']
+
+    def test_daily_and_weekly_rollups(self):
+        days = [
+            (str(point['period_start']), point['open'], point['high'], point['low'], point['close'], point['changes'])
+            for point in self.price_history('day')
+        ]
+        self.assertEqual(days, [
+            ('2024-03-04', Decimal('1.00'), Decimal('1.50'), Decimal('1.00'), Decimal('1.50'), 2),
+            # A day without changes carries the previous close over
+            ('2024-03-05', Decimal('1.50'), Decimal('1.50'), Decimal('1.50'), Decimal('1.50'), 0),
+            ('2024-03-06', Decimal('1.50'), Decimal('1.50'), Decimal('1.20'), Decimal('1.20'), 1),
+        ])
+        week, = self.price_history('week')
+        self.assertEqual(
+            (week['open'], week['high'], week['low'], week['close'], week['changes']),
+            (Decimal('1.00'), Decimal('1.50'), Decimal('1.00'), Decimal('1.20'), 3),
+        )
+        self.assertEqual(
+            [point['cost_per_unit'] for point in self.price_history('raw')],
+            [Decimal('1.00'), Decimal('1.50'), Decimal('1.20')],
+        )
+
+    def test_rebuild_matches_incremental_rollups(self):
+        incremental = self.rollups()
+        call_command('rebuild_price_rollups', stdout=io.StringIO())
+        self.assertEqual(self.rollups(), incremental)
+
+    def cost_as_of(self, at):
+        response = self.client.get(f'/api/recipes/{self.recipe.pk}/cost_as_of/', {'at': at})
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_cost_as_of_with_missing_prices(self):
+        result = self.cost_as_of('2024-03-05')
+        self.assertEqual(result['missing_prices'], [self.eggs.pk])
+        lines = {line['name']: line for line in result['ingredients']}
+        self.assertEqual(lines['Harina']['total_cost'], Decimal('3.00'))
+        self.assertIsNone(lines['Huevo']['cost_per_unit'])
+        self.assertIsNone(lines['Huevo']['total_cost'])
+        # Only the priced ingredients are added up
+        self.assertEqual(result['batch_cost'], Decimal('3.00'))
+
+        result = self.cost_as_of('2024-03-06')
+        self.assertEqual(result['missing_prices'], [])
+        self.assertEqual((result['batch_cost'], result['cost_per_portion']), (Decimal('3.40'), Decimal('0.85')))
+
+        result = self.cost_as_of('2024-03-01')
+        self.assertEqual(result['missing_prices'], [self.flour.pk, self.eggs.pk])
+        self.assertEqual(result['batch_cost'], Decimal('0'))
+
+    def test_cost_as_of_rejects_invalid_moment(self):
+        response = self.client.get(f'/api/recipes/{self.recipe.pk}/cost_as_of/', {'at': 'ayer'})
+        self.assertEqual(response.status_code, 400)
+
+
+class WhereUsedTests(TestCase):
+    """Tests for the recipes using an ingredient and its share of their cost."""
+
+    def setUp(self):
+        self.flour = Ingredient.objects.create(name='Harina', unit='kg', cost_per_unit=Decimal('1.00'))
+        self.eggs = Ingredient.objects.create(name='Huevo', unit='u', cost_per_unit=Decimal('0.25'))
+        self.bread = create_recipe('Pan', [(self.flour, '3'), (self.eggs, '4')])
+        self.pie = create_recipe('Tarta', [(self.flour, '1'), (self.eggs, '4')])
+        RecipeComponent.objects.create(parent=self.pie, component=self.bread, portions=Decimal('2'))
+        self.filling = create_recipe('Relleno', [(self.eggs, '4')])
+        RecipeComponent.objects.create(parent=self.filling, component=self.bread, portions=Decimal('4'))
+        create_recipe('Tortilla', [(self.eggs, '6')])
+
+    def where_used(self, ingredient):
+        response = APIClient().get(f'/api/ingredients/{ingredient.pk}/where_used/')
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_percentages_of_recipe_cost(self):
+        result = self.where_used(self.flour)
+
+        self.assertEqual(result['recipe_count'], 3)
+        fields = ('name', 'quantity', 'direct_quantity', 'line_cost', 'percentage_of_total')
+        self.assertEqual(
+            [tuple(entry[field] for field in fields) for entry in result['recipes']],
+            [
+                ('Pan', Decimal('3'), Decimal('3'), Decimal('3.00'), Decimal('75.00')),
+                # Half a batch of Pan plus its own line
+                ('Tarta', Decimal('2.5'), Decimal('1'), Decimal('2.50'), Decimal('62.50')),
+                ('Relleno', Decimal('3'), None, Decimal('3.00'), Decimal('60.00')),
+            ],
+        )
+
+    def test_shares_of_all_ingredients_add_up(self):
+        shares = {}
+        for ingredient in (self.flour, self.eggs):
+            for entry in self.where_used(ingredient)['recipes']:
+                shares[entry['name']] = shares.get(entry['name'], Decimal('0')) + entry['percentage_of_total']
+        self.assertEqual(set(shares.values()), {Decimal('100')})
+
+
+class PlanProductionTests(TestCase):
+    """Tests for the production planner's default settings."""
+
+    def test_hundreds_of_recipes_plan_well_under_a_second(self):
+        generate_dataset(ingredients=200, recipes=500, lines=4000, preparations=0.05)
+        started = time.perf_counter()
+        result = plan_production()
+        elapsed = time.perf_counter() - started
+        self.assertLess(elapsed, 0.5)
+        self.assertGreater(result['total_portions'], 0)
+        self.assertTrue(all(entry['remaining'] >= 0 for entry in result['ingredients']))
+
+    def test_solver_is_skipped_when_greedy_reaches_the_bound(self):
+        flour = Ingredient.objects.create(name='Harina', unit='kg', cost_per_unit=Decimal('1'), current_stock=Decimal('10'))
+        create_recipe('Pan', [(flour, '2')])
+        result = plan_production()
+        self.assertEqual((result['method'], result['optimal'], result['total_batches']), ('greedy', True, 5))
+
+    def test_zero_quantity_lines_dont_break_the_plan(self):
+        flour = Ingredient.objects.create(name='Harina', unit='kg', cost_per_unit=Decimal('1'), current_stock=Decimal('10'))
+        salt = Ingredient.objects.create(name='Sal', unit='kg', cost_per_unit=Decimal('1'))
+        create_recipe('Pan', [(flour, '2'), (salt, '0')])
+        water = create_recipe('Agua', [(flour, '0')])
+        client = APIClient()
+        for method in ('greedy', 'auto', 'milp'):
+            response = client.post('/api/recipes/plan_production/', {'method': method}, format='json')
+            self.assertEqual(response.status_code, 200, method)
+            plan = {entry['name']: entry['batches'] for entry in response.data['plan']}
+            self.assertEqual(plan.get('Pan'), 5, method)
+            # Nothing limits a recipe without positive requirements, so it isn't planned
+            self.assertNotIn(water.name, plan)
+
+
+class RequirementGraphTests(TestCase):
+    """Tests for the requirements rebuilt through the component graph."""
+
+    def setUp(self):
+        self.eggs = Ingredient.objects.create(
+            name='Huevo', unit='u', cost_per_unit=Decimal('0.25'), current_stock=Decimal('100')
+        )
+
+    def chain(self, depth, name='Nivel'):
+        """Recipes each using one portion of the next; returns them from the top."""
+        recipes = [create_recipe(f'{name} {level}', [], yield_portions=1) for level in range(depth)]
+        RecipeIngredient.objects.create(recipe=recipes[-1], ingredient=self.eggs, quantity=Decimal('1'))
+        for parent, component in zip(recipes, recipes[1:]):
+            RecipeComponent.objects.create(parent=parent, component=component, portions=Decimal('1'))
+        return recipes
+
+    def requirement(self, recipe):
+        return RecipeRequirement.objects.get(recipe=recipe, ingredient=self.eggs).quantity
+
+    def test_cycle_is_rejected(self):
+        top, middle, bottom = self.chain(3)
+        self.assertEqual(requirements.cycle_components(bottom.pk, [top.pk, middle.pk]), [top.pk, middle.pk])
+        self.assertEqual(requirements.cycle_components(bottom.pk, [bottom.pk]), [bottom.pk])
+        self.assertEqual(requirements.cycle_components(top.pk, [bottom.pk]), [])
+        with self.assertRaises(ValidationError):
+            RecipeComponent(parent=bottom, component=top, portions=Decimal('1')).full_clean()
+
+    def test_shared_preparation_is_evaluated_once(self):
+        stock = create_recipe('Fondo', [(self.eggs, '4')])
+        sauces = [create_recipe(name, [], yield_portions=1) for name in ('Salsa', 'Sopa')]
+        dish = create_recipe('Plato', [], yield_portions=1)
+        for sauce in sauces:
+            RecipeComponent.objects.create(parent=sauce, component=stock, portions=Decimal('2'))
+            RecipeComponent.objects.create(parent=dish, component=sauce, portions=Decimal('1'))
+
+        orders = []
+        topological_order = requirements._topological_order
+
+        def record_order(nodes, children):
+            orders.append(topological_order(nodes, children))
+            return orders[-1]
+
+        with mock.patch.object(requirements, '_topological_order', side_effect=record_order):
+            requirements.rebuild_requirements([stock.pk])
+        order, = orders
+        self.assertEqual(len(order), len(set(order)))
+        self.assertEqual(set(order), {stock.pk, dish.pk, *(sauce.pk for sauce in sauces)})
+        self.assertLess(order.index(stock.pk), min(order.index(sauce.pk) for sauce in sauces))
+        # Both paths through the shared preparation are counted
+        self.assertEqual(self.requirement(dish), 2 * self.requirement(sauces[0]))
+
+    def test_queries_dont_grow_with_depth(self):
+        counts = []
+        for depth in (3, 12):
+            recipes = self.chain(depth, name=f'Cadena {depth}')
+            with CaptureQueriesContext(connection) as queries:
+                requirements.rebuild_requirements([recipes[-1].pk])
+            counts.append(len(queries))
+            self.assertEqual(self.requirement(recipes[0]), self.requirement(recipes[-1]))
+        self.assertEqual(counts[0], counts[1])
+
+
+class BenchmarkBudgetTests(TestCase):
+    """Every endpoint answers as expected within its query budget on a small synthetic catalog."""
+
+    def test_endpoints_stay_within_budgets(self):
+        generate_dataset(ingredients=40, recipes=30, lines=200, preparations=0.1)
+        results = run_benchmarks(iterations=1, warmup=1)
+        self.assertEqual(check_results(results), [])
+
+
+class InstrumentationTests(TestCase):
+    """Tests for the request instrumentation middleware."""
+
+    def test_repeated_queries_are_reported_with_their_origin(self):
+        flour = Ingredient.objects.create(name='Harina', unit='kg', cost_per_unit=Decimal('1'), current_stock=Decimal('10'))
+        for index in range(4):
+            create_recipe(f'Pan {index}', [(flour, '1')])
+
+        def view(request):
+            return HttpResponse(', '.join(str(line) for line in RecipeIngredient.objects.all()))
+
+        with override_settings(INSTRUMENTATION_SAMPLE_RATE=1, INSTRUMENTATION_REPEATED_QUERIES=4):
+            middleware = RequestInstrumentationMiddleware(view)
+        with self.assertLogs('kitchen.instrumentation', 'WARNING') as logs:
+            response = middleware(RequestFactory().get('/'))
+
+        self.assertIn('sql;dur=', response['Server-Timing'])
+        self.assertIn('desc="9 queries"', response['Server-Timing'])
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual(record['sql_queries'], 9)
+        self.assertEqual([query['count'] for query in record['repeated_queries']], [4, 4])
+        self.assertTrue(record['repeated_queries'][0]['origin'].startswith('kitchen/models.py'))
+
+
+class ProfileSummaryTests(TestCase):
+    """Tests for the summary of collapsed-stack profiles."""
+
+    def test_recursive_functions_count_once_per_sample(self):
+        total, functions = summarize({
+            'views:list;serializers:data;models:cost;models:cost': 3,
+            'views:list;serializers:data': 1,
+            'views:list;db:execute': 2,
+        })
+        self.assertEqual(total, 6)
+        self.assertEqual(functions[0], {'function': 'views:list', 'cumulative': 6, 'own': 0})
+        self.assertIn({'function': 'models:cost', 'cumulative': 3, 'own': 3}, functions)
+        self.assertIn({'function': 'serializers:data', 'cumulative': 4, 'own': 1}, functions)
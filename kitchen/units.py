@@ -0,0 +1,57 @@
+"""Conversion between the measuring units of ingredients and recipe lines."""
+
+from decimal import ROUND_HALF_UP, Decimal
+
+
+MASS = 'mass'
+VOLUME = 'volume'
+COUNT = 'count'
+
+# Family of each unit and its size in the family's base unit (g, ml or u)
+UNITS = {
+    'g': (MASS, Decimal('1')),
+    'kg': (MASS, Decimal('1000')),
+    'ml': (VOLUME, Decimal('1')),
+    'l': (VOLUME, Decimal('1000')),
+    'cup': (VOLUME, Decimal('240')),
+    'tbsp': (VOLUME, Decimal('15')),
+    'tsp': (VOLUME, Decimal('5')),
+    'u': (COUNT, Decimal('1')),
+}
+
+# Precision of conversion factors, enough for any ratio of the sizes above
+FACTOR_PLACES = Decimal('1e-12')
+
+
+class UnitConversionError(ValueError):
+    """Raised when a quantity can't be expressed in another unit."""
+
+
+def conversion_factor(from_unit, to_unit, density=None):
+    """
+    Factor that turns a quantity in ``from_unit`` into ``to_unit``.
+
+    Units of the same family convert through the factor table. Mass and volume
+    convert only with a ``density`` in grams per millilitre.
+    """
+    from_family, from_size = UNITS[from_unit]
+    to_family, to_size = UNITS[to_unit]
+    if from_family != to_family:
+        if {from_family, to_family} != {MASS, VOLUME}:
+            raise UnitConversionError(f"Cannot convert {from_unit} to {to_unit}")
+        if not density:
+            raise UnitConversionError(f"Converting {from_unit} to {to_unit} needs the ingredient's density")
+        # Express both units in grams
+        if from_family == VOLUME:
+            from_size *= density
+        else:
+            to_size *= density
+    return (from_size / to_size).quantize(FACTOR_PLACES, rounding=ROUND_HALF_UP)
+
+
+def can_convert(from_unit, to_unit, density=None):
+    try:
+        conversion_factor(from_unit, to_unit, density)
+    except UnitConversionError:
+        return False
+    return True
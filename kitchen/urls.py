@@ -1,7 +1,7 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from .views import (
-    IngredientViewSet, RecipeViewSet, RecipeIngredientViewSet,
+    IngredientViewSet, RecipeViewSet, RecipeIngredientViewSet, CatalogViewSet,
     HomeView, RecipesView, CreateRecipeView, IngredientsView
 )
 
@@ -9,6 +9,7 @@ router = DefaultRouter()
 router.register(r'ingredients', IngredientViewSet)
 router.register(r'recipes', RecipeViewSet)
 router.register(r'recipe-ingredients', RecipeIngredientViewSet)
+router.register(r'catalog', CatalogViewSet, basename='catalog')
 
 app_name = 'kitchen'
 
@@ -1,34 +1,202 @@
-from rest_framework import viewsets, status
+import io
+from datetime import datetime, time, timedelta
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
+
+from rest_framework import serializers, viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from rest_framework.filters import OrderingFilter
 from django_filters.rest_framework import DjangoFilterBackend
-from django.db.models import Q, Avg
+from django.db.models import Q, Avg, Case, Exists, ExpressionWrapper, F, OuterRef, Subquery, Value, When
 from django.shortcuts import render
-from django.http import JsonResponse
+from django.http import JsonResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
 from django.utils.decorators import method_decorator
 from django.views.generic import TemplateView
-from .models import Ingredient, Recipe, RecipeIngredient
+from .catalog import (
+    CatalogError, check_kind_and_format, content_type_for, export_lines, import_catalog
+)
+from .conditional import ConditionalGetMixin, conditional_get
+from .filters import IndexedSearchFilter
+from .models import (
+    COST_FIELD, STOCK_PLACES, Ingredient, Recipe, RecipeIngredient, RecipeRequirement, StockMovement, Tombstone
+)
+from .pagination import MovementCursorPagination, UpdatedCursorPagination
+from .planning import PlanningError, plan_production
+from .prices import INTERVALS, PriceHistoryError, price_series, requirement_costs_at
+from .pricing import SimulationError, simulate_price_changes
 from .serializers import (
+    CostBreakdownSerializer,
     IngredientSerializer, 
     RecipeSerializer, 
     RecipeCreateUpdateSerializer,
-    RecipeIngredientSerializer,
-    RecipeIngredientDetailSerializer
+    RecipeIngredientDetailSerializer,
+    RecipeIngredientWriteSerializer,
+    StockChangeSerializer,
+    StockMovementSerializer,
+    ProduceSerializer,
+    PriceSimulationSerializer,
+    ProductionPlanSerializer,
+    ShoppingListSerializer
 )
+from .shopping import ShoppingListError, build_shopping_list
+from .stock import InsufficientStock, apply_stock_changes, produce_batches
+
+
+def parse_moment(value):
+    """Parse an ISO 8601 query parameter into an aware datetime, or ``None`` if invalid."""
+    moment = parse_datetime(value)
+    if moment is not None and timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+def parse_as_of(value):
+    """Like ``parse_moment``, but a bare date means the end of that day."""
+    day = parse_date(value)
+    if day is not None:
+        return timezone.make_aware(datetime.combine(day, time.max))
+    return parse_moment(value)
+
+
+# Stored recipe costs keep this many decimal places
+COST_PLACES = Decimal('0.0001')
+
+
+class DeltaSyncMixin:
+    """
+    Cursor pagination and delta sync for list endpoints.
+    
+    ``?updated_since=<ISO 8601 datetime>`` lists only the rows changed at or
+    after that instant and adds the ids deleted since then under
+    ``deleted``. Delta lists, as well as lists requested with
+    ``?pagination=cursor``, are cursor-paginated in ``(updated_at, id)``
+    order. Every delta response carries ``server_time``, to be sent as
+    ``updated_since`` on the next sync.
+    """
+    
+    tombstone_model = None
+    
+    def uses_cursor_pagination(self):
+        params = self.request.query_params
+        return self.action == 'list' and (
+            'updated_since' in params or 'cursor' in params or params.get('pagination') == 'cursor'
+        )
+    
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator'):
+            if self.uses_cursor_pagination():
+                self._paginator = UpdatedCursorPagination()
+            else:
+                self._paginator = super().paginator
+        return self._paginator
+    
+    def list(self, request, *args, **kwargs):
+        if 'updated_since' not in request.query_params:
+            return super().list(request, *args, **kwargs)
+        
+        since = parse_moment(request.query_params['updated_since'])
+        if since is None:
+            return Response(
+                {'error': 'updated_since must be an ISO 8601 datetime'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        server_time = timezone.now()
+        
+        queryset = self.filter_queryset(self.get_queryset()).filter(updated_at__gte=since)
+        page = self.paginate_queryset(queryset)
+        serializer = self.get_serializer(page, many=True)
+        response = self.get_paginated_response(serializer.data)
+        
+        response.data['deleted'] = list(
+            Tombstone.objects.filter(model=self.tombstone_model, deleted_at__gte=since)
+            .order_by('deleted_at')
+            .values_list('object_id', flat=True)
+        )
+        response.data['server_time'] = server_time
+        return response
 
 
-class IngredientViewSet(viewsets.ModelViewSet):
+def split_names(value):
+    """Names in a comma-separated query parameter."""
+    return [name.strip() for name in value.split(',') if name.strip()]
+
+
+class FieldSelectionMixin:
+    """
+    ``?fields=``, ``?expand=`` and ``?include=`` for ``retrieve`` and the list actions.
+    
+    ``fields`` keeps only the named fields and ``expand`` adds the
+    serializer's expandable (nested) fields, which lists leave out by default
+    and single objects include. ``include`` adds fields that are never sent
+    by default, such as computed reports. ``list_actions`` names the actions
+    answering lists like ``list``, such as filtered list routes. When the
+    selected fields are plain columns, lists are paginated as ``values()``
+    rows and serialized without building model instances.
+    """
+    
+    list_actions = ('list',)
+    
+    def get_field_selection(self):
+        """Serializer arguments selecting the fields of this request's representation."""
+        if self.action != 'retrieve' and self.action not in self.list_actions:
+            return {}
+        if not hasattr(self, '_field_selection'):
+            serializer_class = self.get_serializer_class()
+            params = self.request.query_params
+            fields = split_names(params['fields']) if 'fields' in params else None
+            include = split_names(params.get('include', ''))
+            if 'expand' in params:
+                expand = split_names(params['expand'])
+            elif self.action in self.list_actions or fields is not None:
+                expand = []
+            else:
+                expand = list(serializer_class.expandable_fields)
+            
+            available = serializer_class(include=serializer_class.included_fields).fields
+            for names, allowed, message in (
+                (fields or [], available, "Unknown fields"),
+                (expand, serializer_class.expandable_fields, "Cannot expand"),
+                (include, serializer_class.included_fields, "Cannot include"),
+            ):
+                unknown = [name for name in names if name not in allowed]
+                if unknown:
+                    raise serializers.ValidationError({'error': f"{message}: {', '.join(unknown)}"})
+            self._field_selection = {'fields': fields, 'expand': expand, 'include': include}
+        return self._field_selection
+    
+    def get_serializer(self, *args, **kwargs):
+        for key, value in self.get_field_selection().items():
+            kwargs.setdefault(key, value)
+        return super().get_serializer(*args, **kwargs)
+    
+    def get_values_lookups(self):
+        """``values()`` lookups for a list of plain columns, or ``None`` when objects are needed."""
+        if self.action != 'list' or self.paginator is None:
+            return None
+        return self.get_serializer().values_lookups()
+
+
+class IngredientViewSet(ConditionalGetMixin, DeltaSyncMixin, viewsets.ModelViewSet):
     """ViewSet for managing ingredients."""
     
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
-    filter_backends = [DjangoFilterBackend]
+    tombstone_model = 'ingredient'
+    filter_backends = [DjangoFilterBackend, IndexedSearchFilter, OrderingFilter]
     filterset_fields = ['unit']
     search_fields = ['name']
+    fulltext_search_fields = ['name']
+    ordering_fields = ['name', 'current_stock', 'cost_per_unit', 'updated_at']
     ordering = ['name']
     
+    MAX_BULK_STOCK_CHANGES = 1000
+    
     @action(detail=False, methods=['get'])
+    @conditional_get('get_list_validators')
     def low_stock(self, request):
         """Get ingredients with low stock (less than 10 units)."""
         low_stock_threshold = request.query_params.get('threshold', 10)
@@ -45,79 +213,540 @@ class IngredientViewSet(viewsets.ModelViewSet):
     
     @action(detail=True, methods=['patch'])
     def update_stock(self, request, pk=None):
-        """Update the stock of a specific ingredient."""
+        """Set (``current_stock``) or adjust (``delta``) the stock of a specific ingredient."""
         ingredient = self.get_object()
-        new_stock = request.data.get('current_stock')
+        fields = {key: request.data[key] for key in ('current_stock', 'delta') if key in request.data}
+        movement = {key: request.data[key] for key in ('kind', 'note') if key in request.data}
         
-        if new_stock is None:
+        if not fields:
             return Response(
                 {'error': 'current_stock field is required'}, 
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        try:
-            from decimal import Decimal, InvalidOperation
-            ingredient.current_stock = Decimal(str(new_stock))
-            ingredient.save()
-            serializer = self.get_serializer(ingredient)
-            return Response(serializer.data)
-        except (ValueError, InvalidOperation, TypeError):
+        change = StockChangeSerializer(data={'id': ingredient.pk, **fields, **movement})
+        if not change.is_valid():
+            errors = change.errors.get('non_field_errors') or change.errors.get('kind')
+            return Response(
+                {'error': str(errors[0]) if errors else 'Invalid stock value'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        errors = apply_stock_changes([change.validated_data])
+        if errors:
             return Response(
-                {'error': 'Invalid stock value'}, 
+                {'error': errors[0]['error']}, 
                 status=status.HTTP_400_BAD_REQUEST
             )
+        
+        ingredient.refresh_from_db()
+        serializer = self.get_serializer(ingredient)
+        return Response(serializer.data)
+    
+    @action(detail=False, methods=['post'])
+    def bulk_update_stock(self, request):
+        """
+        Update the stock of many ingredients in a single transaction.
+        
+        Accepts a list (or ``{"changes": [...]}``) of ``{"id", "current_stock"}``
+        or ``{"id", "delta"}`` items, optionally with the movement ``kind`` and
+        ``note``. All changes are validated together and either every change
+        is applied or none is, with errors reported per item.
+        """
+        items = request.data.get('changes') if isinstance(request.data, dict) else request.data
+        if not isinstance(items, list) or not items:
+            return Response(
+                {'error': 'A non-empty list of changes is required'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if len(items) > self.MAX_BULK_STOCK_CHANGES:
+            return Response(
+                {'error': f'At most {self.MAX_BULK_STOCK_CHANGES} changes are allowed per request'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        changes = []
+        errors = []
+        for index, item in enumerate(items):
+            change = StockChangeSerializer(data=item)
+            if change.is_valid():
+                changes.append(change.validated_data)
+            else:
+                errors.append({
+                    'index': index,
+                    'id': item.get('id') if isinstance(item, dict) else None,
+                    'error': change.errors,
+                })
+        
+        if not errors:
+            errors = apply_stock_changes(changes)
+        if errors:
+            return Response({'errors': errors}, status=status.HTTP_400_BAD_REQUEST)
+        
+        ingredients = self.get_queryset().filter(pk__in=[change['id'] for change in changes])
+        serializer = self.get_serializer(ingredients, many=True)
+        return Response({'updated': serializer.data})
+    
+    @action(detail=True, methods=['get'])
+    def movements(self, request, pk=None):
+        """
+        Stock ledger of an ingredient, newest first.
+        
+        Supports ``?since=`` and ``?until=`` (ISO 8601) and ``?kind=``. Pages
+        are read through the ``(ingredient, created_at)`` index with a cursor,
+        so deep pages of long histories cost the same as the first one.
+        """
+        ingredient = self.get_object()
+        queryset = StockMovement.objects.filter(ingredient=ingredient)
+        
+        for param, lookup in (('since', 'created_at__gte'), ('until', 'created_at__lte')):
+            if param in request.query_params:
+                moment = parse_moment(request.query_params[param])
+                if moment is None:
+                    return Response(
+                        {'error': f'{param} must be an ISO 8601 datetime'}, 
+                        status=status.HTTP_400_BAD_REQUEST
+                    )
+                queryset = queryset.filter(**{lookup: moment})
+        kind = request.query_params.get('kind')
+        if kind:
+            if kind not in dict(StockMovement.KIND_CHOICES):
+                return Response(
+                    {'error': f"Invalid kind. Choose one of: {', '.join(dict(StockMovement.KIND_CHOICES))}"}, 
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            queryset = queryset.filter(kind=kind)
+        
+        paginator = MovementCursorPagination()
+        page = paginator.paginate_queryset(queryset, request, view=self)
+        serializer = StockMovementSerializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
+    
+    @action(detail=True, methods=['get'])
+    def where_used(self, request, pk=None):
+        """
+        Every recipe that uses an ingredient, with its share of the recipe's cost.
+        
+        Recipes using it through a preparation are included: ``quantity`` is
+        the total per batch and ``direct_quantity`` the part on the recipe's
+        own lines (``null`` when it only comes from preparations). Answered by
+        one query over the ``(ingredient, recipe)`` indexes of the flattened
+        requirements and the recipe lines, ordered by share of cost.
+        """
+        ingredient = self.get_object()
+        line_cost = ExpressionWrapper(F('quantity') * Value(ingredient.cost_per_unit), output_field=COST_FIELD)
+        direct_quantity = RecipeIngredient.objects.filter(
+            ingredient=ingredient, recipe=OuterRef('recipe')
+        ).values('base_quantity')[:1]
+        uses = RecipeRequirement.objects.filter(ingredient=ingredient).annotate(
+            line_cost=line_cost,
+            direct_quantity=Subquery(direct_quantity),
+            percentage=Case(
+                When(recipe__batch_cost=0, then=Value(None)),
+                default=line_cost * 100 / F('recipe__batch_cost'),
+                output_field=COST_FIELD
+            ),
+        ).order_by(F('percentage').desc(nulls_last=True), 'recipe__name').values_list(
+            'recipe_id', 'recipe__name', 'recipe__yield_portions', 'recipe__batch_cost',
+            'quantity', 'direct_quantity', 'line_cost', 'percentage'
+        )
+        
+        recipes = [
+            {
+                'id': recipe_id,
+                'name': name,
+                'yield_portions': yield_portions,
+                'batch_cost': batch_cost,
+                'quantity': quantity,
+                'direct_quantity': direct,
+                'line_cost': cost.quantize(COST_PLACES, rounding=ROUND_HALF_UP),
+                'percentage_of_total': None if percentage is None else percentage.quantize(
+                    Decimal('0.01'), rounding=ROUND_HALF_UP
+                ),
+            }
+            for recipe_id, name, yield_portions, batch_cost, quantity, direct, cost, percentage in uses
+        ]
+        
+        return Response({
+            'ingredient': ingredient.id,
+            'name': ingredient.name,
+            'unit': ingredient.unit,
+            'cost_per_unit': ingredient.cost_per_unit,
+            'recipe_count': len(recipes),
+            'recipes': recipes,
+        })
+    
+    @action(detail=True, methods=['get'])
+    def price_history(self, request, pk=None):
+        """
+        Price series of an ingredient.
+        
+        ``?interval=`` is ``raw`` (every change), ``day`` (default) or
+        ``week``; day and week points are open/high/low/close roll-ups.
+        ``?since=`` and ``?until=`` (ISO 8601) default to the last 90 days,
+        or 52 weeks for weekly series. Served by indexed range queries over
+        the price history and its precomputed roll-ups.
+        """
+        ingredient = self.get_object()
+        interval = request.query_params.get('interval', 'day')
+        if interval not in INTERVALS:
+            return Response(
+                {'error': f"interval must be one of: {', '.join(INTERVALS)}"}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        bounds = {}
+        for param in ('since', 'until'):
+            if param in request.query_params:
+                bounds[param] = parse_moment(request.query_params[param])
+                if bounds[param] is None:
+                    return Response(
+                        {'error': f'{param} must be an ISO 8601 datetime'}, 
+                        status=status.HTTP_400_BAD_REQUEST
+                    )
+        until = bounds.get('until') or timezone.now()
+        default_span = timedelta(weeks=52) if interval == 'week' else timedelta(days=90)
+        since = bounds.get('since') or until - default_span
+        
+        try:
+            points = price_series(ingredient.id, interval, since, until)
+        except PriceHistoryError as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        return Response({
+            'ingredient': ingredient.id,
+            'name': ingredient.name,
+            'unit': ingredient.unit,
+            'interval': interval,
+            'since': since,
+            'until': until,
+            'cost_per_unit': ingredient.cost_per_unit,
+            'points': points,
+        })
+    
+    @action(detail=False, methods=['get'])
+    def stock_valuation(self, request):
+        """
+        Stock and stock value of every ingredient, now or at ``?at=`` (ISO 8601).
+        
+        Past balances start from the latest stock snapshot before that moment
+        and add the movements recorded after it, and are valued at the price
+        in effect at that moment, in one query. Without ``?at=`` values use
+        the current ``cost_per_unit``. Accepts the list filters and
+        ``?search=``.
+        """
+        queryset = self.filter_queryset(self.get_queryset())
+        at = None
+        if 'at' in request.query_params:
+            at = parse_moment(request.query_params['at'])
+            if at is None:
+                return Response(
+                    {'error': 'at must be an ISO 8601 datetime'}, 
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            queryset = queryset.with_stock_at(at).with_price_at(at)
+        
+        rows = []
+        total_value = Decimal('0')
+        for ingredient in queryset:
+            stock = (ingredient.stock_at if at is not None else ingredient.current_stock).quantize(STOCK_PLACES)
+            cost = ingredient.price_at if at is not None else ingredient.cost_per_unit
+            # No price yet at that moment means the ingredient didn't exist, so nothing was in stock
+            value = (stock * (cost or 0)).quantize(STOCK_PLACES, rounding=ROUND_HALF_UP)
+            total_value += value
+            rows.append({
+                'id': ingredient.id,
+                'name': ingredient.name,
+                'unit': ingredient.unit,
+                'stock': stock,
+                'cost_per_unit': cost,
+                'value': value,
+            })
+        
+        return Response({
+            'at': at or timezone.now(),
+            'total_value': total_value,
+            'ingredients': rows,
+        })
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(ConditionalGetMixin, DeltaSyncMixin, FieldSelectionMixin, viewsets.ModelViewSet):
     """ViewSet for managing recipes."""
     
-    queryset = Recipe.objects.prefetch_related('recipeingredient_set__ingredient').all()
-    filter_backends = [DjangoFilterBackend]
+    queryset = Recipe.objects.with_producible().prefetch_related(
+        'recipeingredient_set__ingredient', 'components__component'
+    ).order_by('name')
+    tombstone_model = 'recipe'
+    # Stock and prices of the ingredients, preparations included, and the
+    # preparations' costs show up in every recipe representation
+    conditional_object_dependencies = [
+        'requirements__ingredient__updated_at', 'components__component__updated_at'
+    ]
+    conditional_list_dependencies = [Ingredient]
+    filter_backends = [DjangoFilterBackend, IndexedSearchFilter, OrderingFilter]
+    filterset_fields = {
+        'cost_per_portion': ['lt', 'lte', 'gt', 'gte'],
+    }
     search_fields = ['name', 'description']
+    fulltext_search_fields = ['name', 'description']
+    ordering_fields = ['id', 'name', 'yield_portions', 'batch_cost', 'cost_per_portion', 'updated_at']
     ordering = ['name']
     
+    # Prefetches needed by each nested or computed field
+    FIELD_PREFETCHES = {
+        'ingredients': ['recipeingredient_set__ingredient'],
+        'components': ['components__component'],
+        'cost_breakdown': ['recipeingredient_set__ingredient', 'components__component'],
+    }
+    
+    MAX_BATCH_IDS = 100
+    
+    list_actions = ('list', 'producible')
+    
+    def get_queryset(self):
+        if self.action in ['update', 'partial_update', 'destroy', 'produce', 'cost_as_of']:
+            # Writes don't need the stock annotations or the prefetched lines
+            return Recipe.objects.all()
+        if self.action in ['list', 'retrieve', 'producible']:
+            if self.get_values_lookups() is not None:
+                # Plain rows; producible portions are added for the page only
+                return Recipe.objects.order_by('name')
+            selection = self.get_field_selection()
+            selected = set(selection['fields'] or ()) | set(selection['expand']) | set(selection['include'])
+            lookups = {lookup for field in selected for lookup in self.FIELD_PREFETCHES.get(field, ())}
+            return Recipe.objects.with_producible().prefetch_related(*sorted(lookups)).order_by('name')
+        return super().get_queryset()
+    
+    @property
+    def paginator(self):
+        # Batch retrieves (``?ids=``) answer every requested recipe at once
+        params = self.request.query_params
+        if self.action == 'list' and 'ids' in params and 'updated_since' not in params:
+            return None
+        return super().paginator
+    
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if self.action == 'list' and 'ids' in self.request.query_params:
+            try:
+                ids = {int(pk) for pk in split_names(self.request.query_params['ids'])}
+            except ValueError:
+                raise serializers.ValidationError({'error': 'ids must be a comma-separated list of integers'})
+            if not ids or len(ids) > self.MAX_BATCH_IDS:
+                raise serializers.ValidationError({'error': f'ids must list between 1 and {self.MAX_BATCH_IDS} recipes'})
+            queryset = queryset.filter(pk__in=ids)
+        return queryset
+    
+    def paginate_queryset(self, queryset):
+        lookups = self.get_values_lookups()
+        if lookups is None:
+            return super().paginate_queryset(queryset)
+        
+        values = {*lookups.values(), 'id', 'updated_at'}
+        producible = 'computed_producible_portions' in values
+        page = super().paginate_queryset(queryset.values(*(values - {'computed_producible_portions'})))
+        if producible and page:
+            # The stock aggregate only runs for the recipes on the page
+            portions = dict(
+                Recipe.objects.filter(pk__in=[row['id'] for row in page]).with_producible()
+                .values_list('pk', 'computed_producible_portions')
+            )
+            for row in page:
+                row['computed_producible_portions'] = portions[row['id']]
+        return page
+    
     def get_serializer_class(self):
         if self.action in ['create', 'update', 'partial_update']:
             return RecipeCreateUpdateSerializer
         return RecipeSerializer
     
+    # Orderings accepted by the producible action, mapped to annotations
+    PRODUCIBLE_ORDERINGS = {
+        'producible_portions': 'computed_producible_portions',
+        '-producible_portions': '-computed_producible_portions',
+        'name': 'name',
+        '-name': '-name',
+    }
+    
     @action(detail=False, methods=['get'])
+    @conditional_get('get_list_validators')
     def producible(self, request):
-        """Get recipes that can be produced with current stock."""
-        producible_recipes = []
+        """
+        Get recipes that can be produced with current stock.
+        
+        Supports ``?min_portions=N`` (default 1) and ``?ordering=`` by
+        ``producible_portions`` or ``name``. Filtering and ordering run in the
+        database and the result is paginated. Like the list, it accepts
+        ``?fields=``, ``?expand=`` and ``?include=``.
+        """
+        try:
+            min_portions = int(request.query_params.get('min_portions', 1))
+            if min_portions < 1:
+                raise ValueError
+        except (TypeError, ValueError):
+            return Response(
+                {'error': 'min_portions must be a positive integer'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        ordering = request.query_params.get('ordering', '-producible_portions')
+        if ordering not in self.PRODUCIBLE_ORDERINGS:
+            return Response(
+                {'error': f"Invalid ordering. Choose one of: {', '.join(self.PRODUCIBLE_ORDERINGS)}"}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        queryset = self.filter_queryset(self.get_queryset()).filter(
+            computed_producible_portions__gte=min_portions
+        ).order_by(self.PRODUCIBLE_ORDERINGS[ordering], 'id')
         
-        for recipe in self.queryset:
-            if recipe.producible_portions > 0:
-                producible_recipes.append(recipe)
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(serializer.data)
         
-        serializer = self.get_serializer(producible_recipes, many=True)
+        serializer = self.get_serializer(queryset, many=True)
         return Response(serializer.data)
     
+    @action(detail=False, methods=['post'])
+    def price_simulation(self, request):
+        """
+        Simulate ingredient price changes and rank the affected recipes.
+        
+        Accepts ``changes`` (``{"id", "cost_per_unit"}`` or ``{"id", "percent"}``
+        items), ``unit_shifts`` (``{"kg": 10}``) and ``limit``. Nothing is saved.
+        """
+        serializer = PriceSimulationSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            result = simulate_price_changes(**serializer.validated_data)
+        except SimulationError as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(result)
+    
+    @action(detail=False, methods=['post'])
+    def plan_production(self, request):
+        """
+        Plan how many batches of each recipe to produce from the current stock.
+        
+        Accepts ``recipes`` (``{"id", "weight", "demand_portions"}`` items, all
+        recipes when omitted), ``method`` (auto, milp or greedy) and
+        ``time_limit`` in seconds. Returns the plan and the ingredients that
+        limit it. Nothing is consumed; use ``produce`` to carry it out.
+        """
+        serializer = ProductionPlanSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        try:
+            result = plan_production(data['recipes'], method=data['method'], time_limit=data['time_limit'])
+        except PlanningError as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(result)
+    
+    @action(detail=False, methods=['post'])
+    def shopping_list(self, request):
+        """
+        Consolidated ingredient needs for many recipes at once.
+        
+        Accepts ``items``, a list of ``{"recipe_id", "scale_factor"}`` or
+        ``{"recipe_id", "target_portions"}``. Returns the total quantity of each
+        ingredient, the shortfall against current stock, what to buy and costs.
+        """
+        serializer = ShoppingListSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            result = build_shopping_list(serializer.validated_data['items'])
+        except ShoppingListError as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(result)
+    
     @action(detail=True, methods=['get'])
+    @conditional_get('get_object_validators')
     def cost_breakdown(self, request, pk=None):
         """Get detailed cost breakdown for a recipe."""
+        return Response(CostBreakdownSerializer(self.get_object().cost_breakdown()).data)
+    
+    @action(detail=True, methods=['get'])
+    def cost_as_of(self, request, pk=None):
+        """
+        Cost of a recipe at the ingredient prices in effect at ``?at=``.
+        
+        ``at`` is an ISO 8601 datetime, or a date meaning the end of that
+        day. Uses the recipe's current composition, preparations included;
+        each ingredient's price comes from one indexed lookup in the price
+        history, all in a single query.
+        """
         recipe = self.get_object()
-        ingredients = recipe.recipeingredient_set.all()
+        at = parse_as_of(request.query_params.get('at', ''))
+        if at is None:
+            return Response(
+                {'error': 'at must be an ISO 8601 date or datetime'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        rows = []
+        missing_prices = []
+        batch_cost = Decimal('0')
+        for ingredient_id, name, unit, quantity, price in requirement_costs_at(recipe, at):
+            total_cost = None
+            if price is None:
+                missing_prices.append(ingredient_id)
+            else:
+                total_cost = (quantity * price).quantize(COST_PLACES, rounding=ROUND_HALF_UP)
+                batch_cost += total_cost
+            rows.append({
+                'id': ingredient_id,
+                'name': name,
+                'unit': unit,
+                'quantity': quantity,
+                'cost_per_unit': price,
+                'total_cost': total_cost,
+            })
         
-        breakdown = {
+        return Response({
+            'recipe': recipe.id,
             'recipe_name': recipe.name,
+            'at': at,
             'yield_portions': recipe.yield_portions,
-            'batch_cost': recipe.batch_cost,
-            'cost_per_portion': recipe.cost_per_portion,
-            'ingredients': []
-        }
+            'batch_cost': batch_cost,
+            'cost_per_portion': (
+                (batch_cost / recipe.yield_portions).quantize(COST_PLACES, rounding=ROUND_HALF_UP)
+                if recipe.yield_portions else None
+            ),
+            'current_batch_cost': recipe.batch_cost,
+            'ingredients': rows,
+            'missing_prices': missing_prices,
+        })
+    
+    @action(detail=True, methods=['post'])
+    def produce(self, request, pk=None):
+        """
+        Produce ``batches`` batches of a recipe, consuming ingredient stock.
         
-        for ingredient in ingredients:
-            breakdown['ingredients'].append({
-                'name': ingredient.ingredient.name,
-                'quantity': ingredient.quantity,
-                'unit': ingredient.ingredient.get_unit_display(),
-                'cost_per_unit': ingredient.ingredient.cost_per_unit,
-                'total_cost': ingredient.total_cost,
-                'percentage_of_total': (ingredient.total_cost / recipe.batch_cost * 100) if recipe.batch_cost > 0 else 0
-            })
+        Responds with 409 and the ingredients that fall short when there is
+        not enough stock, or 400 when some of them no longer exist; in both
+        cases no stock is consumed.
+        """
+        recipe = self.get_object()
+        serializer = ProduceSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        batches = serializer.validated_data['batches']
         
-        return Response(breakdown)
+        try:
+            consumed = produce_batches(recipe, batches)
+        except InsufficientStock as exc:
+            return Response(
+                {'error': 'Insufficient stock', 'shortages': exc.shortages}, 
+                status=status.HTTP_400_BAD_REQUEST if exc.missing else status.HTTP_409_CONFLICT
+            )
+        
+        return Response({
+            'recipe': recipe.id,
+            'recipe_name': recipe.name,
+            'batches': batches,
+            'portions_produced': batches * recipe.yield_portions,
+            'ingredients': consumed
+        })
     
     @action(detail=True, methods=['post'])
     def scale_recipe(self, request, pk=None):
@@ -132,51 +761,114 @@ class RecipeViewSet(viewsets.ModelViewSet):
             )
         
         try:
-            scale_factor = float(scale_factor)
-            if scale_factor <= 0:
+            scale_factor = Decimal(str(scale_factor))
+            if not scale_factor.is_finite() or scale_factor <= 0:
                 raise ValueError("Scale factor must be positive")
-                
-            scaled_ingredients = []
-            for ingredient in recipe.recipeingredient_set.all():
-                scaled_ingredients.append({
-                    'name': ingredient.ingredient.name,
-                    'original_quantity': ingredient.quantity,
-                    'scaled_quantity': ingredient.quantity * scale_factor,
-                    'unit': ingredient.ingredient.get_unit_display(),
-                    'cost_per_unit': ingredient.ingredient.cost_per_unit,
-                    'scaled_cost': ingredient.quantity * scale_factor * ingredient.ingredient.cost_per_unit
-                })
-            
-            scaled_data = {
-                'recipe_name': recipe.name,
-                'original_yield': recipe.yield_portions,
-                'scaled_yield': int(recipe.yield_portions * scale_factor),
-                'scale_factor': scale_factor,
-                'original_batch_cost': recipe.batch_cost,
-                'scaled_batch_cost': recipe.batch_cost * scale_factor,
-                'scaled_ingredients': scaled_ingredients
-            }
-            
-            return Response(scaled_data)
-            
-        except ValueError as e:
+        except (InvalidOperation, ValueError) as e:
+            message = str(e) if isinstance(e, ValueError) else "scale_factor must be a number"
             return Response(
-                {'error': str(e)}, 
+                {'error': message}, 
                 status=status.HTTP_400_BAD_REQUEST
             )
+        
+        scaled_ingredients = []
+        for ingredient in recipe.recipeingredient_set.all():
+            scaled_quantity = ingredient.quantity * scale_factor
+            scaled_ingredients.append({
+                'name': ingredient.ingredient.name,
+                'original_quantity': ingredient.quantity,
+                'scaled_quantity': scaled_quantity,
+                'unit': ingredient.get_unit_display(),
+                'cost_per_unit': ingredient.ingredient.cost_per_unit,
+                'scaled_cost': ingredient.base_quantity * scale_factor * ingredient.ingredient.cost_per_unit
+            })
+        
+        scaled_components = [
+            {
+                'name': component.component.name,
+                'original_portions': component.portions,
+                'scaled_portions': component.portions * scale_factor,
+                'scaled_cost': component.total_cost * scale_factor
+            }
+            for component in recipe.components.all()
+        ]
+        
+        scaled_data = {
+            'recipe_name': recipe.name,
+            'original_yield': recipe.yield_portions,
+            'scaled_yield': int(recipe.yield_portions * scale_factor),
+            'scale_factor': scale_factor,
+            'original_batch_cost': recipe.batch_cost,
+            'scaled_batch_cost': recipe.batch_cost * scale_factor,
+            'scaled_ingredients': scaled_ingredients,
+            'scaled_components': scaled_components
+        }
+        
+        return Response(scaled_data)
 
 
 class RecipeIngredientViewSet(viewsets.ModelViewSet):
     """ViewSet for managing recipe ingredients."""
     
-    queryset = RecipeIngredient.objects.select_related('recipe', 'ingredient').all()
+    queryset = RecipeIngredient.objects.select_related('recipe', 'ingredient').order_by('pk')
     filter_backends = [DjangoFilterBackend]
     filterset_fields = ['recipe', 'ingredient']
     
     def get_serializer_class(self):
         if self.action in ['list', 'retrieve']:
             return RecipeIngredientDetailSerializer
-        return RecipeIngredientSerializer
+        return RecipeIngredientWriteSerializer
+
+
+class CatalogViewSet(viewsets.ViewSet):
+    """Bulk import and streaming export of the ingredient and recipe catalog."""
+    
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        """
+        Stream a catalog kind as CSV or JSON Lines.
+        
+        Query parameters: ``kind`` (ingredients, recipes or recipe_ingredients)
+        and ``fmt`` (csv or jsonl, default csv).
+        """
+        kind = request.query_params.get('kind', 'ingredients')
+        fmt = request.query_params.get('fmt', 'csv')
+        try:
+            check_kind_and_format(kind, fmt)
+        except CatalogError as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        response = StreamingHttpResponse(export_lines(kind, fmt), content_type=content_type_for(fmt))
+        response['Content-Disposition'] = f'attachment; filename="{kind}.{fmt}"'
+        return response
+    
+    @action(detail=False, methods=['post'], url_path='import')
+    def import_catalog(self, request):
+        """
+        Import an uploaded CSV or JSON Lines ``file`` of a catalog kind.
+        
+        Query parameters: ``kind``, ``fmt`` (defaults to the file extension)
+        and ``dry_run`` to validate and count without saving.
+        """
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response({'error': 'file field is required'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        kind = request.query_params.get('kind', 'ingredients')
+        default_fmt = 'jsonl' if upload.name.endswith(('.jsonl', '.ndjson')) else 'csv'
+        fmt = request.query_params.get('fmt', default_fmt)
+        dry_run = request.query_params.get('dry_run', '').lower() in ('1', 'true', 'yes')
+        try:
+            check_kind_and_format(kind, fmt)
+        except CatalogError as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        lines = io.TextIOWrapper(upload.file, encoding='utf-8-sig', newline='')
+        try:
+            result = import_catalog(kind, lines, fmt, dry_run=dry_run)
+        except UnicodeDecodeError:
+            return Response({'error': 'The file must be UTF-8 encoded'}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(result)
 
 
 # HTML Views for Frontend
@@ -191,17 +883,10 @@ class HomeView(TemplateView):
         total_recipes = Recipe.objects.count()
         total_ingredients = Ingredient.objects.count()
         
-        # Calculate average cost using proper database fields
-        recipes_with_costs = Recipe.objects.prefetch_related('recipeingredient_set__ingredient')
-        total_cost = 0
-        recipe_count = 0
-        
-        for recipe in recipes_with_costs:
-            if recipe.recipeingredient_set.exists():
-                total_cost += float(recipe.batch_cost)
-                recipe_count += 1
-        
-        avg_cost = total_cost / recipe_count if recipe_count > 0 else 0
+        # Average stored batch cost of the recipes that have ingredients
+        avg_cost = Recipe.objects.filter(
+            Exists(RecipeRequirement.objects.filter(recipe=OuterRef('pk')))
+        ).aggregate(avg_cost=Avg('batch_cost'))['avg_cost'] or 0
         
         context.update({
             'total_recipes': total_recipes,
@@ -48,6 +48,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'kitchen.instrumentation.RequestInstrumentationMiddleware',
+    'kitchen.profiling.RequestProfilingMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -58,6 +60,14 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Request instrumentation: fraction of requests measured (0 disables it) and
+# how many executions of the same query shape in one request count as N+1
+INSTRUMENTATION_SAMPLE_RATE = float(os.getenv('INSTRUMENTATION_SAMPLE_RATE', '0'))
+INSTRUMENTATION_REPEATED_QUERIES = int(os.getenv('INSTRUMENTATION_REPEATED_QUERIES', '5'))
+
+# Request profiling, switched at runtime with `manage.py profiling`; empty disables it
+PROFILING_DIR = os.getenv('PROFILING_DIR', os.path.join(BASE_DIR, 'profiles'))
+
 ROOT_URLCONF = 'kitchen_management.urls'
 
 TEMPLATES = [
@@ -186,3 +196,21 @@ CSRF_TRUSTED_ORIGINS = [
 custom_origins = os.getenv('CSRF_TRUSTED_ORIGINS', '')
 if custom_origins:
     CSRF_TRUSTED_ORIGINS.extend(custom_origins.split(','))
+
+# Logging
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'kitchen.instrumentation': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+    },
+}